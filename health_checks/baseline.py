@@ -0,0 +1,109 @@
+"""Per-spot occupancy baseline of the same day type.
+
+For weekdays and weekends separately, daily_baseline takes the count, mean
+and standard deviation of the daily occupied minutes of every spot over the
+last `weeks` ISO weeks before the analysed day. The daily totals come from
+the rollups kept on disk (rollups.daily_frame), so the window is a few dozen
+rows and is recomputed in one reduction on every run instead of being kept
+up to date incrementally. The store keeps the whole window
+(rollups.ROLLUP_RETENTION_DAYS follows BASELINE_WEEKS) and the hourly bot
+reads all of it, so the baseline can be longer than the 30 days of raw rows.
+
+hourly_baseline adds the hour of day: mean and standard deviation of the
+occupied minutes of every spot in every hour, per day type, taken in one
+reduction over the hourly rollups, so a spot that reads occupied all night
+and free at peak time stands out even when its daily total looks normal.
+"""
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+
+# ISO weeks of history compared against, the analysed day's week included;
+# the rollup store keeps this many weeks, raising it only needs time to fill
+BASELINE_WEEKS = 3
+
+# Statistics of one day type, in occupied minutes per spot
+Baseline = namedtuple('Baseline', ['count', 'mean', 'std', 'dates'])
+
+# Statistics per day type, hour of day and spot: arrays of shape (2, 24, spots)
+HourlyBaseline = namedtuple('HourlyBaseline', ['count', 'mean', 'std'])
+
+WEEKDAY, WEEKEND = 0, 1
+# Smallest standard deviation used for hourly z-scores, in minutes; hours that
+# were always empty would otherwise turn any occupation into an infinite score
+MIN_HOURLY_STD = 1.0
+
+
+def day_type(day):
+    return WEEKEND if day.weekday() >= 5 else WEEKDAY
+
+
+def window_start(target, weeks=BASELINE_WEEKS):
+    """First day of the window for `target`: Monday of the week of the day
+    before it, `weeks` - 1 weeks back. The window ends the day before `target`."""
+    last = target - timedelta(days=1)
+    return last - timedelta(days=last.weekday(), weeks=weeks - 1)
+
+
+def daily_baseline(daily, target, weeks=BASELINE_WEEKS):
+    """{WEEKDAY: Baseline, WEEKEND: Baseline} of the window before `target`.
+
+    daily: occupied minutes per spot indexed by date (rollups.daily_frame)
+    """
+    start = window_start(target, weeks)
+    window = daily[(daily.index >= start) & (daily.index < target)]
+    minutes = window.to_numpy(dtype=np.float64)
+    types = np.array([day_type(day) for day in window.index], dtype=np.int64)
+
+    spots = daily.shape[1]
+    baselines = {}
+    for kind in (WEEKDAY, WEEKEND):
+        same_type = minutes[types == kind]
+        count = len(same_type)
+        mean = same_type.mean(axis=0) if count else np.zeros(spots)
+        std = same_type.std(axis=0, ddof=1) if count > 1 else np.full(spots, np.nan)
+        baselines[kind] = Baseline(count, mean, std, list(window.index[types == kind]))
+    return baselines
+
+
+def hourly_cube(rollups, first_day, days):
+    """(days, 24, spots) occupied minutes from `first_day` on, zero where there is no rollup"""
+    day_of_row = rollups.hours.astype('datetime64[D]')
+    day_index = (day_of_row - np.datetime64(first_day, 'D')).astype(np.int64)
+    hour = (rollups.hours - day_of_row.astype('datetime64[h]')).astype(np.int64)
+    keep = (day_index >= 0) & (day_index < days)
+    cube = np.zeros((days, 24, rollups.minutes.shape[1]))
+    np.add.at(cube, (day_index[keep], hour[keep]), rollups.minutes[keep])
+    return cube
+
+
+def hourly_baseline(rollups, target, weeks=BASELINE_WEEKS):
+    """Per day type, hour and spot statistics over the same window as daily_baseline"""
+    start = window_start(target, weeks)
+    cube = hourly_cube(rollups, start, (target - start).days)
+    days = [start + timedelta(days=i) for i in range(len(cube))]
+    # Days without any reading are not part of the baseline
+    observed = np.isin(np.array(days, dtype='datetime64[D]'), rollups.hours.astype('datetime64[D]'))
+    types = np.array([day_type(day) for day in days])
+
+    spots = cube.shape[2]
+    count = np.zeros(2, dtype=np.int64)
+    mean = np.zeros((2, 24, spots))
+    std = np.full((2, 24, spots), np.nan)
+    for kind in (WEEKDAY, WEEKEND):
+        same_type = cube[observed & (types == kind)]
+        count[kind] = len(same_type)
+        if len(same_type):
+            mean[kind] = same_type.mean(axis=0)
+        if len(same_type) > 1:
+            std[kind] = same_type.std(axis=0, ddof=1)
+    return HourlyBaseline(count, mean, std)
+
+
+def score_hours(rollups, day, baseline):
+    """(24, spots) z-scores of the occupied minutes of `day` against its day type"""
+    kind = day_type(day)
+    minutes = hourly_cube(rollups, day, 1)[0]
+    std = np.maximum(np.nan_to_num(baseline.std[kind], nan=0.0), MIN_HOURLY_STD)
+    return (minutes - baseline.mean[kind]) / std
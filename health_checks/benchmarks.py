@@ -0,0 +1,930 @@
+#!/usr/bin/python3
+"""Offline benchmarks for the health check bots.
+
+Run with `python benchmarks.py` from the venv. Every benchmark works on
+synthetic data shaped like the ic2_parking_twin bucket (one row per minute),
+so no InfluxDB or Telegram access is needed. They only report timings; the
+results are checked by the tests in tests/.
+"""
+import io
+import json
+import multiprocessing
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
+import pandas as pd
+from influxdb_client.client.flux_csv_parser import FluxCsvParser, FluxSerializationMode
+
+from baseline import daily_baseline, day_type, hourly_baseline, score_hours, window_start
+from calendar_features import row_calendar_features
+from fleet import next_poll_delay, stale_devices
+from freshness_probe import parse_last_row, parse_last_rows
+from image_export import export_figure
+from influx_stream import stream_rows
+from lot_runner import MAX_INFLUX_QUERIES, run_lots
+from lots import DEFAULT_LOT, DEFAULT_LOTS
+from outages import find_outages
+from preprocess import preprocess_subset
+from query_cache import QueryCache
+from rollups import DAY_NS, MINUTE_NS, hourly_rollup, reading_durations, update_rollups
+from sensor_health import sensor_alerts, sensor_health
+from telegram_notifier import TelegramNotifier
+from spots import car_counts, decode_spots, expand_to_spots, pack_occupancy, spot_columns, spot_sums
+
+BIT_LENGTH = 16
+ROWS_PER_DAY = 24 * 60
+
+
+def synthetic_values(days, bit_length=BIT_LENGTH, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 2 ** bit_length, size=days * ROWS_PER_DAY, dtype=np.int64)
+
+
+# Device ids seen in ic2_parking_twin; the last two are in the bots' exclude_ids
+DEVICE_IDS = ['tvbox-btv-01', 'tvbox-btv-02', 'tvbox-tx2-07', 'tvbox-e10-01']
+EXCLUDE_IDS = ['tvbox-tx2-07', 'tvbox-e10-01']
+
+# Annotated CSV column types, as InfluxDB sends them for ic2_parking_twin
+CSV_DATATYPES = {
+    'result': 'string', 'table': 'long',
+    '_start': 'dateTime:RFC3339', '_stop': 'dateTime:RFC3339',
+    '_time': 'dateTime:RFC3339', '_value': 'long',
+    '_field': 'string', '_measurement': 'string', 'pi-id': 'string',
+}
+BARE_COLUMNS = list(CSV_DATATYPES)[1:]
+KEPT_COLUMNS = ['table', '_time', '_value', 'pi-id']
+
+
+def annotated_csv_lines(days, columns=BARE_COLUMNS, device_ids=DEVICE_IDS, seed=0):
+    """Yield the annotated CSV InfluxDB returns for `days` of per-minute rows, one table per device"""
+    end = pd.Timestamp('2025-06-01', tz='UTC')
+    times = pd.date_range(end - pd.Timedelta(days=days), end, freq='min', inclusive='left')
+    time_str = times.strftime('%Y-%m-%dT%H:%M:%SZ')
+    start_str = times[0].strftime('%Y-%m-%dT%H:%M:%SZ')
+    stop_str = end.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    for table, device in enumerate(device_ids):
+        values = synthetic_values(days, seed=seed + table)
+        yield '#datatype,string,' + ','.join(CSV_DATATYPES[c] for c in columns) + '\n'
+        yield '#group,false,' + ','.join('true' if c in ('_start', '_stop', '_field', '_measurement', 'pi-id') else 'false'
+                                        for c in columns) + '\n'
+        yield '#default,_result,' + ','.join('' for _ in columns) + '\n'
+        yield ',result,' + ','.join(columns) + '\n'
+        fixed = {'table': str(table), '_start': start_str, '_stop': stop_str,
+                 '_field': 'value', '_measurement': 'parking', 'pi-id': device}
+        cells = [time_str if c == '_time' else values.astype(str) if c == '_value' else fixed[c]
+                 for c in columns]
+        for row in zip(*[c if not isinstance(c, str) else [c] * len(times) for c in cells]):
+            yield ',,' + ','.join(row) + '\n'
+        yield '\n'
+
+
+def annotated_csv(days, columns=BARE_COLUMNS, device_ids=DEVICE_IDS, seed=0):
+    return ''.join(annotated_csv_lines(days, columns, device_ids, seed)).encode()
+
+
+class SyntheticResponse:
+    """Stands in for the urllib3 response query_raw returns, generating lines lazily"""
+
+    def __init__(self, lines):
+        self._lines = lines
+        self.closed = False
+
+    def __iter__(self):
+        for line in self._lines:
+            yield line.encode()
+
+    def close(self):
+        self.closed = True
+
+
+class SyntheticQueryApi:
+    def __init__(self, days, columns=BARE_COLUMNS):
+        self.days = days
+        self.columns = columns
+
+    def query_raw(self, query, org=None):
+        return SyntheticResponse(annotated_csv_lines(self.days, self.columns))
+
+    def query_data_frame(self, query, org=None):
+        return parse_data_frame(SyntheticResponse(annotated_csv_lines(self.days, self.columns)))
+
+
+def parse_data_frame(response):
+    """Parse an annotated CSV response the way query_api.query_data_frame does"""
+    if isinstance(response, bytes):
+        response = io.BytesIO(response)
+    parser = FluxCsvParser(response=response, serialization_mode=FluxSerializationMode.dataFrame)
+    frames = list(parser.generator())
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_decode_spots(days=40):
+    values = synthetic_values(days)
+    df = pd.DataFrame({"_value": values})
+    spot_cols = spot_columns(BIT_LENGTH)
+
+    apply_s, _ = timed(
+        lambda: df["_value"].apply(lambda v: pd.Series(expand_to_spots(v, BIT_LENGTH))),
+        repeat=1,
+    )
+    numpy_s, decoded = timed(lambda: decode_spots(df["_value"].to_numpy(), BIT_LENGTH))
+
+    wide = pd.DataFrame(decoded, columns=spot_cols)
+
+    print(f"decode_spots, {days} days ({len(values)} rows):")
+    print(f"  Series.apply(expand_to_spots): {apply_s * 1000:9.1f} ms")
+    print(f"  decode_spots:                  {numpy_s * 1000:9.1f} ms  ({apply_s / numpy_s:.0f}x)")
+    print(f"  spot matrix: {decoded.nbytes / 1024:.0f} KiB as uint8, "
+          f"{wide.astype(np.int64).memory_usage(index=False).sum() / 1024:.0f} KiB as int64")
+
+
+def bench_rollups(days=40):
+    values = synthetic_values(days)
+    times = pd.date_range("2025-03-01", periods=len(values), freq="min")
+    # The last reading holds for its minute, like every other one
+    now = times[-1] + pd.Timedelta(minutes=1)
+    spot_cols = spot_columns(BIT_LENGTH)
+
+    def per_row():
+        df = pd.DataFrame({"_time": times, "_value": values})
+        df[spot_cols] = decode_spots(values, BIT_LENGTH)
+        df["date"] = df["_time"].dt.date
+        return df.groupby("date")[spot_cols].sum()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f"{tmp}/rollups.npz"
+        occupancy = pack_occupancy(times.values, values, BIT_LENGTH)
+        cold_s, _ = timed(lambda: update_rollups(occupancy, now, path=path), repeat=1)
+        warm_s, _ = timed(lambda: update_rollups(occupancy, now, path=path))
+    row_s, _ = timed(per_row)
+
+    print(f"Daily per-spot totals, {days} days ({len(values)} rows):")
+    print(f"  per-row DataFrame + groupby:   {row_s * 1000:9.1f} ms")
+    print(f"  rollups, first run:            {cold_s * 1000:9.1f} ms")
+    print(f"  rollups, closed days stored:   {warm_s * 1000:9.1f} ms  ({row_s / warm_s:.0f}x)")
+
+
+def bench_preprocess(days=40):
+    rows = days * ROWS_PER_DAY * len(DEVICE_IDS)
+    frame = pd.DataFrame({
+        "_time": pd.date_range("2025-03-01", periods=rows, freq="15s", tz="UTC"),
+        "_value": synthetic_values(days * len(DEVICE_IDS)),
+        "pi-id": np.resize(DEVICE_IDS + ["tvbox-btv-03_n"], rows),
+    })
+
+    def per_row(df):
+        df["_time"] = pd.to_datetime(df["_time"], unit="ns", utc=True)
+        df = df[~df["pi-id"].isin(EXCLUDE_IDS)]
+        df["device_type"] = df["pi-id"].apply(lambda x: "E10" if "btv" in x else "other")
+        df["model"] = df["pi-id"].apply(lambda x: "YOLOv8n" if x.endswith("_n") else "YOLOv10n")
+        df["date"] = pd.to_datetime(df["_time"]).dt.date
+        return df
+
+    row_s, expected = timed(lambda: per_row(frame.copy()), repeat=1)
+    vector_s, result = timed(lambda: preprocess_subset(frame.copy(), exclude_ids=EXCLUDE_IDS, device="e10"))
+
+    def column_kib(df):
+        return df[["pi-id", "device_type", "model", "date"]].memory_usage(index=False, deep=True).sum() / 1024
+
+    print(f"preprocess_subset, {len(frame)} rows from {len(DEVICE_IDS) + 1} devices:")
+    print(f"  Series.apply per row:          {row_s * 1000:9.1f} ms, {column_kib(expected):8.0f} KiB")
+    print(f"  categoricals:                  {vector_s * 1000:9.1f} ms, {column_kib(result):8.0f} KiB  "
+          f"({row_s / vector_s:.0f}x)")
+
+
+def bench_calendar_features(days=40):
+    times = pd.Series(pd.date_range("2025-03-01", periods=days * ROWS_PER_DAY, freq="min", tz="UTC"))
+
+    def per_row():
+        df = pd.DataFrame({"_time": times})
+        df["date"] = df["_time"].dt.date
+        df["hour"] = df["_time"].dt.hour
+        df["minute"] = df["_time"].dt.minute
+        df["day_of_week"] = df["_time"].dt.day_name()
+        df["day_of_week_num"] = df["_time"].dt.dayofweek
+        df["is_weekend"] = df["day_of_week_num"] >= 5
+        df["week_number"] = df["_time"].dt.isocalendar().week
+        df["year"] = df["_time"].dt.year
+        df["week_id"] = df["year"].astype(str) + "-W" + df["week_number"].astype(str).str.zfill(2)
+        return df.drop(columns="_time")
+
+    row_s, expected = timed(per_row, repeat=1)
+    cached_s, features = timed(lambda: row_calendar_features(times))
+
+    print(f"Calendar features, {days} days ({len(times)} rows):")
+    print(f"  per-row .dt and strings:       {row_s * 1000:9.1f} ms, "
+          f"{expected.memory_usage(index=False, deep=True).sum() / 1024:8.0f} KiB")
+    print(f"  once per date:                 {cached_s * 1000:9.1f} ms, "
+          f"{features.memory_usage(index=False, deep=True).sum() / 1024:8.0f} KiB  ({row_s / cached_s:.0f}x)")
+
+
+def bench_packed_occupancy(days=40):
+    values = synthetic_values(days)
+    times = pd.date_range("2025-03-01", periods=len(values), freq="min")
+    spot_cols = spot_columns(BIT_LENGTH)
+
+    def wide():
+        df = pd.DataFrame({"_time": times, "_value": values})
+        df[spot_cols] = decode_spots(values, BIT_LENGTH).astype(np.int64)
+        df["hour"] = df["_time"].dt.floor("h")
+        return df, df.groupby("hour")[spot_cols].sum(), df[spot_cols].sum(axis=1)
+
+    def packed():
+        occupancy = pack_occupancy(times.values, values, BIT_LENGTH)
+        hours = occupancy.times.view("datetime64[ns]").astype("datetime64[h]")
+        starts = np.flatnonzero(np.r_[True, hours[1:] != hours[:-1]])
+        return occupancy, spot_sums(occupancy, starts), car_counts(occupancy)
+
+    wide_s, (df, _, _) = timed(wide, repeat=1)
+    packed_s, (occupancy, _, _) = timed(packed)
+
+    packed_bytes = occupancy.times.nbytes + occupancy.masks.nbytes
+    print(f"Per-hour spot sums and car counts, {days} days ({len(values)} rows):")
+    print(f"  wide DataFrame:                {wide_s * 1000:9.1f} ms, "
+          f"{df.memory_usage(index=False).sum() / len(df):5.0f} bytes/row")
+    print(f"  packed masks:                  {packed_s * 1000:9.1f} ms, "
+          f"{packed_bytes / len(values):5.0f} bytes/row  ({wide_s / packed_s:.0f}x)")
+
+
+def bench_spot_count(days=40):
+    rows = days * ROWS_PER_DAY
+    rng = np.random.default_rng(0)
+    times = np.arange(rows, dtype=np.int64) * 60 * 10**9
+    starts = np.arange(0, rows, 60)
+
+    print(f"Packed occupancy by spot count, {days} days ({rows} rows):")
+    for bit_length in (16, 64, 128, 256):
+        words = rng.integers(0, 2**63, size=(rows, -(-bit_length // 64)), dtype=np.int64)
+        values = words[:, 0] if bit_length <= 64 else words
+        occupancy = pack_occupancy(times, values, bit_length)
+
+        sums_s, _ = timed(lambda: spot_sums(occupancy, starts))
+        cars_s, _ = timed(lambda: car_counts(occupancy))
+
+        spot_readings = rows * bit_length / 1e6
+        print(f"  {bit_length:3d} spots: hourly spot sums {spot_readings / sums_s:6.0f} M spot-readings/s, "
+              f"car counts {spot_readings / cars_s:6.0f} M spot-readings/s, "
+              f"{occupancy.masks.nbytes / rows:4.0f} bytes/row")
+
+
+def bench_change_only(days=40, keepalive_minutes=30):
+    rows = days * ROWS_PER_DAY
+    rng = np.random.default_rng(0)
+    # Cars stay for hours: each spot flips with a 0.3% chance per minute
+    flips = rng.random((rows, BIT_LENGTH)) < 0.003
+    states = np.cumsum(flips, axis=0) % 2
+    values = (states * (1 << np.arange(BIT_LENGTH - 1, -1, -1))).sum(axis=1)
+    times = np.arange(rows, dtype=np.int64) * 60 * 10**9
+    end = times[-1] + 60 * 10**9
+
+    # Change-only feed: a row when the mask changes, plus a keepalive
+    changed = np.r_[True, values[1:] != values[:-1]]
+    keepalive = np.arange(rows) % keepalive_minutes == 0
+    kept = changed | keepalive
+
+    def totals(rows_kept):
+        occupancy = pack_occupancy(times[rows_kept], values[rows_kept], BIT_LENGTH)
+        durations = reading_durations(occupancy.times, end, max_gap=pd.Timedelta(minutes=keepalive_minutes))
+        return hourly_rollup(occupancy, durations).minutes.sum(axis=0)
+
+    every_s, _ = timed(lambda: totals(np.ones(rows, dtype=bool)))
+    change_s, _ = timed(lambda: totals(kept))
+
+    print(f"Time-weighted occupancy, {days} days, keepalive every {keepalive_minutes} min:")
+    print(f"  every minute:  {rows:7d} rows, {every_s * 1000:6.1f} ms")
+    print(f"  change-only:   {kept.sum():7d} rows ({kept.sum() / rows:.0%}), {change_s * 1000:6.1f} ms")
+
+
+def bench_baseline(days=120):
+    rng = np.random.default_rng(0)
+    dates = list(pd.date_range("2025-01-01", periods=days, freq="D").date)
+    daily = pd.DataFrame(rng.normal(540, 60, size=(days, BIT_LENGTH)), index=pd.Index(dates, name="date"))
+
+    def pandas_baseline(target, weeks):
+        history = daily[(daily.index >= window_start(target, weeks)) & (daily.index < target)]
+        same_type = history[[day_type(d) == day_type(target) for d in history.index]]
+        return same_type.mean().to_numpy(), same_type.std().to_numpy()
+
+    print(f"Baseline statistics, sliding over {days} days:")
+    for weeks in (3, 13):
+        targets = dates[7 * weeks + 1:]
+        start = time.perf_counter()
+        for target in targets:
+            daily_baseline(daily, target, weeks=weeks)
+        baseline_s = (time.perf_counter() - start) / len(targets)
+
+        start = time.perf_counter()
+        for target in targets:
+            pandas_baseline(target, weeks)
+        pandas_s = (time.perf_counter() - start) / len(targets)
+
+        print(f"  {weeks:2d} weeks: daily_baseline {baseline_s * 1000:5.2f} ms/day, "
+              f"pandas per day type {pandas_s * 1000:5.2f} ms/day")
+
+
+def bench_hourly_baseline(days=40):
+    rows = days * ROWS_PER_DAY
+    rng = np.random.default_rng(0)
+    times = pd.date_range("2025-03-01", periods=rows, freq="min")
+    hours = times.hour.to_numpy()
+    # Busy from 8 to 18, mostly empty at night
+    busy = np.where((hours >= 8) & (hours < 18), 0.8, 0.05)
+    bits = rng.random((rows, BIT_LENGTH)) < busy[:, None]
+    target = times[-1].date()
+    day = times.date == target
+    # On the last day spot_3 is taken all night and free from 10 to 14
+    # (its daily total stays about the same)
+    bits[day & (hours < 5), 2] = True
+    bits[day & (hours >= 10) & (hours < 14), 2] = False
+    values = (bits * (1 << np.arange(BIT_LENGTH - 1, -1, -1))).sum(axis=1)
+
+    occupancy = pack_occupancy(times.values, values, BIT_LENGTH)
+    durations = reading_durations(occupancy.times, occupancy.times[-1] + 60 * 10**9)
+    rollups = hourly_rollup(occupancy, durations)
+
+    build_s, baseline = timed(lambda: hourly_baseline(rollups, target))
+    score_s, z = timed(lambda: score_hours(rollups, target, baseline))
+
+    worst = np.abs(z).argmax(axis=0)
+    print(f"Hourly baseline, {days} days, 24 x {BIT_LENGTH} x 2 matrix:")
+    print(f"  built in {build_s * 1000:.2f} ms, previous day scored in {score_s * 1000:.2f} ms")
+    print(f"  spot_3 worst hour {worst[2]:02d}h z={z[worst[2], 2]:+.1f}, "
+          f"other spots at most |z|={np.delete(np.abs(z), 2, axis=1).max():.1f}")
+
+
+def bench_sensor_health(days=40):
+    rows = days * ROWS_PER_DAY
+    rng = np.random.default_rng(0)
+    times = pd.date_range("2025-03-01", periods=rows, freq="min")
+    # Cars park for about an hour: a spot changes state with 1/60 chance a minute
+    bits = np.cumsum(rng.random((rows, BIT_LENGTH)) < 1 / 60, axis=0) % 2 == 1
+    last_day = times.date == times[-1].date()
+    # On the last day spot_5 is stuck occupied from 02:00 and spot_9 flaps
+    bits[last_day & (times.hour >= 2), 4] = True
+    bits[last_day, 8] = rng.random(last_day.sum()) < 0.5
+    values = (bits * (1 << np.arange(BIT_LENGTH - 1, -1, -1))).sum(axis=1)
+
+    occupancy = pack_occupancy(times.values, values, BIT_LENGTH)
+    durations = reading_durations(occupancy.times, occupancy.times[-1] + 60 * 10**9)
+    elapsed, health = timed(lambda: sensor_health(occupancy, durations))
+
+    # Per spot and day loop over the readings, for comparison
+    loop_start = time.perf_counter()
+    day_codes = occupancy.times // DAY_NS - occupancy.times[0] // DAY_NS
+    for day in range(days):
+        rows_of_day = np.flatnonzero(day_codes == day)
+        for spot in range(BIT_LENGTH):
+            longest = run = flips = 0
+            for k, row in enumerate(rows_of_day):
+                if k and bits[row, spot] != bits[row - 1, spot]:
+                    flips += 1
+                    run = 0
+                run += durations[row] / MINUTE_NS if bits[row, spot] else 0
+                longest = max(longest, run)
+    loop_s = time.perf_counter() - loop_start
+
+    alerts = sensor_alerts(health, times[-1].date(), spot_columns(BIT_LENGTH))
+    print(f"Sensor health, {days} days x {BIT_LENGTH} spots:")
+    print(f"  run-length pass {elapsed * 1000:.1f} ms, per-reading loop {loop_s:.2f} s")
+    for line in alerts:
+        print(f"  {line}")
+
+
+def bench_outages(days=1, devices=20):
+    rng = np.random.default_rng(0)
+    minute = 60 * 10**9
+    times, ids = [], []
+    for d in range(devices):
+        device_times = np.arange(days * ROWS_PER_DAY) * minute + rng.integers(0, 5 * 10**9)
+        # A few outages of 6 to 60 minutes per device
+        for start in rng.integers(0, len(device_times) - 60, size=3):
+            device_times[start:start + rng.integers(6, 60)] = -1
+        device_times = device_times[device_times >= 0]
+        times.append(device_times)
+        ids += [f"tvbox-btv-{d:02d}"] * len(device_times)
+    times = np.concatenate(times)
+    ids = np.array(ids)
+    order = rng.permutation(len(times))
+    times, ids = times[order], ids[order]
+
+    elapsed, outages = timed(lambda: find_outages(times, ids))
+
+    # For comparison: sort and walk every device's readings
+    loop_start = time.perf_counter()
+    expected = []
+    for device in sorted(set(ids)):
+        device_times = np.sort(times[ids == device])
+        for prev, cur in zip(device_times[:-1], device_times[1:]):
+            if cur - prev <= 5 * minute:
+                continue
+            if expected and expected[-1][0] == device and expected[-1][2] == prev:
+                # Gap right after a gap, same outage
+                expected[-1] = (device, expected[-1][1], cur)
+            else:
+                expected.append((device, prev, cur))
+    loop_s = time.perf_counter() - loop_start
+
+    print(f"Outage scan, {len(times)} rows of {devices} devices:")
+    print(f"  one pass {elapsed * 1000:.1f} ms, per-device loop {loop_s * 1000:.1f} ms, {len(outages)} outages")
+
+
+def bench_query_cache(requesters=4):
+    """Queries sent for the midnight pair of jobs and for concurrent requesters of one window"""
+    frames = {days: pd.DataFrame({
+        "_time": pd.date_range(end=pd.Timestamp.now(tz="UTC"), periods=days * ROWS_PER_DAY, freq="min"),
+        "_value": synthetic_values(days)}) for days in (30, 40)}
+    fetched = []
+
+    def fetch(days):
+        fetched.append(days)
+        time.sleep(0.05)  # stands in for the InfluxDB round trip
+        return frames[days]
+
+    cache = QueryCache()
+    # First night: the hourly job asks for 30 days, the daily job for 40
+    for days in (30, 40):
+        cache.window("ic2_parking_twin", days, fetch)
+    first_night = list(fetched)
+    # Next night the widest window is fetched first and the daily job slices it
+    cache.invalidate("ic2_parking_twin")
+    fetched.clear()
+    hourly_s, _ = timed(lambda: cache.window("ic2_parking_twin", 30, fetch), repeat=1)
+    daily_s, _ = timed(lambda: cache.window("ic2_parking_twin", 40, fetch), repeat=1)
+    next_night = list(fetched)
+
+    fetched.clear()
+    cache = QueryCache()
+    threads = [threading.Thread(target=cache.window, args=("ic2_parking_twin", 30, fetch)) for _ in range(requesters)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print("Query cache:")
+    print(f"  first night fetches {first_night}, next night {next_night}: hourly {hourly_s * 1000:.0f} ms, "
+          f"daily {daily_s * 1000:.1f} ms")
+    print(f"  {requesters} concurrent requesters, {len(fetched)} fetch, {cache.shared} waited for it")
+
+
+def bench_query_pushdown(days=30):
+    bare = annotated_csv(days)
+    pushed = annotated_csv(days, columns=KEPT_COLUMNS,
+                           device_ids=[d for d in DEVICE_IDS if d not in EXCLUDE_IDS])
+
+    bare_s, bare_df = timed(lambda: parse_data_frame(bare), repeat=1)
+    pushed_s, pushed_df = timed(lambda: parse_data_frame(pushed), repeat=1)
+
+    print(f"Flux pushdown (filter pi-id + keep), {days} days x {len(DEVICE_IDS)} devices:")
+    print(f"  bare query:   {len(bare) / 2**20:7.1f} MiB payload, parse {bare_s:6.2f} s, "
+          f"{bare_df.memory_usage(deep=True).sum() / 2**20:6.1f} MiB frame")
+    print(f"  pushed down:  {len(pushed) / 2**20:7.1f} MiB payload, parse {pushed_s:6.2f} s, "
+          f"{pushed_df.memory_usage(deep=True).sum() / 2**20:6.1f} MiB frame")
+
+
+def _peak_rss_mb(job, days, budget_mb):
+    """Run one ingestion job and report this (fresh) process's peak RSS"""
+    query_api = SyntheticQueryApi(days)
+    if job == 'query_data_frame':
+        df = query_api.query_data_frame("")
+        rows = len(df[~df['pi-id'].isin(EXCLUDE_IDS)])
+    else:
+        rows = len(stream_rows(query_api, "", exclude_ids=EXCLUDE_IDS,
+                               bit_length=BIT_LENGTH, memory_budget_mb=budget_mb).times)
+    return rows, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_stream_memory(days=90, budget_mb=256):
+    """Peak RSS of ingesting a synthetic 90-day response, query_data_frame vs stream_rows"""
+    # A spawned child keeps the peak RSS of the fork it was exec'd from, which
+    # is this process, large after the other benchmarks; forkserver children do not
+    ctx = multiprocessing.get_context('forkserver')
+    print(f"Ingestion peak RSS, {days} days x {len(DEVICE_IDS)} devices (budget {budget_mb} MB):")
+    for job in ('query_data_frame', 'stream_rows'):
+        with ctx.Pool(1) as pool:
+            start = time.perf_counter()
+            rows, peak_mb = pool.apply(_peak_rss_mb, (job, days, budget_mb))
+            elapsed = time.perf_counter() - start
+        print(f"  {job:17s} {rows:8d} rows kept, peak RSS {peak_mb:6.0f} MB, {elapsed:5.1f} s")
+
+
+def _cold_start_s(imports, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', imports], check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_freshness_probe():
+    """Startup and per-run cost of telegrambot_10min.py vs freshness_probe.py"""
+    # What each script imports before it can query InfluxDB
+    script_s = _cold_start_s("import pandas, numpy, influxdb_client, requests, flux_query")
+    probe_s = _cold_start_s("import csv, json, urllib.request, bot_common, flux_query, lots")
+
+    day = annotated_csv(1, columns=['table', '_time', '_value'], device_ids=DEVICE_IDS[:1])
+    # What the last() query returns: one annotated table with a single row
+    last = ('#datatype,string,long,dateTime:RFC3339,long\n'
+            '#group,false,false,false,false\n'
+            '#default,_result,,,\n'
+            ',result,table,_time,_value\n'
+            ',,0,2025-05-31T23:59:00Z,65535\n\n')
+
+    def script_parse():
+        df = parse_data_frame(day).sort_values("_time")
+        return df["_time"].iloc[-1], df.loc[df["_time"].idxmax(), "_value"]
+
+    script_parse_s, _ = timed(script_parse)
+    probe_parse_s, _ = timed(lambda: parse_last_row(last))
+
+    print("Freshness check, 1-day window:")
+    print(f"  telegrambot_10min: start {script_s * 1000:7.0f} ms, response {len(day) / 1024:7.1f} KiB, "
+          f"parse {script_parse_s * 1000:7.1f} ms")
+    print(f"  freshness_probe:   start {probe_s * 1000:7.0f} ms, response {len(last) / 1024:7.1f} KiB, "
+          f"parse {probe_parse_s * 1000:7.3f} ms")
+
+
+def simulated_feed(days, outages, seed=0):
+    """Write times in seconds of a device writing every minute, with `outages` silences of 15-120 minutes"""
+    rng = np.random.default_rng(seed)
+    writes = np.arange(0, days * 86400, 60.0) + rng.uniform(0, 5, size=days * ROWS_PER_DAY)
+    for start in rng.uniform(3600, days * 86400 - 7200, size=outages):
+        writes = writes[(writes < start) | (writes > start + rng.uniform(15, 120) * 60)]
+    return writes
+
+
+def poll_feed(writes, next_delay, tolerance_s=600):
+    """Poll a simulated feed; returns (polls, detection delays in seconds of every outage)"""
+    # An outage starts being late when the newest write is tolerance_s old
+    gaps = np.flatnonzero(np.diff(writes) > tolerance_s)
+    late_at = writes[gaps] + tolerance_s
+    detected = np.full(len(gaps), np.nan)
+    t, polls, end = 0.0, 0, writes[-1]
+    while t < end:
+        polls += 1
+        newest = writes[np.searchsorted(writes, t, side='right') - 1]
+        if t - newest > tolerance_s:
+            outage = np.searchsorted(late_at, t, side='right') - 1
+            if np.isnan(detected[outage]):
+                detected[outage] = t - late_at[outage]
+        t += next_delay(newest, t)
+    return polls, detected
+
+
+def bench_adaptive_polling(days=7, outages=20, tolerance_minutes=10):
+    """Time to detect a silent device and queries made, fixed polling vs the adaptive watcher"""
+    writes = simulated_feed(days, outages)
+    epoch = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+    def adaptive(newest, t):
+        return next_poll_delay({'tvbox': epoch + timedelta(seconds=newest)}, epoch + timedelta(seconds=t),
+                               tolerance_minutes)
+
+    strategies = [("cron every 10 min", lambda newest, t: 600.0),
+                  ("poll every minute", lambda newest, t: 60.0),
+                  ("adaptive watcher", adaptive)]
+    print(f"Freshness polling, {days} days, {outages} outages of 15-120 min:")
+    for name, next_delay in strategies:
+        polls, detected = poll_feed(writes, next_delay, tolerance_minutes * 60)
+        # Outages that end before the next poll are never seen
+        missed = int(np.isnan(detected).sum())
+        print(f"  {name:18s} {polls:6d} queries, time to detect mean {np.nanmean(detected):5.0f} s, "
+              f"max {np.nanmax(detected):5.0f} s, {missed} missed")
+
+
+def bench_fleet_probe(devices=300, stale=5):
+    """Grouped last() response of a fleet vs the full day of rows"""
+    end = pd.Timestamp('2025-06-01', tz='UTC')
+    ids = [f"tvbox-btv-{i:03d}" for i in range(devices)]
+    ages = np.r_[np.full(devices - stale, 1), np.arange(stale) * 10 + 20]
+    # One table per pi-id with its newest row, as the grouped query returns it
+    grouped = ''.join(
+        '#datatype,string,long,dateTime:RFC3339,long,string\n'
+        '#group,false,false,false,false,true\n'
+        '#default,_result,,,,\n'
+        ',result,table,_time,_value,pi-id\n'
+        f',,{i},{(end - pd.Timedelta(minutes=int(age))).strftime("%Y-%m-%dT%H:%M:%SZ")},65535,{device}\n\n'
+        for i, (device, age) in enumerate(zip(ids, ages)))
+    full_day_kib = len(annotated_csv(1, columns=['table', '_time', '_value', 'pi-id'], device_ids=ids[:4])) / 4 * devices / 1024
+
+    parse_s, newest = timed(lambda: parse_last_rows(grouped))
+    now = end.to_pydatetime()
+    check_s, found = timed(lambda: stale_devices({d: t for d, (t, _) in newest.items()}, now, 10))
+
+    print(f"Fleet freshness, {devices} devices:")
+    print(f"  grouped response {len(grouped) / 1024:.1f} KiB (full day about {full_day_kib:.0f} KiB), "
+          f"parse {parse_s * 1000:.2f} ms, staleness {check_s * 1000:.3f} ms, {len(found)} stale")
+
+
+class TelegramStandIn(BaseHTTPRequestHandler):
+    """Local stand-in for api.telegram.org that answers with the queued status codes"""
+
+    statuses = []
+    requests = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.requests.append((time.monotonic(), self.path, body))
+        status = self.statuses.pop(0) if self.statuses else 200
+        payload = {'ok': status == 200}
+        if status == 200 and self.path.endswith('/sendPhoto'):
+            payload['result'] = {'photo': [{'file_id': f'FILE{len(self.requests)}'}]}
+        if status == 200 and self.path.endswith('/sendMediaGroup'):
+            album = len(re.findall(rb'"type": "photo"', body))
+            payload['result'] = [{'photo': [{'file_id': f'FILE{len(self.requests)}_{i}'}]} for i in range(album)]
+        if status == 429:
+            payload['parameters'] = {'retry_after': 1}
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(payload).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def bench_dashboard_image(uplink_kib_s=64):
+    """Dashboard bytes per format and the upload cost with file_id reuse"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import requests
+
+    rng = np.random.default_rng(0)
+    fig = plt.figure(figsize=(18, 12))
+    ax1 = plt.subplot2grid((2, 2), (0, 0))
+    ax1.bar(np.arange(4), rng.uniform(500, 900, 4), color='steelblue', alpha=0.8)
+    ax2 = plt.subplot2grid((2, 2), (0, 1))
+    for week in range(4):
+        ax2.plot(np.arange(24), rng.uniform(0, 60, 24), marker='o', linewidth=2, label=f"week {week}")
+    ax2.legend()
+    ax2.grid(True, alpha=0.3)
+    ax3 = plt.subplot2grid((2, 2), (1, 0), colspan=2)
+    for week in range(4):
+        ax3.bar(np.arange(BIT_LENGTH) + week * 0.2, rng.uniform(20, 60, BIT_LENGTH), width=0.2, alpha=0.8)
+    ax3.grid(True, alpha=0.3)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        default = io.BytesIO()
+        fig.savefig(default, format='png')
+        print(f"Dashboard image, uplink {uplink_kib_s} KiB/s:")
+        print(f"  matplotlib default png {len(default.getvalue()) / 1024:7.1f} KiB, "
+              f"upload ~{len(default.getvalue()) / 1024 / uplink_kib_s:.1f} s")
+        images = {}
+        for fmt in ('png', 'jpeg', 'webp'):
+            elapsed, images[fmt] = timed(lambda: export_figure(fig, f"{tmp}/dashboard_{fmt}", fmt=fmt), repeat=1)
+            image = images[fmt]
+            quality = f", quality {image.quality}" if image.quality else ""
+            print(f"  {fmt:4s} {image.nbytes / 1024:7.1f} KiB at {image.dpi} dpi{quality}, "
+                  f"encoded in {elapsed * 1000:.0f} ms, upload ~{image.nbytes / 1024 / uplink_kib_s:.1f} s")
+        plt.close(fig)
+
+        server = HTTPServer(('127.0.0.1', 0), TelegramStandIn)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        TelegramStandIn.statuses = []
+        TelegramStandIn.requests = []
+        notifier = TelegramNotifier('TOKEN', session=requests.Session(),
+                                    api_base=f'http://127.0.0.1:{server.server_port}',
+                                    min_interval=0, coalesce_window=0, file_id_path=f"{tmp}/file_ids.json")
+        for _ in range(2):
+            notifier.send_photo('chat', images['png'].path)
+        notifier.flush(timeout=30)
+        server.shutdown()
+
+    sizes = [len(body) for _, _, body in TelegramStandIn.requests]
+    print(f"  same png sent twice: request bodies {sizes[0] / 1024:.1f} KiB then {sizes[1]} bytes, "
+          f"second one reused={notifier.photos[1].reused}")
+
+
+def _dashboard_frames(weeks=6):
+    rng = np.random.default_rng(0)
+    spot_cols = spot_columns(BIT_LENGTH)
+    week_ids = [f"2026-W{week:02d}" for week in range(1, weeks + 1)]
+    daily = pd.DataFrame(rng.uniform(0, 1440, (weeks * 7, BIT_LENGTH)), columns=spot_cols)
+    daily["week_id"] = np.repeat(week_ids, 7)
+    hourly = pd.DataFrame(rng.uniform(0, 60, (weeks * 7 * 24, BIT_LENGTH)), columns=spot_cols)
+    hourly["week_id"] = np.repeat(week_ids, 7 * 24)
+    hourly["hour"] = np.tile(np.arange(24), weeks * 7)
+    return daily, hourly, week_ids[-4:], spot_cols
+
+
+def bench_dashboard_render():
+    """pyplot figure built per run vs the cached Agg template"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import dashboard
+    from dashboard import dashboard_data, render_dashboard, warm_up
+
+    daily, hourly, selected_weeks, spot_cols = _dashboard_frames()
+
+    def pyplot_dashboard(stem=None):
+        # Shape of the old create_weekly_comparison_dashboard: three groupings, new figure every run
+        fig = plt.figure(figsize=(18, 12))
+        weekly = daily[daily["week_id"].isin(selected_weeks)].groupby("week_id")[spot_cols].sum().sum(axis=1) / 60
+        ax1 = plt.subplot2grid((2, 2), (0, 0))
+        weekly.plot(kind='bar', ax=ax1, color='steelblue', alpha=0.8)
+        ax2 = plt.subplot2grid((2, 2), (0, 1))
+        hours = hourly[hourly["week_id"].isin(selected_weeks)].groupby(["week_id", "hour"])[spot_cols].sum().sum(axis=1)
+        hours = (hours / 60).reset_index()
+        for week in selected_weeks:
+            week_data = hours[hours["week_id"] == week]
+            ax2.plot(week_data["hour"], week_data[0], label=week, marker='o', linewidth=2)
+        ax2.legend()
+        ax3 = plt.subplot2grid((2, 2), (1, 0), colspan=2)
+        spot_weekly = daily[daily["week_id"].isin(selected_weeks)].groupby("week_id")[spot_cols].sum() / 60
+        for i, week in enumerate(selected_weeks):
+            ax3.bar(np.arange(BIT_LENGTH) + i * 0.2, spot_weekly.loc[week], width=0.2, label=week, alpha=0.8)
+        ax3.legend(title='Week')
+        plt.suptitle('Weekly Occupation Analysis Dashboard', fontsize=16, fontweight='bold')
+        plt.tight_layout()
+        if stem is None:
+            fig.canvas.draw()
+            image = None
+        else:
+            image = export_figure(fig, stem)
+        plt.close(fig)
+        return image
+
+    def template_dashboard(stem=None):
+        data = dashboard_data(daily, hourly, selected_weeks, spot_cols)
+        if stem is not None:
+            return render_dashboard(data, 'Weekly Occupation Analysis Dashboard', stem)
+        template = dashboard._template(len(data.weeks), BIT_LENGTH)
+        template.update(data, 'Weekly Occupation Analysis Dashboard')
+        template.fig.canvas.draw()
+
+    warm_s, _ = timed(lambda: warm_up(BIT_LENGTH), repeat=1)
+    old_draw_s, _ = timed(pyplot_dashboard)
+    new_draw_s, _ = timed(template_dashboard)
+    with tempfile.TemporaryDirectory() as tmp:
+        old_s, _ = timed(lambda: pyplot_dashboard(f"{tmp}/old"))
+        new_s, _ = timed(lambda: template_dashboard(f"{tmp}/new"))
+    aggregate_s, _ = timed(lambda: dashboard_data(daily, hourly, selected_weeks, spot_cols))
+    print(f"Weekly dashboard render, template warm-up {warm_s * 1000:.0f} ms once, "
+          f"aggregates {aggregate_s * 1000:.1f} ms:")
+    print(f"  {'':28s} {'draw':>8s} {'with png':>9s}")
+    print(f"  {'pyplot, new figure per run':28s} {old_draw_s * 1000:6.0f} ms {old_s * 1000:6.0f} ms")
+    print(f"  {'cached Agg template':28s} {new_draw_s * 1000:6.0f} ms {new_s * 1000:6.0f} ms")
+
+
+def bench_multi_lot_dashboards(lots=12):
+    """Dashboards of several lots: one after the other vs the render pool, sendPhoto vs albums"""
+    import requests
+    import dashboard
+    from dashboard import DashboardJob, dashboard_data, render_dashboard, render_dashboards, warm_up
+
+    # At least 2 workers, so the pool is timed even on a single core
+    workers = dashboard.RENDER_WORKERS = max(2, os.cpu_count() or 1)
+    daily, hourly, selected_weeks, spot_cols = _dashboard_frames()
+    data = dashboard_data(daily, hourly, selected_weeks, spot_cols)
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = [DashboardJob(data._replace(spot_hours=data.spot_hours * (1 + lot / 100)), f'lot {lot}',
+                             f"{tmp}/lot{lot}") for lot in range(lots)]
+        warm_up(BIT_LENGTH)
+        serial_s, _ = timed(lambda: [render_dashboard(job.data, job.title, job.stem) for job in jobs], repeat=1)
+        render_dashboards(jobs)  # start the pool and build the workers' templates
+        pool_s, images = timed(lambda: render_dashboards(jobs), repeat=1)
+
+        server = HTTPServer(('127.0.0.1', 0), TelegramStandIn)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        requests_made = {}
+        for method in ('sendPhoto', 'sendMediaGroup'):
+            TelegramStandIn.statuses = []
+            TelegramStandIn.requests = []
+            notifier = TelegramNotifier('TOKEN', session=requests.Session(),
+                                        api_base=f'http://127.0.0.1:{server.server_port}', min_interval=0,
+                                        coalesce_window=0, file_id_path=f"{tmp}/file_ids_{method}.json")
+            paths = [image.path for image in images]
+            if method == 'sendPhoto':
+                for path in paths:
+                    notifier.send_photo('chat', path)
+            else:
+                notifier.send_media_group('chat', paths, captions=[f'lot {lot}' for lot in range(lots)])
+            notifier.flush(timeout=30)
+            requests_made[method] = len(TelegramStandIn.requests)
+        server.shutdown()
+
+    print(f"Dashboards of {lots} lots on {os.cpu_count()} cores:")
+    print(f"  one after the other  {serial_s:6.2f} s")
+    print(f"  render pool          {pool_s:6.2f} s ({serial_s / pool_s:.1f}x, {workers} workers)")
+    print(f"  Telegram requests: {requests_made['sendPhoto']} with sendPhoto, "
+          f"{requests_made['sendMediaGroup']} with sendMediaGroup")
+
+
+class SlowQueryApi(SyntheticQueryApi):
+    """SyntheticQueryApi whose queries take `latency` seconds on the server, counting those in flight"""
+
+    def __init__(self, days, latency):
+        super().__init__(days)
+        self.latency = latency
+        self.in_flight = self.most_in_flight = 0
+        self._lock = threading.Lock()
+
+    def query_raw(self, query, org=None):
+        with self._lock:
+            self.in_flight += 1
+            self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        response = super().query_raw(query, org)
+        close = response.close
+
+        def closed():
+            close()
+            with self._lock:
+                self.in_flight -= 1
+        response.close = closed
+        return response
+
+
+def bench_lot_runner(days=1, latency=0.5, max_queries=MAX_INFLUX_QUERIES):
+    """fetch -> decode -> analyze of many lots, one after the other vs run_lots"""
+
+    def pipeline(query_api, lot):
+        # Like the hourly bot: the window, then the fingerprint of the reported day
+        rows = stream_rows(query_api, "", exclude_ids=EXCLUDE_IDS, bit_length=BIT_LENGTH)
+        stream_rows(query_api, "", exclude_ids=EXCLUDE_IDS)
+        return rows.spots.sum(axis=0)
+
+    lot = DEFAULT_LOTS[DEFAULT_LOT]
+    print(f"Lots of {days} day(s) x {len(DEVICE_IDS)} devices, 2 queries of {latency * 1000:.0f} ms each, "
+          f"at most {max_queries} in flight:")
+    for lots in (1, 4, 16):
+        query_api = SlowQueryApi(days, latency)
+        serial_s, _ = timed(lambda: [pipeline(query_api, lot) for _ in range(lots)], repeat=1)
+        query_api = SlowQueryApi(days, latency)
+        runner_s, runs = timed(lambda: run_lots([lot] * lots, pipeline, max_queries=max_queries,
+                                                query_api=query_api), repeat=1)
+        waited = max(run.wait_seconds for run in runs)
+        print(f"  {lots:2d} lots: one after the other {serial_s:5.1f} s, run_lots {runner_s:5.1f} s, "
+              f"most queries in flight {query_api.most_in_flight}, longest wait for a slot {waited:.1f} s")
+
+
+def bench_notifier():
+    """Queue a burst of alerts against a flaky local Telegram stand-in"""
+    import requests
+
+    server = HTTPServer(('127.0.0.1', 0), TelegramStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    TelegramStandIn.statuses = [429, 502]
+    TelegramStandIn.requests = []
+
+    notifier = TelegramNotifier('TOKEN', session=requests.Session(),
+                                api_base=f'http://127.0.0.1:{server.server_port}')
+    start = time.monotonic()
+    for i in range(10):
+        notifier.send_message('chat', f'alert {i}')
+    enqueue_s = time.monotonic() - start
+    delivered = notifier.flush(timeout=30)
+    total_s = time.monotonic() - start
+    server.shutdown()
+
+    attempts = len(TelegramStandIn.requests)
+    print("Telegram notifier, burst of 10 alerts (stand-in answers 429, 502, then 200):")
+    print(f"  enqueue {enqueue_s * 1000:.2f} ms, delivered={delivered} after {total_s:.1f} s "
+          f"in {attempts} HTTP requests")
+
+
+if __name__ == "__main__":
+    bench_decode_spots()
+    bench_packed_occupancy()
+    bench_spot_count()
+    bench_rollups()
+    bench_change_only()
+    bench_baseline()
+    bench_hourly_baseline()
+    bench_sensor_health()
+    bench_preprocess()
+    bench_calendar_features()
+    bench_outages()
+    bench_query_cache()
+    bench_query_pushdown()
+    bench_stream_memory()
+    bench_freshness_probe()
+    bench_fleet_probe()
+    bench_adaptive_polling()
+    bench_notifier()
+    bench_dashboard_image()
+    bench_dashboard_render()
+    bench_multi_lot_dashboards()
+    bench_lot_runner()
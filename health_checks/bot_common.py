@@ -0,0 +1,95 @@
+"""Setup shared by the health check bots.
+
+The InfluxDB client and the HTTP session are created once per process, so
+when the bots run inside health_daemon.py they share one connection pool
+instead of opening new connections on every run. influxdb_client and
+requests are only imported when first needed, which keeps freshness_probe.py
+fast to start.
+"""
+import fcntl
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from logging.handlers import TimedRotatingFileHandler
+
+BASE_DIR = '/home/unicamp/photo_collection'
+INFLUX_TOKEN_FILE = f'{BASE_DIR}/token_read_twin.txt'
+TELEGRAM_TOKEN_FILE = f'{BASE_DIR}/telegram_token.txt'
+
+org = ""
+url = ''
+
+_lock = threading.Lock()
+_influx_client = None
+_http_session = None
+
+
+def setup_logger(name, log_file):
+    log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+    handler = TimedRotatingFileHandler(
+        log_file,
+        when='midnight',  # Rotate logs daily
+        interval=1,       # Interval in days
+        backupCount=7     # Keep logs for 7 days
+    )
+    handler.setFormatter(log_formatter)
+
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    return logger
+
+
+# Read secrets
+def read_token(file_path):
+    try:
+        with open(file_path, 'r') as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        logging.error(f"Token file not found: {file_path}")
+        raise
+
+
+@contextmanager
+def file_lock(path):
+    """Serialize updates of a shared file between bots started at the same minute"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def influx_client():
+    """InfluxDB client shared by every bot in this process"""
+    global _influx_client
+    with _lock:
+        if _influx_client is None:
+            import influxdb_client
+            _influx_client = influxdb_client.InfluxDBClient(url=url, token=read_token(INFLUX_TOKEN_FILE), org=org)
+        return _influx_client
+
+
+def http_session():
+    """Keep-alive HTTP session shared by every bot in this process"""
+    global _http_session
+    with _lock:
+        if _http_session is None:
+            import requests
+            _http_session = requests.Session()
+        return _http_session
+
+
+def close():
+    global _influx_client, _http_session
+    with _lock:
+        if _influx_client is not None:
+            _influx_client.close()
+            _influx_client = None
+        if _http_session is not None:
+            _http_session.close()
+            _http_session = None
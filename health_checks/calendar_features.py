@@ -0,0 +1,67 @@
+"""Calendar features for the occupancy analyses.
+
+Day name, weekday, ISO week and `week_id` are derived once per distinct date
+(and cached across runs of a long-lived process), then attached to rows by
+index lookup. Strings only exist in the categories, rows hold small codes.
+"""
+import functools
+
+import numpy as np
+import pandas as pd
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+CALENDAR_COLUMNS = ['day_of_week', 'day_of_week_num', 'is_weekend', 'week_number', 'year', 'week_id']
+
+
+@functools.lru_cache(maxsize=1024)
+def _day_features(day):
+    week_number = day.isocalendar()[1]
+    weekday = day.weekday()
+    return (DAY_NAMES[weekday], weekday, weekday >= 5,  # 5=Saturday, 6=Sunday
+            week_number, day.year, f"{day.year}-W{week_number:02d}")
+
+
+def calendar_table(dates):
+    """Calendar columns indexed by `date`, one row per datetime.date in `dates`"""
+    table = pd.DataFrame([_day_features(day) for day in dates],
+                         index=pd.Index(dates, name='date', dtype=object), columns=CALENDAR_COLUMNS)
+    table['day_of_week'] = pd.Categorical(table['day_of_week'], categories=DAY_NAMES)
+    table['day_of_week_num'] = table['day_of_week_num'].astype(np.int8)
+    table['is_weekend'] = table['is_weekend'].astype(bool)
+    table['week_number'] = table['week_number'].astype(np.int8)
+    table['year'] = table['year'].astype(np.int16)
+    table['week_id'] = table['week_id'].astype('category')
+    return table
+
+
+def _take(table, codes, index):
+    """Rows `codes` of `table`, keeping categorical columns as codes"""
+    columns = {}
+    for name, column in table.items():
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            columns[name] = pd.Categorical.from_codes(column.cat.codes.to_numpy()[codes], dtype=column.dtype)
+        else:
+            columns[name] = column.to_numpy()[codes]
+    return pd.DataFrame(columns, index=index)
+
+
+def calendar_features(dates, index=None):
+    """Calendar columns for a sequence of datetime.date, computed once per distinct date"""
+    codes, unique = pd.factorize(np.asarray(dates, dtype=object))
+    return _take(calendar_table(list(unique)), codes, index)
+
+
+def row_calendar_features(times):
+    """`date`, `hour`, `minute` and the calendar columns for a datetime64 Series of row times"""
+    ns = times.to_numpy(dtype='datetime64[ns]')
+    days = ns.astype('datetime64[D]')
+    unique_days, codes = np.unique(days, return_inverse=True)
+    codes = codes.reshape(-1)
+    dates = list(pd.DatetimeIndex(unique_days.astype('datetime64[ns]')).date)
+
+    features = _take(calendar_table(dates), codes, times.index)
+    features.insert(0, 'date', pd.Categorical.from_codes(codes, categories=pd.Index(dates, dtype=object)))
+    minute_of_day = (ns - days).astype('timedelta64[m]').astype(np.int16)
+    features.insert(1, 'hour', (minute_of_day // 60).astype(np.int8))
+    features.insert(2, 'minute', (minute_of_day % 60).astype(np.int8))
+    return features
@@ -9,4 +9,7 @@ sudo apt install -y libjpeg-dev zlib1g-dev libfreetype6-dev liblcms2-dev libopen
 pip install -r requirements.txt
 chmod +x run_telegrambot_1hour.sh
 chmod +x run_telegrambot_10min.sh
-chmod +x run_telegrambot_1day.sh
\ No newline at end of file
+chmod +x run_telegrambot_1day.sh
+chmod +x run_health_daemon.sh
+chmod +x run_freshness_probe.sh
+chmod +x run_freshness_watcher.sh
\ No newline at end of file
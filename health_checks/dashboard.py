@@ -0,0 +1,192 @@
+"""Weekly comparison dashboard of telegrambot_1day.py.
+
+Rendering is headless (Agg, no pyplot) and the figure is a template built
+once per process for a given number of weeks and spots: every run only
+updates the bar heights, line data, labels and titles before saving, so
+the axes, ticks and fonts are not set up again. health_daemon.py warms the
+template up at start. The plots take aggregate arrays (dashboard_data),
+computed with one grouping of the daily and one of the hourly rollups.
+
+Matplotlib is not thread-safe, so the dashboards of several lots are drawn
+in parallel on a process pool (render_dashboards). The workers are forked
+from a server that already imported matplotlib and keep their templates
+for the life of the pool.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from image_export import IMAGE_DPI, IMAGE_FORMAT, TARGET_BYTES, export_figure
+
+# weeks: week_id labels in plot order
+# weekly_hours: (weeks,) occupied hours of all spots per week
+# hourly_hours: (weeks, 24) occupied hours per hour of day, NaN for hours without rollups
+# spot_hours: (weeks, spots) occupied hours per spot
+DashboardData = namedtuple('DashboardData', ['weeks', 'weekly_hours', 'hourly_hours', 'spot_hours'])
+
+# One dashboard to render; stem: output path without the extension
+DashboardJob = namedtuple('DashboardJob', ['data', 'title', 'stem'])
+
+BAR_WIDTH = 0.2
+# Worker processes of the render pool, None for one per core
+RENDER_WORKERS = None
+
+
+def dashboard_data(daily, hourly, selected_weeks, spot_cols):
+    """Aggregates of the dashboard from the daily and hourly frames with a `week_id` column"""
+    weeks = list(selected_weeks)
+    spot_minutes = (daily[daily["week_id"].isin(weeks)]
+                    .groupby("week_id", observed=True)[spot_cols].sum()
+                    .reindex(weeks).to_numpy(dtype=np.float64))
+    hour_minutes = (hourly[hourly["week_id"].isin(weeks)]
+                    .groupby(["week_id", "hour"], observed=True)[spot_cols].sum().sum(axis=1))
+
+    hourly_hours = np.full((len(weeks), 24), np.nan)
+    week_index = {week: i for i, week in enumerate(weeks)}
+    rows = [week_index[week] for week in hour_minutes.index.get_level_values("week_id")]
+    hourly_hours[rows, hour_minutes.index.get_level_values("hour").to_numpy()] = hour_minutes.to_numpy() / 60
+    spot_hours = spot_minutes / 60
+    return DashboardData(weeks, spot_hours.sum(axis=1), hourly_hours, spot_hours)
+
+
+class _Template:
+    """Figure, axes and artists of the dashboard for a number of weeks and spots"""
+
+    def __init__(self, weeks, spots):
+        self.fig = Figure(figsize=(18, 12))
+        FigureCanvasAgg(self.fig)
+        grid = self.fig.add_gridspec(2, 2)
+        self.ax1 = self.fig.add_subplot(grid[0, 0])
+        self.ax2 = self.fig.add_subplot(grid[0, 1])
+        self.ax3 = self.fig.add_subplot(grid[1, :])
+        self.laid_out = False
+
+        # Plot 1: total occupied hours per week
+        self.week_bars = self.ax1.bar(np.arange(weeks), np.zeros(weeks), width=0.5, color='steelblue', alpha=0.8)
+        self.ax1.set_title('Total Occupied Hours by Week', fontweight='bold')
+        self.ax1.set_xlabel('week_id')
+        self.ax1.set_ylabel('Total Hours')
+        self.ax1.set_xticks(np.arange(weeks))
+        self.ax1.tick_params(axis='x', rotation=45)
+
+        # Plot 2: hourly pattern of every week
+        self.lines = [self.ax2.plot([], [], marker='o', linewidth=2)[0] for _ in range(weeks)]
+        self.ax2.set_title('Hourly Occupation Patterns by Week', fontweight='bold')
+        self.ax2.set_xlabel('Hour of Day')
+        self.ax2.set_ylabel('Total Occupied Hours')
+        self.ax2.grid(True, alpha=0.3)
+
+        # Plot 3: occupied hours per spot, one bar per week
+        x_pos = np.arange(spots)
+        self.spot_bars = [self.ax3.bar(x_pos + i * BAR_WIDTH, np.zeros(spots), width=BAR_WIDTH, alpha=0.8)
+                          for i in range(weeks)]
+        self.ax3.set_xlabel('Parking Spot')
+        self.ax3.set_ylabel('Total Occupied Hours')
+        self.ax3.set_title('Total Occupied Hours per Spot - Weekly Comparison', fontsize=14, fontweight='bold')
+        self.ax3.set_xticks(x_pos + BAR_WIDTH * (weeks - 1) / 2)
+        self.ax3.set_xticklabels([f'Spot {i+1}' for i in range(spots)], rotation=45)
+        self.ax3.grid(True, alpha=0.3)
+
+        self.title = self.fig.suptitle('', fontsize=16, fontweight='bold')
+
+    def update(self, data, title):
+        labels = [str(week) for week in data.weeks]
+        for bar, height in zip(self.week_bars, data.weekly_hours):
+            bar.set_height(height)
+        self.ax1.set_xticklabels(labels)
+
+        hours = np.arange(24)
+        for line, label, week_hours in zip(self.lines, labels, data.hourly_hours):
+            observed = ~np.isnan(week_hours)
+            line.set_data(hours[observed], week_hours[observed])
+            line.set_label(label)
+        self.ax2.legend()
+
+        for bars, label, spot_hours in zip(self.spot_bars, labels, data.spot_hours):
+            for bar, height in zip(bars, spot_hours):
+                bar.set_height(height)
+            bars.set_label(label)
+        self.ax3.legend(title='Week')
+
+        for ax in (self.ax1, self.ax2, self.ax3):
+            ax.relim()
+            ax.autoscale_view()
+        self.title.set_text(title)
+        if not self.laid_out:
+            # Labels keep about the same size from run to run, lay out once
+            self.fig.tight_layout(rect=(0, 0, 1, 0.96))
+            self.laid_out = True
+
+
+_templates = {}
+_lock = threading.Lock()
+
+
+def _template(weeks, spots):
+    key = (weeks, spots)
+    if key not in _templates:
+        _templates[key] = _Template(weeks, spots)
+    return _templates[key]
+
+
+def render_dashboard(data, title, stem, fmt=IMAGE_FORMAT, dpi=IMAGE_DPI, target_bytes=TARGET_BYTES):
+    """Draw `data` on the cached template and save it with image_export; returns the ExportedImage"""
+    with _lock:
+        template = _template(len(data.weeks), data.spot_hours.shape[1])
+        template.update(data, title)
+        return export_figure(template.fig, stem, fmt=fmt, dpi=dpi, target_bytes=target_bytes)
+
+
+def warm_up(spots, weeks=4, dpi=IMAGE_DPI):
+    """Build the template and draw it once, so the first real run does not load fonts and set up axes"""
+    data = DashboardData(list(range(weeks)), np.ones(weeks), np.ones((weeks, 24)), np.ones((weeks, spots)))
+    with _lock:
+        template = _template(weeks, spots)
+        template.update(data, '')
+        template.fig.set_dpi(dpi)
+        template.fig.canvas.draw()
+        # Lay out again with the real labels
+        template.laid_out = False
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _workers():
+    return RENDER_WORKERS or os.cpu_count() or 1
+
+
+def render_pool():
+    """Process pool shared by every render_dashboards call in this process"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(['__main__', 'dashboard'])
+            _pool = ProcessPoolExecutor(max_workers=_workers(), mp_context=context)
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def render_dashboards(jobs, fmt=IMAGE_FORMAT, dpi=IMAGE_DPI, target_bytes=TARGET_BYTES):
+    """Render every DashboardJob and return their ExportedImages in order.
+
+    A single dashboard (or any number on a single core) is drawn in this
+    process, several on the render pool.
+    """
+    jobs = list(jobs)
+    if len(jobs) < 2 or _workers() < 2:
+        return [render_dashboard(job.data, job.title, job.stem, fmt, dpi, target_bytes) for job in jobs]
+    futures = [render_pool().submit(render_dashboard, job.data, job.title, job.stem, fmt, dpi, target_bytes)
+               for job in jobs]
+    return [future.result() for future in futures]
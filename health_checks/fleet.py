@@ -0,0 +1,152 @@
+"""Per-device freshness of the tvbox fleet.
+
+Shared by freshness_probe.py and telegrambot_10min.py, standard library only.
+Devices seen before are remembered in fleet_devices.json, so a box that has
+been silent for longer than the query window is still reported.
+
+The alert state (consecutive alerts, devices already reported) is kept in
+fleet_alerts.json, so repeated alerts are capped across runs, and
+next_poll_delay tells the watcher when the next device could go stale.
+"""
+import json
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from bot_common import BASE_DIR, file_lock
+
+FLEET_FILE = f'{BASE_DIR}/fleet_devices.json'
+ALERT_STATE_FILE = f'{BASE_DIR}/fleet_alerts.json'
+# Devices silent for longer than this are dropped from the fleet (retired boxes)
+FORGET_DAYS = 7
+# An alert is repeated this often while the same devices stay stale, at most
+# max_alerts times; a bit under the 10-minute cron period so every run repeats it
+REPEAT_ALERT = timedelta(minutes=9)
+# Bounds of the watcher's polling interval
+MIN_POLL = timedelta(seconds=30)
+MAX_POLL = timedelta(minutes=10)
+# The watcher reports a silent device at most this long after it goes stale;
+# polling right at the crossing would poll more often than the cron job
+MAX_LATENESS = timedelta(minutes=2)
+
+# send: whether to send the stale alert now; recovered: devices reported before that are back
+AlertDecision = namedtuple('AlertDecision', ['send', 'recovered'])
+
+# UTC-3 timezone object
+utc_minus_3 = timezone(timedelta(hours=-3))
+
+
+def update_fleet(last_seen, now, path=FLEET_FILE, exclude_ids=()):
+    """Merge {pi-id: newest time} into the remembered fleet and return the whole fleet.
+
+    Devices that are missing from `last_seen` keep their old time; devices in
+    `exclude_ids` are dropped, also when remembered from before they were excluded.
+    """
+    with file_lock(path + '.lock'):
+        try:
+            with open(path, 'r') as f:
+                fleet_times = {device: datetime.fromisoformat(t) for device, t in json.load(f).items()}
+        except (FileNotFoundError, ValueError):
+            fleet_times = {}
+        for device, t in last_seen.items():
+            if device not in fleet_times or t > fleet_times[device]:
+                fleet_times[device] = t
+        fleet_times = {device: t for device, t in fleet_times.items()
+                       if now - t <= timedelta(days=FORGET_DAYS) and device not in exclude_ids}
+
+        with open(path + '.tmp', 'w') as f:
+            json.dump({device: t.isoformat() for device, t in fleet_times.items()}, f)
+        os.replace(path + '.tmp', path)
+    return fleet_times
+
+
+def stale_devices(fleet_times, now, tolerance):
+    """[(pi-id, minutes since its newest row)] of the devices over `tolerance` minutes, oldest first"""
+    ages = ((device, (now - t).total_seconds() / 60) for device, t in fleet_times.items())
+    return sorted((age for age in ages if age[1] > tolerance), key=lambda age: -age[1])
+
+
+def fleet_message(stale, fleet_times):
+    """One alert listing every stale device"""
+    lines = [f"{len(stale)} of {len(fleet_times)} devices are not sending data:"]
+    for device, minutes in stale:
+        local_timestamp = fleet_times[device].astimezone(utc_minus_3)
+        lines.append(f"{device}: last data {round(minutes, 2)} minutes ago "
+                     f"({local_timestamp.strftime('%Y-%m-%d %H:%M:%S %Z')})")
+    return "\n".join(lines)
+
+
+def _empty_alert_state():
+    return {'consecutive_alerts': 0, 'alerted': [], 'last_alert': None, 'no_data': False}
+
+
+def _should_alert(state, is_new, now, max_alerts):
+    """Alert for something new, else repeat every REPEAT_ALERT up to max_alerts in a row"""
+    last_alert = state['last_alert'] and datetime.fromisoformat(state['last_alert'])
+    send = is_new or (state['consecutive_alerts'] < max_alerts and now - last_alert >= REPEAT_ALERT)
+    if send:
+        state['consecutive_alerts'] = 1 if is_new else state['consecutive_alerts'] + 1
+        state['last_alert'] = now.isoformat()
+    return send
+
+
+def alert_decision(stale, now, max_alerts, path=ALERT_STATE_FILE, no_data=False):
+    """Whether to alert about `stale` ([(pi-id, minutes)]), updating the saved state.
+
+    A device that was not reported yet always triggers an alert. While the
+    same devices stay stale the alert is repeated every REPEAT_ALERT, up to
+    max_alerts in a row; the count starts again once every device is back.
+    no_data: no device sent anything at all, kept as its own flag in the state
+    and alerted the same way (`stale` is ignored).
+    """
+    with file_lock(path + '.lock'):
+        try:
+            with open(path, 'r') as f:
+                state = dict(_empty_alert_state(), **json.load(f))
+        except (FileNotFoundError, ValueError):
+            state = _empty_alert_state()
+
+        if no_data:
+            recovered = []
+            send = _should_alert(state, not state['no_data'], now, max_alerts)
+            state['no_data'] = True
+        else:
+            stale_ids = [device for device, _ in stale]
+            recovered = [device for device in state['alerted'] if device not in stale_ids]
+            if not stale_ids:
+                send = False
+                state = _empty_alert_state()
+            else:
+                if state['no_data']:
+                    # Data is back, but not from every device: alert about those
+                    state['no_data'] = False
+                    state['consecutive_alerts'] = 0
+                send = _should_alert(state, bool(set(stale_ids) - set(state['alerted'])), now, max_alerts)
+                state['alerted'] = stale_ids
+
+        with open(path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(path + '.tmp', path)
+    return AlertDecision(send, recovered)
+
+
+def recovery_message(recovered):
+    return f"Data is arriving again from: {', '.join(recovered)}"
+
+
+def next_poll_delay(fleet_times, now, tolerance, min_poll=MIN_POLL, max_poll=MAX_POLL, lateness=MAX_LATENESS):
+    """Seconds until the first healthy device could be `lateness` past `tolerance` minutes.
+
+    While every device writes steadily that is a bit more than `tolerance`
+    away, so the watcher polls less often than the 10-minute cron job; a
+    device that stops writing is reported at most `lateness` after it goes
+    stale, and the min_poll floor keeps polling tight around that moment.
+    With no healthy device left it only waits for recoveries, every max_poll.
+    """
+    deadline = timedelta(minutes=tolerance) + lateness
+    remaining = [(t + deadline - now).total_seconds() for t in fleet_times.values()]
+    upcoming = [seconds for seconds in remaining if seconds >= 0]
+    if not upcoming:
+        return max_poll.total_seconds()
+    # A device clock ahead of ours does not stretch the interval past one deadline
+    return max(min(min(upcoming), deadline.total_seconds()), min_poll.total_seconds())
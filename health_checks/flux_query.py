@@ -0,0 +1,64 @@
+"""Flux query builder shared by the health check bots.
+
+Filtering, projection and downsampling are pushed down to InfluxDB so only
+the columns and resolution an analysis needs are sent over the network.
+"""
+
+# Columns every bot reads from ic2_parking_twin
+DEFAULT_COLUMNS = ['_time', '_value', 'pi-id']
+
+
+def _flux_string(value):
+    escaped = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def _flux_list(values):
+    return '[' + ', '.join(_flux_string(v) for v in values) + ']'
+
+
+def build_query(bucket,
+                start,
+                stop=None,
+                exclude_ids=None,
+                columns=DEFAULT_COLUMNS,
+                every=None,
+                fn='last',
+                pivot=False,
+                group_by=None,
+                last=False):
+    """Build a Flux query for `bucket`.
+
+    start/stop: Flux durations ("-30d") or RFC3339 timestamps
+    exclude_ids: `pi-id` values dropped on the server
+    columns: passed to keep(); None keeps every column
+    every: aggregateWindow period ("1m", "1h"), aggregated with `fn`
+    pivot: turn each `_field` into its own column
+    group_by: regroup tables by these columns before last(); [] merges them all
+    last: return only the newest row of each table
+    """
+    time_range = f"start: {start}" if stop is None else f"start: {start}, stop: {stop}"
+    lines = [f"from(bucket: {_flux_string(bucket)})",
+             f"|> range({time_range})"]
+
+    if exclude_ids:
+        conditions = ' and '.join(f'r["pi-id"] != {_flux_string(i)}' for i in exclude_ids)
+        lines.append(f"|> filter(fn: (r) => {conditions})")
+
+    if every is not None:
+        lines.append(f"|> aggregateWindow(every: {every}, fn: {fn}, createEmpty: false)")
+
+    if pivot:
+        lines.append('|> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")')
+
+    if columns is not None:
+        lines.append(f"|> keep(columns: {_flux_list(columns)})")
+
+    if group_by is not None:
+        lines.append(f"|> group(columns: {_flux_list(group_by)})")
+
+    if last:
+        # Rows of regrouped tables are not in time order, so pick by _time
+        lines.append('|> max(column: "_time")')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+"""Fast-start freshness probe for ic2_parking_twin.
+
+Same check as telegrambot_10min.py, but it asks InfluxDB only for the newest
+row (like readInflux in parking_spot_api) and parses the few lines of CSV
+with the standard library, so neither pandas nor numpy is imported.
+
+In fleet mode the query is grouped by `pi-id`, so InfluxDB returns the newest
+row of every device and one dead tvbox is no longer hidden by a healthy one.
+The work stays proportional to the number of devices, not rows.
+
+The bucket, org, excluded devices and chat are those of the watched lot in
+lots.py, read again on every check.
+"""
+import csv
+import json
+import sys
+import time
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone, timedelta
+
+import bot_common
+from bot_common import BASE_DIR, INFLUX_TOKEN_FILE, TELEGRAM_TOKEN_FILE, setup_logger, read_token
+from flux_query import build_query
+from fleet import (MIN_POLL, alert_decision, fleet_message, next_poll_delay, recovery_message,
+                   stale_devices, update_fleet)
+from lots import DEFAULT_LOT, DEFAULT_ORG, get_lot
+
+# Setup logging
+log_file = f'{BASE_DIR}/freshness_probe.log'
+logger = setup_logger(__name__, log_file)
+
+# Config
+minutes_tolerance = 10
+request_timeout = 10  # seconds
+# Lot watched by the probe (bucket, org, excluded devices, chat), see lots.py
+watched_lot = DEFAULT_LOT
+# Used when the lot has no chat_id of its own
+chat_id = ""
+# Check every pi-id on its own instead of the bucket as one stream
+fleet = True
+# Alerts in a row while the same devices stay stale
+max_alerts = 10
+
+# UTC-3 timezone object
+utc_minus_3 = timezone(timedelta(hours=-3))
+
+
+def query_csv(query, org=DEFAULT_ORG):
+    """POST a Flux query to /api/v2/query and return the CSV body"""
+    endpoint = f"{bot_common.url}/api/v2/query?" + urllib.parse.urlencode({'org': org})
+    request = urllib.request.Request(endpoint, data=query.encode(), method='POST', headers={
+        'Accept': 'application/csv',
+        'Content-Type': 'application/vnd.flux',
+        'Authorization': f"Token {read_token(INFLUX_TOKEN_FILE)}",
+    })
+    with urllib.request.urlopen(request, timeout=request_timeout) as response:
+        return response.read().decode()
+
+
+def parse_time(value):
+    """Parse an RFC3339 timestamp from InfluxDB, which may carry nanoseconds"""
+    value = value.replace('Z', '+00:00')
+    if '.' in value:
+        head, rest = value.split('.', 1)
+        digits = len(rest) - len(rest.lstrip('0123456789'))
+        value = f"{head}.{rest[:min(digits, 6)]}{rest[digits:]}"
+    return datetime.fromisoformat(value).astimezone(timezone.utc)
+
+
+def _records(body):
+    """Rows of a Flux CSV response as dicts keyed by column name"""
+    header = None
+    for row in csv.reader(body.splitlines()):
+        if not row or row[0].startswith('#'):
+            # Annotations and blank lines start a new table
+            header = None
+            continue
+        if header is None:
+            header = row
+            if 'error' in header:
+                raise RuntimeError(f"InfluxDB query failed: {body.strip()}")
+            continue
+        yield dict(zip(header, row))
+
+
+def parse_last_row(body):
+    """Return (time, value) of the newest row in a Flux CSV response, or None"""
+    newest = None
+    for record in _records(body):
+        row_time = parse_time(record['_time'])
+        if newest is None or row_time > newest[0]:
+            newest = (row_time, int(float(record['_value'])))
+    return newest
+
+
+def parse_last_rows(body):
+    """Return {pi-id: (time, value)} of the newest row of every device"""
+    newest = {}
+    for record in _records(body):
+        row_time = parse_time(record['_time'])
+        device = record['pi-id']
+        if device not in newest or row_time > newest[device][0]:
+            newest[device] = (row_time, int(float(record['_value'])))
+    return newest
+
+
+def probe(lot):
+    """Newest (time, value) in the bucket of `lot` over the last day"""
+    query = build_query(lot.bucket, "-1d", exclude_ids=list(lot.exclude_ids), columns=["_time", "_value"],
+                        group_by=[], last=True)
+    return parse_last_row(query_csv(query, org=lot.org))
+
+
+def probe_fleet(lot):
+    """Newest (time, value) of every pi-id of `lot` over the last day, one row per device"""
+    query = build_query(lot.bucket, "-1d", exclude_ids=list(lot.exclude_ids), columns=["_time", "_value", "pi-id"],
+                        group_by=["pi-id"], last=True)
+    return parse_last_rows(query_csv(query, org=lot.org))
+
+
+def send_message_to_telegram(chat, message):
+    url = f"https://api.telegram.org/bot{read_token(TELEGRAM_TOKEN_FILE)}/sendMessage"
+    data = urllib.parse.urlencode({'chat_id': chat, 'text': message}).encode()
+    try:
+        with urllib.request.urlopen(url, data=data, timeout=request_timeout) as response:
+            logger.info(f"Message sent successfully: {json.load(response).get('ok')}")
+    except OSError as e:
+        logger.info(f"Failed to send message: {e}")
+
+
+def check_fleet(lot=None):
+    """One fleet check; returns the newest time of every known device and the check time"""
+    # Read lots.json on every check, so a bad entry fails this check only
+    lot = lot or get_lot(watched_lot)
+    chat = lot.chat_id or chat_id
+    started = time.monotonic()
+    newest = probe_fleet(lot)
+    now = datetime.now(timezone.utc)
+    fleet_times = update_fleet({device: t for device, (t, _) in newest.items()}, now, exclude_ids=lot.exclude_ids)
+    logger.info(f"{len(newest)} devices reported in the last day, {len(fleet_times)} known, "
+                f"probe took {time.monotonic() - started:.3f} s")
+    if not fleet_times:
+        logger.error("No data in the last day")
+        if alert_decision([], now, max_alerts, no_data=True).send:
+            send_message_to_telegram(chat, "No device is sending data. No data was received in the last day.")
+        return fleet_times, now
+
+    stale = stale_devices(fleet_times, now, minutes_tolerance)
+    decision = alert_decision(stale, now, max_alerts)
+    if decision.recovered:
+        send_message_to_telegram(chat, recovery_message(decision.recovered))
+    if decision.send:
+        logger.info(f"Stale devices: {', '.join(device for device, _ in stale)} — sending alert.")
+        send_message_to_telegram(chat, fleet_message(stale, fleet_times))
+    elif stale:
+        logger.info(f"Stale devices: {', '.join(device for device, _ in stale)}, already reported.")
+    else:
+        logger.info("Every device is within tolerance.")
+    return fleet_times, now
+
+
+def watch():
+    """Keep checking the fleet, polling only as often as the device times require"""
+    logger.info("Watching the fleet")
+    while True:
+        try:
+            fleet_times, now = check_fleet()
+            delay = next_poll_delay(fleet_times, now, minutes_tolerance)
+        except Exception as e:
+            logger.error(f"Fleet check failed: {e}")
+            delay = MIN_POLL.total_seconds()
+        logger.info(f"Next check in {delay:.0f} s")
+        time.sleep(delay)
+
+
+def main(lot=None):
+    lot = lot or get_lot(watched_lot)
+    chat = lot.chat_id or chat_id
+    if fleet:
+        return check_fleet(lot)
+    started = time.monotonic()
+    newest = probe(lot)
+    if newest is None:
+        logger.error("No data in the last day")
+        send_message_to_telegram(chat, "Pi 3 is not sending data. No data was received in the last day.")
+        return
+
+    timestamp, last_value = newest
+    with open("last_timestamp.txt", "w") as f:
+        f.write(str(timestamp))
+
+    now = datetime.now(timezone.utc)
+    minutes_diff = (now - timestamp).total_seconds() / 60
+    logger.info(f"Timestamp from server: {timestamp}, value {last_value}")
+    logger.info(f"Difference: {minutes_diff:.2f} minutes, probe took {time.monotonic() - started:.3f} s")
+
+    if minutes_diff > minutes_tolerance:
+        logger.info("Timestamp too old — sending alert.")
+        local_timestamp = timestamp.astimezone(utc_minus_3)
+        send_message_to_telegram(
+            chat,
+            f"Pi 3 is not sending data. "
+            f"Last data was received {round(minutes_diff, 2)} minutes ago.\n"
+            f"Last timestamp: {local_timestamp.strftime('%Y-%m-%d %H:%M:%S %Z')}"
+        )
+    else:
+        logger.info("Timestamp is within tolerance.")
+
+
+if __name__ == "__main__":
+    # --watch: stay resident and poll adaptively instead of one check per cron run
+    watch() if '--watch' in sys.argv[1:] else main()
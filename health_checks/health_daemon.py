@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+"""Resident scheduler for the health check bots.
+
+Replaces the three cron entries: pandas, numpy, matplotlib and
+influxdb_client are imported once and the bots share one InfluxDB client
+and one HTTP session (see bot_common). The freshness check runs on its own
+lane so a slow anomaly or dashboard job never delays it; the two heavy jobs
+share a second lane so they never overlap each other. The dashboard figure
+is built at start (dashboard.warm_up). A job that is still
+running when it comes due again is skipped for that tick.
+"""
+import signal
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import bot_common
+from bot_common import BASE_DIR, setup_logger
+import telegrambot_10min
+import telegrambot_1hour
+import telegrambot_1day
+
+log_file = f'{BASE_DIR}/health_daemon.log'
+logger = setup_logger(__name__, log_file)
+
+# (name, lane, interval, entry point), same cadence as the old crontab:
+# */10 * * * *, 0 * * * * and 0 0 * * *
+JOBS = [
+    ('freshness', 'fast', timedelta(minutes=10), telegrambot_10min.main),
+    ('daily_anomaly', 'heavy', timedelta(hours=1), telegrambot_1hour.main),
+    ('weekly_dashboard', 'heavy', timedelta(days=1), telegrambot_1day.main),
+]
+
+
+def next_run(interval, now=None):
+    """Next local wall-clock time aligned to `interval`, like cron would fire"""
+    now = now or datetime.now()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    elapsed = now - midnight
+    periods = elapsed // interval + 1
+    return midnight + periods * interval
+
+
+class Lane(threading.Thread):
+    """Runs its jobs one at a time, each at its own interval"""
+
+    def __init__(self, name, jobs, stop_event):
+        super().__init__(name=f'lane-{name}', daemon=True)
+        self.jobs = jobs
+        self.stop_event = stop_event
+        self.due = {job_name: next_run(interval) for job_name, _, interval, _ in jobs}
+
+    def run(self):
+        while not self.stop_event.is_set():
+            job_name, interval, entry = min(
+                ((job_name, interval, entry) for job_name, _, interval, entry in self.jobs),
+                key=lambda job: self.due[job[0]])
+            wait = (self.due[job_name] - datetime.now()).total_seconds()
+            if wait > 0 and self.stop_event.wait(wait):
+                break
+
+            started = time.monotonic()
+            logger.info(f"Running {job_name}")
+            try:
+                entry()
+            except BaseException:
+                logger.error(f"{job_name} failed:\n{traceback.format_exc()}")
+            logger.info(f"{job_name} finished in {time.monotonic() - started:.1f} s")
+
+            # Skip the ticks missed while this job (or its lane mate) was running
+            now = datetime.now()
+            for name, _, job_interval, _ in self.jobs:
+                if self.due[name] <= now:
+                    if name != job_name:
+                        logger.info(f"{name} was due during {job_name}, running it now")
+                        continue
+                    self.due[name] = next_run(job_interval, now)
+
+
+def main():
+    stop_event = threading.Event()
+
+    def stop(signum, frame):
+        logger.info(f"Received signal {signum}, stopping")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Build the dashboard figure now rather than at midnight; a bad lots.json
+    # only fails the jobs that read it
+    try:
+        telegrambot_1day.warm_up()
+    except Exception:
+        logger.error(f"Dashboard warm-up failed:\n{traceback.format_exc()}")
+
+    lanes = {}
+    for job in JOBS:
+        lanes.setdefault(job[1], []).append(job)
+    threads = [Lane(name, jobs, stop_event) for name, jobs in lanes.items()]
+    for thread in threads:
+        logger.info(f"Starting {thread.name}: " + ', '.join(
+            f"{name} next at {thread.due[name]:%Y-%m-%d %H:%M}" for name, _, _, _ in thread.jobs))
+        thread.start()
+
+    while not stop_event.wait(1):
+        pass
+    bot_common.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Size-optimized export of the dashboard figures.
+
+The images are sent over the TV box's uplink every night, so they are kept
+small. Charts have few colours: a palette PNG (quantized, optimize=True) is
+about a third of matplotlib's default RGBA PNG and stays sharp. JPEG and WebP
+are lossy; the highest quality under `target_bytes` is searched for. When an
+image is still too big, the figure is rendered again at a lower DPI.
+"""
+import io
+import logging
+import os
+from collections import namedtuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# 'png', 'jpeg' or 'webp'
+IMAGE_FORMAT = 'png'
+IMAGE_DPI = 100
+# Largest image sent, None for no limit
+TARGET_BYTES = 200 * 1024
+MIN_DPI = 50
+PNG_COLORS = 256
+MIN_QUALITY, MAX_QUALITY = 30, 95
+
+EXTENSIONS = {'png': 'png', 'jpeg': 'jpg', 'webp': 'webp'}
+
+# quality: None for PNG
+ExportedImage = namedtuple('ExportedImage', ['path', 'format', 'dpi', 'quality', 'nbytes'])
+
+
+def _render(fig, dpi):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi)
+    buffer.seek(0)
+    return Image.open(buffer).convert('RGB')
+
+
+def _encode(image, fmt, quality=None):
+    buffer = io.BytesIO()
+    if fmt == 'png':
+        image.quantize(colors=PNG_COLORS, method=Image.Quantize.MEDIANCUT).save(buffer, format='PNG', optimize=True)
+    else:
+        image.save(buffer, format=fmt.upper(), quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def _best_quality(image, fmt, target_bytes):
+    """Highest quality whose encoding fits target_bytes, else the lowest one"""
+    low, high = MIN_QUALITY, MAX_QUALITY
+    best = None
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode(image, fmt, quality)
+        if target_bytes is None or len(data) <= target_bytes:
+            best = quality, data
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best or (MIN_QUALITY, _encode(image, fmt, MIN_QUALITY))
+
+
+def export_figure(fig, stem, fmt=IMAGE_FORMAT, dpi=IMAGE_DPI, target_bytes=TARGET_BYTES):
+    """Save `fig` to `stem` plus the format's extension and return an ExportedImage"""
+    if fmt not in EXTENSIONS:
+        raise ValueError(f"Unknown image format {fmt}, expected one of {', '.join(EXTENSIONS)}")
+    while True:
+        image = _render(fig, dpi)
+        if fmt == 'png':
+            quality, data = None, _encode(image, fmt)
+        else:
+            quality, data = _best_quality(image, fmt, target_bytes)
+        if target_bytes is None or len(data) <= target_bytes or dpi <= MIN_DPI:
+            break
+        logger.info(f"{fmt} at {dpi} dpi is {len(data)} bytes, over {target_bytes}, lowering the dpi")
+        dpi = max(MIN_DPI, int(dpi * 0.8))
+
+    path = f"{stem}.{EXTENSIONS[fmt]}"
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+    logger.info(f"Saved {path}: {len(data)} bytes, {image.width}x{image.height} at {dpi} dpi"
+                + (f", quality {quality}" if quality is not None else ""))
+    return ExportedImage(path, fmt, dpi, quality, len(data))
@@ -0,0 +1,201 @@
+"""Incremental on-disk cache of an InfluxDB bucket.
+
+Rows are stored as one compressed .npz segment per UTC day plus a small JSON
+file with the high-water mark (newest cached `_time`) and the oldest instant
+the cache covers. Each run only asks InfluxDB for rows newer than the
+high-water mark, minus a small overlap so late writes are not missed.
+
+Masks of lots with more than 64 spots are stored as `value_words` uint64
+words per row and read back as Python ints, as to_frame gives them.
+"""
+import json
+import logging
+import os
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from bot_common import BASE_DIR, file_lock
+from flux_query import DEFAULT_COLUMNS, build_query
+from influx_stream import MEMORY_BUDGET_MB, stream_rows, to_frame
+from spots import mask_ints, mask_words
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = f'{BASE_DIR}/influx_cache'
+CACHE_COLUMNS = DEFAULT_COLUMNS
+# Longest window any bot asks for (telegrambot_1day.py), so a shorter run
+# never prunes days a longer one still needs
+CACHE_RETENTION_DAYS = 40
+META_FILE = 'meta.json'
+LOCK_FILE = '.lock'
+
+
+def _segment_path(cache_dir, day):
+    return os.path.join(cache_dir, f"{day.isoformat()}.npz")
+
+
+def _segment_days(cache_dir):
+    days = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.npz'):
+            days.append(pd.Timestamp(name[:-4]).date())
+    return sorted(days)
+
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, META_FILE), 'r') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None, None, None, None
+    return (pd.Timestamp(meta['high_water_mark'], tz='UTC'),
+            pd.Timestamp(meta['covered_from'], tz='UTC'),
+            meta.get('exclude_ids'),
+            meta.get('value_words', 1))
+
+
+def _write_meta(cache_dir, high_water_mark, covered_from, exclude_ids, value_words):
+    path = os.path.join(cache_dir, META_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'high_water_mark': high_water_mark.value,
+                   'covered_from': covered_from.value,
+                   'exclude_ids': exclude_ids,
+                   'value_words': value_words}, f)
+    os.replace(path + '.tmp', path)
+
+
+def _read_segment(path):
+    with np.load(path, allow_pickle=False) as seg:
+        values = seg['_value']
+        return pd.DataFrame({
+            '_time': pd.to_datetime(seg['_time'], unit='ns', utc=True),
+            '_value': values if values.ndim == 1 else mask_ints(values),
+            'pi-id': seg['pi-id'],
+        })
+
+
+def _write_segment(path, df, value_words=1):
+    values = df['_value'].to_numpy()
+    if value_words > 1:
+        values = mask_words(values, value_words)
+    with open(path + '.tmp', 'wb') as f:
+        np.savez_compressed(
+            f,
+            _time=df['_time'].to_numpy(dtype='datetime64[ns]').view(np.int64),
+            _value=values,
+            **{'pi-id': df['pi-id'].to_numpy(dtype=str)},
+        )
+    os.replace(path + '.tmp', path)
+
+
+def _clear(cache_dir):
+    for day in _segment_days(cache_dir):
+        os.remove(_segment_path(cache_dir, day))
+
+
+def _append(cache_dir, new_rows, value_words):
+    days = new_rows['_time'].dt.date
+    for day, rows in new_rows.groupby(days):
+        path = _segment_path(cache_dir, day)
+        if os.path.exists(path):
+            rows = pd.concat([_read_segment(path), rows], ignore_index=True)
+        rows = (rows.drop_duplicates(subset=['_time', 'pi-id'], keep='last')
+                    .sort_values('_time'))
+        _write_segment(path, rows, value_words)
+
+
+def _prune(cache_dir, oldest_day):
+    for day in _segment_days(cache_dir):
+        if day < oldest_day:
+            os.remove(_segment_path(cache_dir, day))
+
+
+def refresh_cache(query_api, bucket, days, org="",
+                  exclude_ids=None,
+                  cache_dir=CACHE_DIR,
+                  retention_days=CACHE_RETENTION_DAYS,
+                  overlap=timedelta(minutes=10),
+                  memory_budget_mb=MEMORY_BUDGET_MB,
+                  value_words=1):
+    """Bring the cache of the last `days` days of `bucket` up to date and return its high-water mark.
+
+    Only rows newer than the cached high-water mark are queried from InfluxDB,
+    and rows from `exclude_ids` are filtered out on the server. The response
+    is streamed into typed buffers instead of going through query_data_frame.
+    value_words: uint64 words per `_value` (spots.word_count of the lot)
+    Returns None when the bucket has no rows in the window.
+    """
+    days = int(days)
+    exclude_ids = sorted(exclude_ids or [])
+    now = pd.Timestamp.now(tz='UTC')
+    window_start = now - pd.Timedelta(days=days)
+
+    with file_lock(os.path.join(cache_dir, LOCK_FILE)):
+        high_water_mark, covered_from, cached_excludes, cached_words = _read_meta(cache_dir)
+
+        if (high_water_mark is None
+                or covered_from > window_start
+                or high_water_mark < window_start
+                or cached_excludes != exclude_ids
+                or cached_words != value_words):
+            logger.info(f"Cache miss for {bucket}, fetching the full {days}d window")
+            _clear(cache_dir)
+            high_water_mark = None
+            start = f"-{days}d"
+            covered_from = window_start
+        else:
+            fetch_from = high_water_mark - pd.Timedelta(overlap)
+            logger.info(f"Cache hit for {bucket}, fetching rows since {fetch_from}")
+            start = fetch_from.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+        query = build_query(bucket, start, exclude_ids=exclude_ids, columns=CACHE_COLUMNS)
+        new_rows = to_frame(stream_rows(query_api, query, org=org,
+                                        exclude_ids=exclude_ids,
+                                        value_words=value_words,
+                                        memory_budget_mb=memory_budget_mb))
+        logger.info(f"Fetched {len(new_rows)} new rows from {bucket}")
+
+        if not new_rows.empty:
+            _append(cache_dir, new_rows, value_words)
+            high_water_mark = max(new_rows['_time'].max(),
+                                  high_water_mark if high_water_mark is not None else new_rows['_time'].max())
+
+        retention_start = now - pd.Timedelta(days=max(days, retention_days))
+        _prune(cache_dir, retention_start.date())
+        covered_from = max(covered_from, pd.Timestamp(retention_start.date(), tz='UTC'))
+        if high_water_mark is not None:
+            _write_meta(cache_dir, high_water_mark, covered_from, exclude_ids, value_words)
+    return high_water_mark
+
+
+def read_cache(start, stop=None, cache_dir=CACHE_DIR):
+    """Cached rows with start <= `_time` < stop (UTC timestamps), reading only the segments in range"""
+    with file_lock(os.path.join(cache_dir, LOCK_FILE)):
+        segments = [_read_segment(_segment_path(cache_dir, day))
+                    for day in _segment_days(cache_dir)
+                    if day >= start.date() and (stop is None or day <= stop.date())]
+
+    if not segments:
+        return pd.DataFrame(columns=CACHE_COLUMNS)
+    df = pd.concat(segments, ignore_index=True)
+    keep = df['_time'] >= start
+    if stop is not None:
+        keep &= df['_time'] < stop
+    return df[keep].reset_index(drop=True)
+
+
+def cache_covers(start, exclude_ids=None, cache_dir=CACHE_DIR, value_words=1):
+    """True when the cache holds every row since `start` (a UTC timestamp) with the same
+    `exclude_ids` and `value_words`"""
+    with file_lock(os.path.join(cache_dir, LOCK_FILE)):
+        high_water_mark, covered_from, cached_excludes, cached_words = _read_meta(cache_dir)
+    return (high_water_mark is not None and covered_from <= start
+            and cached_excludes == sorted(exclude_ids or []) and cached_words == value_words)
+
+
+def fetch_cached(query_api, bucket, days, org="", exclude_ids=None, cache_dir=CACHE_DIR, **kwargs):
+    """Return the last `days` days of `bucket` with `_time`, `_value` and `pi-id`, see refresh_cache"""
+    refresh_cache(query_api, bucket, days, org=org, exclude_ids=exclude_ids, cache_dir=cache_dir, **kwargs)
+    return read_cache(pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=int(days)), cache_dir=cache_dir)
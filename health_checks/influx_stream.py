@@ -0,0 +1,215 @@
+"""Bounded-memory ingestion of Flux query results.
+
+query_data_frame keeps the whole annotated CSV response as one object-dtype
+DataFrame before anything is filtered. Here the response from query_raw is
+parsed a chunk of rows at a time: rows outside the time window or from
+excluded devices are dropped straight away and the rest is appended to
+typed NumPy buffers (int64 times and values, int16 device codes and,
+optionally, the decoded uint8 spot matrix). Lots of more than 64 spots write
+`_value` as a decimal string; it is kept as `value_words` uint64 words per
+row (spots.mask_words) and handed on as Python ints by to_frame.
+
+The memory budget only sizes the parse chunk, whose rows are still Python
+strings. The output buffers are the result itself, 18 bytes per row (8 more
+per extra value word) plus one per spot with the spot matrix, twice that
+while a buffer grows, and are not capped by it; a run that ends above the
+budget is logged as a warning. 90 days of 4 devices stay well under the
+default budget, see tests/test_influx_stream.py.
+"""
+import codecs
+import csv
+import logging
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from influxdb_client.client.flux_csv_parser import FluxQueryException
+
+from spots import decode_spots, mask_ints, mask_words, word_count
+
+logger = logging.getLogger(__name__)
+
+# Peak RSS the parse chunk is sized for, for the 2 GB TV box (see above)
+MEMORY_BUDGET_MB = 256
+# Rough cost of one row while it is still a list of Python strings
+ROW_PARSE_BYTES = 600
+MIN_CHUNK_ROWS = 1_000
+MAX_CHUNK_ROWS = 50_000
+
+# values: int64, or (rows, value_words) uint64 masks for more than 64 spots
+StreamedRows = namedtuple('StreamedRows', ['times', 'values', 'device_codes', 'device_ids', 'spots'])
+
+
+def rss_bytes():
+    """Current resident set size of this process"""
+    with open('/proc/self/statm', 'r') as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def chunk_rows_for_budget(memory_budget_mb):
+    """Rows to parse per chunk so the parse lists fit in the remaining budget"""
+    headroom = memory_budget_mb * 2**20 - rss_bytes()
+    # Half of the headroom is left for the growing output buffers
+    return int(np.clip(headroom // 2 // ROW_PARSE_BYTES, MIN_CHUNK_ROWS, MAX_CHUNK_ROWS))
+
+
+class _Buffer:
+    """Growable typed array, doubling its capacity like a list does"""
+
+    def __init__(self, dtype, width=None, capacity=MIN_CHUNK_ROWS):
+        shape = (capacity,) if width is None else (capacity, width)
+        self.data = np.empty(shape, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        needed = self.size + len(values)
+        if needed > len(self.data):
+            grown = np.empty((max(needed, 2 * len(self.data)),) + self.data.shape[1:], dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = values
+        self.size = needed
+
+    def array(self):
+        return self.data[:self.size]
+
+
+def _parse_times(strings):
+    # Flux always answers in UTC; numpy parses RFC3339 once the "Z" is gone
+    return np.array([s[:-1] if s.endswith('Z') else s for s in strings],
+                    dtype='datetime64[ns]').view(np.int64)
+
+
+def _parse_values(strings, datatype, value_words=1):
+    if value_words > 1:
+        return mask_words(strings if datatype != 'double' else [int(float(s)) for s in strings], value_words)
+    if datatype == 'double':
+        return np.array(strings, dtype=np.float64).astype(np.int64)
+    if datatype in ('unsignedLong', 'string'):
+        # Keep all 64 bits of a 64-spot mask, pack_masks reads them back as unsigned
+        return np.array(strings, dtype=np.uint64).view(np.int64)
+    return np.array(strings, dtype=np.int64)
+
+
+def stream_rows(query_api, query, org="",
+                start=None, stop=None,
+                exclude_ids=None,
+                bit_length=None,
+                value_words=None,
+                memory_budget_mb=MEMORY_BUDGET_MB):
+    """Run `query` and ingest its `_time`, `_value` and `pi-id` chunk by chunk.
+
+    start/stop: optional pandas Timestamps, rows outside [start, stop) are dropped
+    exclude_ids: `pi-id` values to drop
+    bit_length: if given, `_value` is also decoded into a uint8 spot matrix
+    value_words: uint64 words per `_value`, spots.word_count of the lot's spot
+    count; by default that of bit_length, else 1
+    """
+    start_ns = None if start is None else pd.Timestamp(start).value
+    stop_ns = None if stop is None else pd.Timestamp(stop).value
+    exclude_ids = set(exclude_ids or [])
+    chunk_rows = chunk_rows_for_budget(memory_budget_mb)
+    logger.info(f"Streaming query in chunks of {chunk_rows} rows (budget {memory_budget_mb} MB)")
+
+    if value_words is None:
+        value_words = word_count(bit_length) if bit_length else 1
+
+    times = _Buffer(np.int64)
+    values = _Buffer(np.int64) if value_words == 1 else _Buffer(np.uint64, width=value_words)
+    device_codes = _Buffer(np.int16)
+    spots = _Buffer(np.uint8, width=bit_length) if bit_length else None
+    device_ids = []
+    device_index = {}
+
+    def flush(rows, datatype):
+        if not rows:
+            return
+        time_col, value_col, id_col = zip(*rows)
+        chunk_times = _parse_times(time_col)
+        keep = np.ones(len(rows), dtype=bool)
+        if start_ns is not None:
+            keep &= chunk_times >= start_ns
+        if stop_ns is not None:
+            keep &= chunk_times < stop_ns
+
+        codes = np.empty(len(rows), dtype=np.int16)
+        for i, device in enumerate(id_col):
+            code = device_index.get(device)
+            if code is None:
+                code = device_index[device] = len(device_ids)
+                device_ids.append(device)
+            codes[i] = code
+        if exclude_ids:
+            excluded = [device_index[d] for d in exclude_ids if d in device_index]
+            keep &= ~np.isin(codes, excluded)
+
+        chunk_values = _parse_values([v for v, k in zip(value_col, keep) if k], datatype, value_words)
+        times.extend(chunk_times[keep])
+        values.extend(chunk_values)
+        device_codes.extend(codes[keep])
+        if spots is not None:
+            spots.extend(decode_spots(chunk_values, bit_length))
+
+    response = query_api.query_raw(query, org=org)
+    try:
+        reader = csv.reader(codecs.iterdecode(response, 'utf-8'))
+        columns = None
+        datatypes = []
+        value_type = 'long'
+        pending = []
+        for row in reader:
+            if not row or (len(row) == 1 and not row[0]):
+                continue
+            if row[0] == '#datatype':
+                datatypes = row
+                columns = None
+                continue
+            if row[0].startswith('#'):
+                continue
+            if columns is None:
+                columns = row
+                if 'error' in columns:
+                    error = next(reader)
+                    raise FluxQueryException(message=error[columns.index('error')],
+                                             reference=error[columns.index('reference')])
+                time_i = columns.index('_time')
+                value_i = columns.index('_value')
+                id_i = columns.index('pi-id') if 'pi-id' in columns else None
+                new_type = datatypes[value_i] if datatypes else 'long'
+                if new_type != value_type:
+                    flush(pending, value_type)
+                    pending = []
+                    value_type = new_type
+                continue
+            if not row[value_i]:
+                continue
+            pending.append((row[time_i], row[value_i], row[id_i] if id_i is not None else ''))
+            if len(pending) >= chunk_rows:
+                flush(pending, value_type)
+                pending = []
+        flush(pending, value_type)
+    finally:
+        response.close()
+
+    rss_mb = rss_bytes() / 2**20
+    logger.info(f"Streamed {times.size} rows, peak chunk {chunk_rows} rows, RSS {rss_mb:.0f} MB")
+    if rss_mb > memory_budget_mb:
+        logger.warning(f"RSS {rss_mb:.0f} MB is over the {memory_budget_mb} MB budget after {times.size} rows")
+    return StreamedRows(times=times.array(),
+                        values=values.array(),
+                        device_codes=device_codes.array(),
+                        device_ids=device_ids,
+                        spots=spots.array() if spots is not None else None)
+
+
+def to_frame(rows):
+    """DataFrame with the `_time`, `_value` and `pi-id` columns query_data_frame would give;
+    masks of more than 64 spots are Python ints"""
+    return pd.DataFrame({
+        '_time': pd.to_datetime(rows.times, unit='ns', utc=True),
+        '_value': rows.values if rows.values.ndim == 1 else mask_ints(rows.values),
+        'pi-id': pd.Categorical.from_codes(rows.device_codes, categories=rows.device_ids).remove_unused_categories()
+                 if rows.device_ids else pd.Categorical([]),
+    })
@@ -0,0 +1,122 @@
+"""Runs a bot's per-lot pipeline for every configured lot at once.
+
+Fetching, decoding and analysing a lot mostly waits on InfluxDB, so the lots
+run on a thread pool and a new lot adds little to the wall-clock time of a
+run. The queries of all lots share `max_queries` slots, so the server never
+sees more than that many at once whatever the number of lots; a streamed
+query_raw response keeps its slot until it is closed. Every lot's run time,
+and how much of it was spent in queries and waiting for a slot, is returned
+for the bot's log (timings_table).
+"""
+import threading
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from bot_common import influx_client
+
+# Lots processed at the same time
+MAX_LOT_WORKERS = 8
+# InfluxDB queries in flight at the same time, over all lots
+MAX_INFLUX_QUERIES = 4
+
+# result: what the pipeline returned, None when it raised (error: the traceback)
+# seconds: wall-clock time of the lot; wait_seconds: waiting for a query slot;
+# query_seconds: queries holding a slot
+LotRun = namedtuple('LotRun', ['lot', 'result', 'error', 'seconds', 'queries', 'wait_seconds', 'query_seconds'])
+
+
+class _BoundedResponse:
+    """Streamed query_raw response that gives its query slot back when closed"""
+
+    def __init__(self, response, release):
+        self._response = response
+        self._release = release
+
+    def __iter__(self):
+        return iter(self._response)
+
+    def read(self, *args, **kwargs):
+        return self._response.read(*args, **kwargs)
+
+    def close(self):
+        try:
+            self._response.close()
+        finally:
+            self._release()
+
+
+class BoundedQueryApi:
+    """query_api of one lot: every query first takes one of the shared `slots`"""
+
+    def __init__(self, query_api, slots):
+        self.query_api = query_api
+        self.slots = slots
+        self.queries = 0
+        self.wait_seconds = 0.0
+        self.query_seconds = 0.0
+
+    def _acquire(self):
+        started = time.monotonic()
+        self.slots.acquire()
+        acquired = time.monotonic()
+        self.queries += 1
+        self.wait_seconds += acquired - started
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.query_seconds += time.monotonic() - acquired
+                self.slots.release()
+        return release
+
+    def query_raw(self, query, org=None, **kwargs):
+        release = self._acquire()
+        try:
+            return _BoundedResponse(self.query_api.query_raw(query, org=org, **kwargs), release)
+        except BaseException:
+            release()
+            raise
+
+    def query_data_frame(self, query, org=None, **kwargs):
+        release = self._acquire()
+        try:
+            return self.query_api.query_data_frame(query, org=org, **kwargs)
+        finally:
+            release()
+
+
+def run_lots(lots, pipeline, workers=MAX_LOT_WORKERS, max_queries=MAX_INFLUX_QUERIES, query_api=None):
+    """Run pipeline(query_api, lot) for every lot on a thread pool and return their LotRuns in order.
+
+    A lot that raises does not stop the others, its LotRun has the traceback.
+    """
+    lots = list(lots)
+    query_api = query_api or influx_client().query_api()
+    slots = threading.BoundedSemaphore(max_queries)
+
+    def run(lot):
+        bounded = BoundedQueryApi(query_api, slots)
+        started = time.monotonic()
+        result = error = None
+        try:
+            result = pipeline(bounded, lot)
+        except Exception:
+            error = traceback.format_exc()
+        return LotRun(lot, result, error, time.monotonic() - started,
+                      bounded.queries, bounded.wait_seconds, bounded.query_seconds)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(lots))), thread_name_prefix='lot') as pool:
+        return list(pool.map(run, lots))
+
+
+def timings_table(runs):
+    """One line per LotRun with its time, queries and time waiting for a query slot"""
+    lines = [f"{'lot':12s} {'status':6s} {'total':>8s} {'queries':>7s} {'in queries':>10s} {'waiting':>8s}"]
+    for lot_run in runs:
+        lines.append(f"{lot_run.lot.name:12s} {'failed' if lot_run.error else 'ok':6s} {lot_run.seconds:7.2f}s "
+                     f"{lot_run.queries:7d} {lot_run.query_seconds:9.2f}s {lot_run.wait_seconds:7.2f}s")
+    return "\n".join(lines)
@@ -0,0 +1,103 @@
+"""Parking lot configuration.
+
+The bots default to the IC2 lot. Other lots, or a different spot count or
+set of special spots, go in /home/unicamp/photo_collection/lots.json:
+
+    {"ic2": {"bucket": "ic2_parking_twin", "spot_count": 16, "special_mask": "0b0"},
+     "p2": {"bucket": "p2_parking", "spot_count": 40, "org": "Unicamp",
+            "exclude_ids": ["tvbox-e10-04"], "chat_id": "-100123"}}
+
+`special_mask` uses the same bit order as `_value` (the MSB is spot_1); a set
+bit marks a special spot, which is left out of car counts and anomaly alerts.
+It can be an integer or a "0b"/"0x" string. Lots of more than 64 spots
+write `_value` as a decimal string, which the bots keep as several 64-bit
+words (spots.word_count), like parking_spot_api reads it with math/big.
+`max_gap_minutes` is how long a
+reading holds when no newer one arrives; raise it for devices that only
+report state changes (plus a keepalive at least that often). `org` and
+`exclude_ids` (devices left out, filtered on the InfluxDB side) default to
+the IC2 ones; reports go to `chat_id`, or to the bot's chat when it is not set.
+
+Files a bot keeps per lot (InfluxDB cache, rollups, ...) stay where they
+were for the default lot and go under /home/unicamp/photo_collection/lots/<name>/
+for the others, see lot_path.
+"""
+import json
+import logging
+import os
+from collections import namedtuple
+
+from bot_common import BASE_DIR
+
+logger = logging.getLogger(__name__)
+
+LOTS_FILE = f'{BASE_DIR}/lots.json'
+LOTS_DIR = f'{BASE_DIR}/lots'
+DEFAULT_LOT = 'ic2'
+
+DEFAULT_ORG = 'Unicamp'
+DEFAULT_EXCLUDE_IDS = ('tvbox-tx2-07', 'tvbox-e10-01', 'tvbox-e10-02', 'tvbox-e10-03')
+
+# chat_id: None for the chat configured in the bot
+Lot = namedtuple('Lot', ['name', 'bucket', 'spot_count', 'special_mask', 'max_gap_minutes',
+                         'org', 'exclude_ids', 'chat_id'],
+                 defaults=(DEFAULT_ORG, DEFAULT_EXCLUDE_IDS, None))
+
+DEFAULT_LOTS = {
+    DEFAULT_LOT: Lot(DEFAULT_LOT, 'ic2_parking_twin', 16, 0, 10),
+}
+
+
+def _parse_mask(value):
+    return int(value, 0) if isinstance(value, str) else int(value)
+
+
+def load_lots(path=LOTS_FILE):
+    """Lots by name: the defaults, updated with the entries of `path` if it exists"""
+    lots = dict(DEFAULT_LOTS)
+    try:
+        with open(path, 'r') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return lots
+
+    for name, entry in config.items():
+        base = lots.get(name, Lot(name, None, None, 0, 10))
+        bucket = entry.get('bucket', base.bucket)
+        spot_count = entry.get('spot_count', base.spot_count)
+        if bucket is None or spot_count is None or int(spot_count) < 1:
+            raise ValueError(f"Lot {name} in {path} needs a bucket and a positive spot_count")
+        chat_id = entry.get('chat_id', base.chat_id)
+        lot = Lot(name, bucket, int(spot_count),
+                  _parse_mask(entry.get('special_mask', base.special_mask)),
+                  float(entry.get('max_gap_minutes', base.max_gap_minutes)),
+                  entry.get('org', base.org),
+                  tuple(entry.get('exclude_ids', base.exclude_ids)),
+                  str(chat_id) if chat_id is not None else None)
+        if lot.special_mask >> lot.spot_count:
+            raise ValueError(f"special_mask of lot {name} has bits above its {lot.spot_count} spots")
+        lots[name] = lot
+    logger.info(f"Loaded {len(config)} lots from {path}")
+    return lots
+
+
+def get_lot(name, path=LOTS_FILE):
+    return load_lots(path)[name]
+
+
+def select_lots(names=None, path=LOTS_FILE):
+    """The lots called `names`, in that order, or every configured lot"""
+    lots = load_lots(path)
+    return [lots[name] for name in names] if names else list(lots.values())
+
+
+def special_spots(lot):
+    """1-based numbers of the special spots of `lot`"""
+    return [i + 1 for i in range(lot.spot_count) if lot.special_mask >> (lot.spot_count - 1 - i) & 1]
+
+
+def lot_path(lot, path):
+    """Where `lot` keeps the file or directory `path` (a path under BASE_DIR)"""
+    if lot.name == DEFAULT_LOT:
+        return path
+    return os.path.join(LOTS_DIR, lot.name, os.path.relpath(path, BASE_DIR))
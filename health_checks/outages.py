@@ -0,0 +1,126 @@
+"""Data outage scanner for the 10-minute bot.
+
+Every run computes the time between consecutive readings of each `pi-id` over
+all the rows it got, in one pass, and merges consecutive gaps into outage
+intervals. The newest reading of every device and the newest scanned instant
+(the watermark) are saved, so the next run only scans newer rows and still
+sees a gap that started before it: the saved reading is put in front of the
+device's new rows.
+
+A gap that is still open (a device silent right now) is not reported here,
+that is what the freshness check does; it becomes an outage once the device
+writes again.
+"""
+import json
+import logging
+import os
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from bot_common import BASE_DIR, file_lock
+
+logger = logging.getLogger(__name__)
+
+OUTAGE_STATE_FILE = f'{BASE_DIR}/outages/outage_state.json'
+# Devices write every minute; a longer silence than this is an outage
+MIN_OUTAGE = timedelta(minutes=5)
+
+# start/end: int64 epoch ns of the readings around the outage
+Outage = namedtuple('Outage', ['device', 'start', 'end', 'gaps'])
+
+
+def find_outages(times, devices, min_gap=MIN_OUTAGE):
+    """Outages of every device from unsorted readings.
+
+    times: int64 epoch ns; devices: the `pi-id` of each reading. A device
+    that sends a stray reading now and then during an outage yields one
+    outage, not one per gap: consecutive gaps of a device are merged.
+    """
+    times = np.asarray(times, dtype=np.int64)
+    devices = np.asarray(devices)
+    if len(times) < 2:
+        return []
+    codes, names = pd.factorize(devices)
+    order = np.lexsort((times, codes))
+    times, codes = times[order], codes[order]
+
+    same_device = codes[1:] == codes[:-1]
+    gap = same_device & (np.diff(times) > pd.Timedelta(min_gap).value)
+    if not gap.any():
+        return []
+
+    # Gaps next to each other share a reading, so they are of the same device
+    first = np.flatnonzero(gap & ~np.r_[False, gap[:-1]])
+    last = np.flatnonzero(gap & ~np.r_[gap[1:], False])
+    gaps = np.cumsum(gap)
+    return [Outage(names[codes[i]], int(times[i]), int(times[j + 1]), int(gaps[j] - gaps[i] + 1))
+            for i, j in zip(first, last)]
+
+
+def _read_state(path):
+    try:
+        with open(path, 'r') as f:
+            state = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None, {}
+    return state['watermark'], state['last_seen']
+
+
+def _write_state(path, watermark, last_seen):
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'watermark': watermark, 'last_seen': last_seen}, f)
+    os.replace(path + '.tmp', path)
+
+
+def outage_watermark(path=OUTAGE_STATE_FILE):
+    """Newest instant scanned so far (int64 epoch ns), or None before the first scan"""
+    with file_lock(path + '.lock'):
+        return _read_state(path)[0]
+
+
+def scan_new_outages(times, devices, min_gap=MIN_OUTAGE, path=OUTAGE_STATE_FILE):
+    """Outages that ended after the previous scan, and move the watermark.
+
+    On the first run (no state file) every outage in the rows is new.
+    """
+    times = np.asarray(times)
+    if times.dtype.kind == 'M':
+        times = times.astype('datetime64[ns]').view(np.int64)
+    times = np.asarray(times, dtype=np.int64)
+    devices = np.asarray(devices, dtype=str)
+
+    with file_lock(path + '.lock'):
+        watermark, last_seen = _read_state(path)
+        if watermark is not None:
+            newer = times > watermark
+            times, devices = times[newer], devices[newer]
+        if not len(times):
+            return []
+
+        # The previous newest reading of each device closes gaps across runs
+        known = [device for device in np.unique(devices) if device in last_seen]
+        scan_times = np.r_[[last_seen[device] for device in known], times].astype(np.int64)
+        scan_devices = np.r_[np.array(known, dtype=str), devices]
+        outages = find_outages(scan_times, scan_devices, min_gap)
+
+        codes, names = pd.factorize(devices)
+        newest = np.full(len(names), np.iinfo(np.int64).min)
+        np.maximum.at(newest, codes, times)
+        last_seen.update({str(name): int(t) for name, t in zip(names, newest)})
+        _write_state(path, int(times.max()), last_seen)
+
+    logger.info(f"Scanned {len(times)} rows of {len(names)} devices, {len(outages)} new outages")
+    return outages
+
+
+def describe_outage(outage, tz):
+    start = pd.Timestamp(outage.start, tz='UTC').tz_convert(tz)
+    end = pd.Timestamp(outage.end, tz='UTC').tz_convert(tz)
+    minutes = (outage.end - outage.start) / 60e9
+    end_format = '%H:%M' if end.date() == start.date() else '%Y-%m-%d %H:%M'
+    gaps = f", {outage.gaps} gaps" if outage.gaps > 1 else ""
+    return (f"{outage.device}: no data from {start:%Y-%m-%d %H:%M} to {end.strftime(end_format)} "
+            f"({minutes:.0f} min{gaps})")
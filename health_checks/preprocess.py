@@ -0,0 +1,72 @@
+"""Row filtering and device classification shared by the health check bots.
+
+`pi-id`, `device_type` and `model` are categoricals: the classification runs
+once per distinct `pi-id` and every row only stores a small integer code, so
+the cost grows with the number of devices, not with the number of rows.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+start_time_filter = pd.Timestamp('2025-01-01 00:06:00', tz='UTC')
+end_time_filter = pd.Timestamp('2028-08-15 23:59:59', tz='UTC')
+
+
+def classify(ids, label):
+    """Categorical of label(pi-id) for a categorical `ids`, calling label once per category"""
+    labels = pd.Index([label(x) for x in ids.cat.categories], dtype=object)
+    categories = labels.unique()
+    # Missing ids (code -1) pick the trailing -1, i.e. stay missing
+    codes = np.append(categories.get_indexer(labels), -1)[ids.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=ids.index)
+
+
+def dates_of(times):
+    """Categorical of the UTC dates of a datetime64[ns, UTC] Series"""
+    days = times.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    unique_days, codes = np.unique(days, return_inverse=True)
+    categories = pd.DatetimeIndex(unique_days.astype('datetime64[ns]')).date
+    return pd.Series(pd.Categorical.from_codes(codes.reshape(-1), categories=categories), index=times.index)
+
+
+def preprocess_subset(df,
+                      timecol='_time',
+                      start_time_filter=start_time_filter,
+                      end_time_filter=end_time_filter,
+                      exclude_ids=None,
+                      device='tx2'):
+    logger.info(f"Original DataFrame shape: {df.shape}")
+
+    # Convert to datetime objects, nothing to do for the frames from influx_stream
+    if not isinstance(df[timecol].dtype, pd.DatetimeTZDtype):
+        df[timecol] = pd.to_datetime(df[timecol], unit='ns', utc=True)
+    df['pi-id'] = df['pi-id'].astype('category')
+
+    logger.info(f"After datetime conversion, DataFrame shape: {df.shape}")
+
+    # Keep the rows within the date range, without e10 luis and other excluded IDs
+    keep = df[timecol].between(start_time_filter, end_time_filter).to_numpy()
+    if exclude_ids is not None:
+        keep &= ~df['pi-id'].isin(exclude_ids).to_numpy()
+    if not keep.all():
+        df = df.loc[keep].copy()
+    df['within_date_range'] = True
+
+    logger.info(f"After ID filtering, DataFrame shape: {df.shape}")
+
+    if device == 'tx2':
+        df['device_type'] = classify(df['pi-id'], lambda x: 'TX2' if 'tx2' in x else 'other')
+    elif device == 'e10':
+        df['device_type'] = classify(df['pi-id'], lambda x: 'E10' if 'btv' in x else 'other')
+    else:
+        df['device_type'] = classify(df['pi-id'], lambda x: 'other')
+
+    df['model'] = classify(df['pi-id'], lambda x: 'YOLOv8n' if x.endswith('_n') else 'YOLOv10n')
+    df['date'] = dates_of(df[timecol])
+
+    logger.info(f"Final DataFrame shape: {df.shape}")
+
+    return df
@@ -0,0 +1,152 @@
+"""In-process cache of query windows, shared by the bots of health_daemon.py.
+
+At midnight the hourly job (30 days) and the daily job (40 days) read the
+same bucket one right after the other. Windows are kept in memory by bucket,
+org, on-disk cache and filter (the excluded `pi-id`s) for `ttl`; a request for a window that a
+fresh cached one covers is served by slicing it. Every key is fetched with
+the widest window asked for so far, so the shorter job of the pair is always
+covered. Requesters of a window that is being fetched wait for that fetch
+instead of sending the same query. Entries are evicted least recently used
+first once they take more than `max_mb`.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
+from datetime import timedelta
+
+import pandas as pd
+
+from influx_cache import CACHE_DIR, cache_covers, fetch_cached, read_cache
+
+logger = logging.getLogger(__name__)
+
+QUERY_CACHE_TTL = timedelta(minutes=5)
+QUERY_CACHE_MAX_MB = 256
+
+# start: UTC Timestamp of the oldest row the window covers
+_Entry = namedtuple('_Entry', ['fetched_at', 'start', 'frame', 'nbytes'])
+_Flight = namedtuple('_Flight', ['start', 'future'])
+
+
+class QueryCache:
+    def __init__(self, ttl=QUERY_CACHE_TTL, max_mb=QUERY_CACHE_MAX_MB):
+        self.ttl = pd.Timedelta(ttl).total_seconds()
+        self.max_bytes = max_mb * 1024 * 1024
+        self.hits = self.misses = self.shared = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> _Entry, least recently used first
+        self._in_flight = {}  # key -> _Flight
+        self._widest = {}  # key -> most days asked for
+
+    def window(self, bucket, days, fetch, filters=(), org="", cache_dir=None):
+        """Rows of the last `days` days of `bucket`.
+
+        fetch(days): returns the rows of the last `days` days, called on a miss
+        filters: hashable description of the server-side filters (e.g. the
+        sorted excluded pi-ids); windows are only shared with the same filters,
+        org and cache_dir (the on-disk cache fetch reads from)
+        """
+        key = (bucket, org, cache_dir, tuple(filters))
+        days = int(days)
+        start = pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=days)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.fetched_at > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is not None and entry.start <= start:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._slice(entry.frame, start)
+
+            flight = self._in_flight.get(key)
+            if flight is not None and flight.start <= start:
+                self.shared += 1
+                owner = False
+            else:
+                self.misses += 1
+                self._widest[key] = max(days, self._widest.get(key, 0))
+                fetch_days = self._widest[key]
+                flight = _Flight(pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=fetch_days), Future())
+                self._in_flight[key] = flight
+                owner = True
+
+        if not owner:
+            logger.info(f"Waiting for the fetch of {bucket} already running")
+            return self._slice(flight.future.result(), start)
+
+        try:
+            frame = fetch(fetch_days)
+        except BaseException as e:
+            with self._lock:
+                if self._in_flight.get(key) is flight:
+                    del self._in_flight[key]
+            flight.future.set_exception(e)
+            raise
+
+        with self._lock:
+            if self._in_flight.get(key) is flight:
+                del self._in_flight[key]
+            self._store(key, _Entry(time.monotonic(), flight.start, frame,
+                                    int(frame.memory_usage(deep=True).sum())))
+        flight.future.set_result(frame)
+        logger.info(f"Cached {fetch_days} days of {bucket} ({len(frame)} rows)")
+        return self._slice(frame, start)
+
+    def invalidate(self, bucket):
+        """Forget the cached windows of `bucket`, e.g. after late rows were fetched"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == bucket]:
+                self._drop(key)
+
+    def _store(self, key, entry):
+        self._drop(key)
+        self._entries[key] = entry
+        total = sum(e.nbytes for e in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            total -= evicted.nbytes
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+
+    @staticmethod
+    def _slice(frame, start):
+        # Always a copy, the bots change the frame they get
+        return frame[frame['_time'] >= start].reset_index(drop=True)
+
+
+_query_cache = None
+_lock = threading.Lock()
+
+
+def query_cache():
+    """Query cache shared by every bot in this process"""
+    global _query_cache
+    with _lock:
+        if _query_cache is None:
+            _query_cache = QueryCache()
+        return _query_cache
+
+
+def cached_window(query_api, bucket, days, org="", exclude_ids=None, cache_dir=CACHE_DIR, refresh=True,
+                  value_words=1):
+    """fetch_cached through the shared query cache
+
+    refresh=False: the caller has just run refresh_cache, so a window the
+    on-disk cache covers is read from it without querying InfluxDB again.
+    value_words: uint64 words per `_value`, see refresh_cache
+    """
+    exclude_ids = sorted(exclude_ids or [])
+
+    def fetch(fetch_days):
+        start = pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=fetch_days)
+        if not refresh and cache_covers(start, exclude_ids, cache_dir=cache_dir, value_words=value_words):
+            return read_cache(start, cache_dir=cache_dir)
+        return fetch_cached(query_api, bucket, fetch_days, org=org, exclude_ids=exclude_ids, cache_dir=cache_dir,
+                            value_words=value_words)
+
+    return query_cache().window(bucket, days, fetch, filters=exclude_ids, org=org, cache_dir=cache_dir)
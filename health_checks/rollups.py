@@ -0,0 +1,166 @@
+"""Per-spot occupancy rollups, persisted between runs.
+
+The store keeps occupied minutes per spot for every local hour of the days
+that are already over. Each run only decodes the raw rows of days that are
+not in the store yet and of the current, still open day, so the analyzers
+work on about days x 24 x spots numbers instead of one row per minute.
+
+Minutes are integrated over the real time between readings, so devices do
+not have to write every minute: a reading holds until the next one, for at
+most `max_gap`, after which the spot counts as unknown (not occupied).
+"""
+import logging
+import os
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from baseline import BASELINE_WEEKS
+from bot_common import BASE_DIR, file_lock
+from spots import select, spot_sums
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_FILE = f'{BASE_DIR}/rollups/occupancy_rollups.npz'
+# Days kept in the store: a bit more than the longest analysis window, and the
+# whole baseline window (baseline.py) with the week of the analysed day
+ROLLUP_RETENTION_DAYS = max(60, 7 * (BASELINE_WEEKS + 1))
+# Longest time a reading is assumed to last without a newer one
+MAX_GAP = timedelta(minutes=10)
+
+MINUTE_NS = 60 * 10**9
+HOUR_NS = 60 * MINUTE_NS
+DAY_NS = 24 * HOUR_NS
+
+# hours: sorted datetime64[h] local hour starts
+# minutes: (hours, spots) float64 occupied minutes
+Rollups = namedtuple('Rollups', ['hours', 'minutes'])
+
+
+def empty_rollups(bit_length):
+    return Rollups(np.array([], dtype='datetime64[h]'), np.zeros((0, bit_length), dtype=np.float64))
+
+
+def reading_durations(times, end, max_gap=MAX_GAP):
+    """Nanoseconds each reading holds: until the next one (the last until `end`), capped at max_gap"""
+    if len(times) == 0:
+        return np.zeros(0, dtype=np.int64)
+    durations = np.diff(times, append=max(end, times[-1]))
+    return np.minimum(durations, pd.Timedelta(max_gap).value)
+
+
+def hourly_rollup(occupancy, durations):
+    """Occupied minutes per spot per hour from packed readings sorted by time.
+
+    Each reading is integrated over its duration, split at hour boundaries
+    and cut at midnight so a day's rollup only depends on that day.
+    """
+    if len(occupancy.times) == 0:
+        return empty_rollups(occupancy.bit_length)
+    starts = occupancy.times
+    ends = np.minimum(starts + durations, (starts // DAY_NS + 1) * DAY_NS)
+
+    # One piece per reading and hour it overlaps
+    first_hour = starts // HOUR_NS
+    pieces = np.maximum(ends - 1, starts) // HOUR_NS - first_hour + 1
+    reading = np.repeat(np.arange(len(starts)), pieces)
+    hours = first_hour[reading] + np.arange(len(reading)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    minutes = (np.minimum(ends[reading], (hours + 1) * HOUR_NS)
+               - np.maximum(starts[reading], hours * HOUR_NS)) / MINUTE_NS
+
+    groups = np.flatnonzero(np.r_[True, hours[1:] != hours[:-1]])
+    sums = spot_sums(select(occupancy, reading), groups, weights=minutes)
+    return Rollups(hours[groups].astype('datetime64[h]'), sums)
+
+
+def _concat(a, b):
+    return Rollups(np.concatenate([a.hours, b.hours]), np.concatenate([a.minutes, b.minutes]))
+
+
+def _select(rollups, mask):
+    return Rollups(rollups.hours[mask], rollups.minutes[mask])
+
+
+def _sorted(rollups):
+    return _select(rollups, np.argsort(rollups.hours, kind='stable'))
+
+
+def _load(path, bit_length):
+    try:
+        with np.load(path, allow_pickle=False) as store:
+            if int(store['bit_length']) != bit_length:
+                logger.info(f"Rollup store has {int(store['bit_length'])} spots, rebuilding for {bit_length}")
+                return empty_rollups(bit_length)
+            return Rollups(store['hours'].astype('datetime64[h]'), store['minutes'].astype(np.float64))
+    except FileNotFoundError:
+        return empty_rollups(bit_length)
+
+
+def _save(path, rollups, bit_length):
+    with open(path + '.tmp', 'wb') as f:
+        np.savez_compressed(f, hours=rollups.hours, minutes=rollups.minutes, bit_length=bit_length)
+    os.replace(path + '.tmp', path)
+
+
+def update_rollups(occupancy, now, path=ROLLUP_FILE, max_gap=MAX_GAP, refresh_days=(), keep_history=False):
+    """Roll up the days that closed since the last run and return the rollups for `occupancy`.
+
+    occupancy: packed readings with local times, sorted
+    now: current local time; days before its date are closed and persisted
+    max_gap: longest time a reading holds without a newer one
+    refresh_days: closed days to roll up again, e.g. after late rows arrived
+    keep_history: also return the stored days older than `occupancy`, up to
+    ROLLUP_RETENTION_DAYS, e.g. for a baseline longer than the query window
+    """
+    times = occupancy.times.view('datetime64[ns]')
+    bit_length = occupancy.bit_length
+    durations = reading_durations(occupancy.times, pd.Timestamp(now).value, max_gap)
+    today = np.datetime64(pd.Timestamp(now).date(), 'D')
+    days = times.astype('datetime64[D]')
+
+    with file_lock(path + '.lock'):
+        store = _load(path, bit_length)
+        if len(refresh_days):
+            stale = np.isin(store.hours.astype('datetime64[D]'), np.array(refresh_days, dtype='datetime64[D]'))
+            store = _select(store, ~stale)
+        in_store = np.isin(days, np.unique(store.hours.astype('datetime64[D]')))
+
+        # Closed days that are not in the store yet. The first day of the
+        # window is usually cut by the range() start, so it is never stored.
+        new = (days < today) & ~in_store
+        if len(days):
+            new &= days > days[0]
+        if new.any():
+            logger.info(f"Rolling up {len(np.unique(days[new]))} closed days")
+            store = _sorted(_concat(store, hourly_rollup(select(occupancy, new), durations[new])))
+            store = _select(store, store.hours >= (today - ROLLUP_RETENTION_DAYS).astype('datetime64[h]'))
+            _save(path, store, bit_length)
+            in_store |= new
+
+    # The open day (and a cut first day) is rolled up from raw rows on every run
+    rest = ~in_store
+    rollups = _sorted(_concat(store, hourly_rollup(select(occupancy, rest), durations[rest])))
+    if len(times) and not keep_history:
+        # Same window as the raw rows, to the hour
+        rollups = _select(rollups, rollups.hours >= times[0].astype('datetime64[h]'))
+    return rollups
+
+
+def hourly_frame(rollups, spot_cols):
+    """Occupied minutes per spot with `date` and `hour` columns, one row per hour"""
+    hours = pd.DatetimeIndex(rollups.hours.astype('datetime64[ns]'))
+    frame = pd.DataFrame(rollups.minutes, columns=spot_cols)
+    frame.insert(0, 'date', hours.date)
+    frame.insert(1, 'hour', hours.hour)
+    return frame
+
+
+def daily_frame(rollups, spot_cols):
+    """Occupied minutes per spot indexed by `date`"""
+    days = rollups.hours.astype('datetime64[D]')
+    starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]]) if len(days) else np.array([], dtype=int)
+    minutes = np.add.reduceat(rollups.minutes, starts, axis=0) if len(days) else rollups.minutes
+    index = pd.Index(pd.DatetimeIndex(days[starts].astype('datetime64[ns]')).date, name='date')
+    return pd.DataFrame(minutes, index=index, columns=spot_cols)
@@ -0,0 +1,6 @@
+#!/bin/bash
+# Activate venv and run the script
+
+source /home/unicamp/photoenv/bin/activate 
+
+python /home/unicamp/photo_collection/freshness_probe.py
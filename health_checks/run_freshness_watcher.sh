@@ -0,0 +1,7 @@
+#!/bin/bash
+# Activate venv and keep the fleet freshness watcher running
+
+source /home/unicamp/photoenv/bin/activate 
+
+cd /home/unicamp/photo_collection
+exec python /home/unicamp/photo_collection/freshness_probe.py --watch
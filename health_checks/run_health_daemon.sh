@@ -0,0 +1,7 @@
+#!/bin/bash
+# Activate venv and run the resident scheduler for all bots
+
+source /home/unicamp/photoenv/bin/activate 
+
+cd /home/unicamp/photo_collection
+exec python /home/unicamp/photo_collection/health_daemon.py
@@ -0,0 +1,69 @@
+"""Persisted state of the last report of a job.
+
+A job that reports on a day that is already over (telegrambot_1hour.py looks
+at the day before the newest one) keeps the day it reported on, a
+fingerprint of that day's input and the input high-water mark. The
+fingerprint is taken on the server from the row counts per hour of the day,
+a response of 24 rows per device, so late rows written with old timestamps
+(which the incremental cache never fetches) are noticed too. A late write
+that overwrites an existing point (same `_time` and `pi-id`) keeps the
+counts, so it is not noticed; see day_fingerprint.
+"""
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from bot_common import BASE_DIR, file_lock
+from flux_query import build_query
+from influx_stream import stream_rows, to_frame
+
+RUN_STATE_DIR = f'{BASE_DIR}/run_state'
+
+# target: ISO date reported on; fingerprint: day_fingerprint of that day;
+# high_water_mark: newest input `_time` in epoch ns when the report was made
+RunState = namedtuple('RunState', ['target', 'fingerprint', 'high_water_mark'])
+
+
+def rows_fingerprint(df):
+    """Digest of the `_time`, `_value` and `pi-id` of `df`, independent of the row order"""
+    order = np.lexsort((df['pi-id'].to_numpy(dtype=str), df['_time'].to_numpy(dtype='datetime64[ns]')))
+    digest = hashlib.sha1()
+    digest.update(df['_time'].to_numpy(dtype='datetime64[ns]')[order].view(np.int64).tobytes())
+    digest.update(df['_value'].to_numpy(dtype=np.int64)[order].tobytes())
+    digest.update('\0'.join(df['pi-id'].to_numpy(dtype=str)[order]).encode())
+    return digest.hexdigest()
+
+
+def day_fingerprint(query_api, bucket, start, stop, org="", exclude_ids=None):
+    """Fingerprint of the rows of `bucket` in [start, stop) from their counts per hour and device.
+
+    Only added rows change it: a point rewritten with a new value has the same
+    counts. Summing `_value` per hour would catch those too, but Flux cannot
+    sum the string masks of lots with more than 64 spots.
+    """
+    query = build_query(bucket, start.strftime('%Y-%m-%dT%H:%M:%SZ'), stop.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                        exclude_ids=exclude_ids, every="1h", fn="count")
+    return rows_fingerprint(to_frame(stream_rows(query_api, query, org=org, exclude_ids=exclude_ids)))
+
+
+def _path(job):
+    return os.path.join(RUN_STATE_DIR, f'{job}.json')
+
+
+def load_run_state(job):
+    try:
+        with open(_path(job), 'r') as f:
+            return RunState(**json.load(f))
+    except (FileNotFoundError, ValueError, TypeError):
+        return None
+
+
+def save_run_state(job, state):
+    path = _path(job)
+    with file_lock(path + '.lock'):
+        with open(path + '.tmp', 'w') as f:
+            json.dump(state._asdict(), f)
+        os.replace(path + '.tmp', path)
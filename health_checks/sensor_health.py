@@ -0,0 +1,93 @@
+"""Stuck and flapping spot detectors.
+
+A run-length encoding of the spot bits, done for all spots and days at once,
+gives the longest occupied and free runs and the number of flips of every
+spot on every day. A detector stuck at "occupied" shows up as one very long
+occupied run, a flapping one as many flips per hour.
+"""
+import logging
+from collections import namedtuple
+
+import numpy as np
+
+from rollups import DAY_NS, MINUTE_NS
+from spots import decode_spots
+
+logger = logging.getLogger(__name__)
+
+# A spot occupied this long without a single change is reported as stuck
+STUCK_HOURS = 20
+# More changes than this per hour of data is reported as flapping
+MAX_FLIPS_PER_HOUR = 6
+
+# days: datetime64[D]; the other fields are (days, spots) arrays,
+# run lengths and coverage in minutes
+SensorHealth = namedtuple('SensorHealth', ['days', 'longest_occupied', 'longest_free', 'flips', 'covered'])
+
+
+def sensor_health(occupancy, durations):
+    """Longest runs and flips per day and spot of packed readings sorted by time.
+
+    durations: how long each reading holds (rollups.reading_durations); runs
+    are measured in time, so change-only feeds give the right lengths too.
+    """
+    spots = occupancy.bit_length
+    readings = len(occupancy.times)
+    if readings == 0:
+        empty = np.zeros((0, spots))
+        return SensorHealth(np.array([], dtype='datetime64[D]'), empty, empty, empty.astype(np.int64), empty)
+
+    times = occupancy.times
+    day_of_reading = times // DAY_NS
+    first_day = day_of_reading[0]
+    day_code = day_of_reading - first_day
+    day_count = int(day_code[-1]) + 1
+    # A reading never counts past midnight, days are looked at on their own
+    minutes = np.minimum(durations, (day_of_reading + 1) * DAY_NS - times) / MINUTE_NS
+    elapsed = np.r_[0.0, np.cumsum(minutes)]
+
+    # One row per spot; a run starts at every change and every new day
+    bits = np.ascontiguousarray(decode_spots(occupancy.masks, spots).T)
+    new_run = np.ones((spots, readings), dtype=bool)
+    new_run[:, 1:] = (bits[:, 1:] != bits[:, :-1]) | (day_code[1:] != day_code[:-1])
+    starts = np.flatnonzero(new_run)
+    next_starts = np.r_[starts[1:], spots * readings]
+
+    spot = starts // readings
+    first = starts - spot * readings
+    last = next_starts - spot * readings  # exclusive, `readings` when the spot's row ends
+    length = elapsed[last] - elapsed[first]
+    day = day_code[first]
+    occupied = bits.ravel()[starts] == 1
+
+    cell = day * spots + spot
+    runs = np.bincount(cell, minlength=day_count * spots).reshape(day_count, spots)
+    longest_occupied = np.zeros(day_count * spots)
+    longest_free = np.zeros(day_count * spots)
+    np.maximum.at(longest_occupied, cell[occupied], length[occupied])
+    np.maximum.at(longest_free, cell[~occupied], length[~occupied])
+    covered = np.bincount(day_code, weights=minutes, minlength=day_count)
+
+    return SensorHealth(days=(first_day + np.arange(day_count)).astype('datetime64[D]'),
+                        longest_occupied=longest_occupied.reshape(day_count, spots),
+                        longest_free=longest_free.reshape(day_count, spots),
+                        flips=np.maximum(runs - 1, 0),
+                        covered=np.repeat(covered[:, None], spots, axis=1))
+
+
+def sensor_alerts(health, day, spot_cols, stuck_hours=STUCK_HOURS, max_flips_per_hour=MAX_FLIPS_PER_HOUR):
+    """Lines describing the stuck and flapping spots of `day`, empty when all look fine"""
+    found = np.flatnonzero(health.days == np.datetime64(day, 'D'))
+    if not len(found):
+        return []
+    i = found[0]
+    hours = health.covered[i] / 60
+    flips_per_hour = np.divide(health.flips[i], hours, out=np.zeros(len(spot_cols)), where=hours > 0)
+
+    alerts = []
+    for spot in np.flatnonzero(health.longest_occupied[i] >= stuck_hours * 60):
+        alerts.append(f"{spot_cols[spot]}: occupied for {health.longest_occupied[i, spot] / 60:.1f} h "
+                      f"without a change, possibly stuck")
+    for spot in np.flatnonzero(flips_per_hour > max_flips_per_hour):
+        alerts.append(f"{spot_cols[spot]}: {flips_per_hour[spot]:.1f} changes per hour, possibly flapping")
+    return alerts
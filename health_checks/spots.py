@@ -0,0 +1,150 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Lots with more spots than this keep each mask as several 64-bit words
+WORD_BITS = 64
+
+
+# Convert each _value to binary string and expand into columns
+def expand_to_spots(value, bit_length):
+    """Reference per-value decoder, kept for checking decode_spots"""
+    binary_str = bin(int(value))[2:].zfill(bit_length)
+    return list(map(int, binary_str))
+
+
+def word_count(bit_length):
+    if bit_length < 1:
+        raise ValueError(f"bit_length must be at least 1, got {bit_length}")
+    return -(-bit_length // WORD_BITS)
+
+
+def mask_dtype(bit_length):
+    """Smallest unsigned dtype holding bit_length bits, uint64 words past 64 bits"""
+    word_count(bit_length)
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if bit_length <= np.iinfo(dtype).bits:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def pack_masks(values, bit_length):
+    """Occupancy bitmasks of `values`, with the bits above bit_length dropped.
+
+    Up to 64 spots the result is one mask_dtype value per reading. Wider lots
+    get a (readings, words) uint64 array, least significant word first;
+    `values` is then either such an array or Python ints / decimal strings.
+    """
+    words = word_count(bit_length)
+    if words == 1:
+        values = np.asarray(values)
+        if values.dtype.kind == 'f':
+            values = values.astype(np.int64)
+        masks = values.astype(np.uint64) & np.uint64((1 << bit_length) - 1)
+        return masks.astype(mask_dtype(bit_length))
+
+    values = np.asarray(values)
+    if values.ndim == 2 and values.dtype.kind in 'ui':
+        masks = np.array(values, dtype=np.uint64)
+    else:
+        masks = mask_words(values, words)
+    if masks.shape[1] != words:
+        raise ValueError(f"expected {words} words for {bit_length} spots, got {masks.shape[1]}")
+    masks[:, -1] &= np.uint64((1 << (bit_length - (words - 1) * WORD_BITS)) - 1)
+    return masks
+
+
+def mask_words(values, words):
+    """(len(values), words) uint64 of Python ints or decimal strings, least
+    significant word first; bits above words * 64 are dropped"""
+    width = words * WORD_BITS // 8
+    low_bits = (1 << (words * WORD_BITS)) - 1
+    raw = b''.join((int(v) & low_bits).to_bytes(width, 'little') for v in values)
+    return np.frombuffer(raw, dtype='<u8').reshape(len(values), words).astype(np.uint64)
+
+
+def mask_ints(masks):
+    """Python ints (an object array) of (rows, words) uint64 masks, the inverse of mask_words"""
+    raw = np.ascontiguousarray(masks, dtype='<u8').tobytes()
+    width = masks.shape[1] * WORD_BITS // 8
+    return np.array([int.from_bytes(raw[i:i + width], 'little') for i in range(0, len(raw), width)],
+                    dtype=object)
+
+
+def pack_mask(value, bit_length):
+    """A single mask (e.g. a lot's special spots) in the layout of pack_masks"""
+    return pack_masks([int(value)], bit_length)[0]
+
+
+def decode_spots(values, bit_length):
+    """Decode a whole column of occupancy bitmasks in one pass.
+
+    Returns a (rows, bit_length) uint8 matrix where column 0 is the most
+    significant bit, i.e. spot_1, the same order expand_to_spots gives.
+    """
+    masks = pack_masks(values, bit_length).astype(np.uint64).reshape(len(values), word_count(bit_length))
+
+    # Big-endian bytes, most significant word first, so unpackbits yields bits from MSB to LSB
+    as_bytes = np.ascontiguousarray(masks[:, ::-1]).astype('>u8').view(np.uint8).reshape(len(masks), 8 * masks.shape[1])
+    bits = np.unpackbits(as_bytes, axis=1)
+    return np.ascontiguousarray(bits[:, bits.shape[1] - bit_length:])
+
+
+def spot_columns(bit_length):
+    return [f"spot_{i+1}" for i in range(bit_length)]
+
+
+# times: int64 epoch nanoseconds
+# masks: bitmasks from pack_masks, the MSB of bit_length is spot_1
+Occupancy = namedtuple('Occupancy', ['times', 'masks', 'bit_length'])
+
+# Set bits of every byte value
+_BYTE_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def pack_occupancy(times, values, bit_length):
+    """Occupancy from datetime64 (or epoch ns) times and the raw `_value` column"""
+    times = np.asarray(times)
+    if times.dtype.kind == 'M':
+        times = times.astype('datetime64[ns]').view(np.int64)
+    return Occupancy(np.asarray(times, dtype=np.int64), pack_masks(values, bit_length), bit_length)
+
+
+def select(occupancy, rows):
+    """Occupancy of the readings selected by a boolean mask or an index array"""
+    return Occupancy(occupancy.times[rows], occupancy.masks[rows], occupancy.bit_length)
+
+
+def car_counts(occupancy, special_mask=0):
+    """Occupied spots of every reading, a popcount of the masks without the special spots"""
+    masks = occupancy.masks
+    if special_mask:
+        masks = masks & ~pack_mask(special_mask, occupancy.bit_length)
+    row_bytes = masks.dtype.itemsize * (masks.shape[1] if masks.ndim == 2 else 1)
+    as_bytes = np.ascontiguousarray(masks).view(np.uint8).reshape(len(masks), row_bytes)
+    return _BYTE_POPCOUNT[as_bytes].sum(axis=1, dtype=np.int32)
+
+
+def spot_sums(occupancy, starts=None, weights=None):
+    """Occupied readings per spot, columns in spot order.
+
+    Without `starts` returns one row for all readings, otherwise one row per
+    group of consecutive readings beginning at each index of `starts`. With
+    `weights` (e.g. the minutes each reading lasts) the float sum of the
+    weights of the occupied readings is returned instead of a count.
+    """
+    masks = occupancy.masks
+    if starts is None:
+        starts = np.zeros(1 if len(masks) else 0, dtype=np.intp)
+    dtype = np.int32 if weights is None else np.float64
+    sums = np.empty((len(starts), occupancy.bit_length), dtype=dtype)
+    if not len(starts):
+        return sums
+    words = [masks] if masks.ndim == 1 else [np.ascontiguousarray(masks[:, w]) for w in range(masks.shape[1])]
+    for spot in range(occupancy.bit_length):
+        word, shift = divmod(occupancy.bit_length - 1 - spot, WORD_BITS)
+        bits = (words[word] >> shift) & 1
+        if weights is not None:
+            bits = np.where(bits, weights, 0.0)
+        sums[:, spot] = np.add.reduceat(bits, starts, dtype=dtype)
+    return sums
@@ -0,0 +1,347 @@
+"""Telegram notifier shared by the health check bots.
+
+Messages are queued and sent from a background thread over the keep-alive
+session from bot_common, so the analysis never waits on the network. The
+sender keeps to Telegram's per-chat limits, retries 429 and 5xx answers with
+backoff, and merges text messages queued for the same chat within a short
+window into one message.
+
+Photos sent from a local file are hashed. The file_id Telegram returns for
+an upload is remembered by content, so the same image sent again (another
+chat, a rerun) goes out by file_id without uploading the bytes again. Every
+photo delivery is recorded in `photos` with the bytes uploaded and the time
+it took. Several photos for a chat go out as albums of up to 10 with
+sendMediaGroup, one request per album.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+
+from bot_common import BASE_DIR, TELEGRAM_TOKEN_FILE, file_lock, http_session, read_token
+
+logger = logging.getLogger(__name__)
+
+API_BASE = 'https://api.telegram.org'
+# Telegram allows about one message per second in a chat and 20 per minute in a group
+MIN_INTERVAL = 1.0
+PER_MINUTE = 20
+# Text messages for the same chat queued within this window go out as one
+COALESCE_WINDOW = 2.0
+MAX_MESSAGE_LENGTH = 4096
+MAX_RETRIES = 5
+REQUEST_TIMEOUT = (5, 30)  # connect, read seconds
+# sha256 of uploaded images -> Telegram file_id, newest last
+FILE_ID_FILE = f'{BASE_DIR}/telegram_file_ids.json'
+MAX_FILE_IDS = 200
+# Telegram's limit of photos in one sendMediaGroup
+MAX_MEDIA_GROUP = 10
+
+# uploaded_bytes: 0 when the photo was re-sent by file_id
+PhotoDelivery = namedtuple('PhotoDelivery', ['path', 'uploaded_bytes', 'seconds', 'reused'])
+
+
+class TelegramNotifier:
+    def __init__(self, bot_token, session=None, api_base=API_BASE,
+                 min_interval=MIN_INTERVAL, per_minute=PER_MINUTE,
+                 coalesce_window=COALESCE_WINDOW, max_retries=MAX_RETRIES,
+                 timeout=REQUEST_TIMEOUT, file_id_path=None):
+        self.bot_token = bot_token
+        self.session = session or http_session()
+        self.api_base = api_base.rstrip('/')
+        self.min_interval = min_interval
+        self.per_minute = per_minute
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.file_id_path = file_id_path
+        self.photos = []  # PhotoDelivery of every photo sent from a file
+
+        self._queue = queue.Queue()
+        self._sent = {}  # chat_id -> deque of send times in the last minute
+        self._pending = 0
+        self._idle = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='telegram-notifier', daemon=True)
+        self._thread.start()
+
+    def send_message(self, chat_id, text):
+        """Queue a text message"""
+        self._put(('sendMessage', chat_id, {'text': text}))
+
+    def send_photo(self, chat_id, photo, caption=""):
+        """Queue a photo: a local file path, an URL or a Telegram file_id"""
+        self._put(('sendPhoto', chat_id, {'photo': photo, 'caption': caption}))
+
+    def send_media_group(self, chat_id, photos, captions=None):
+        """Queue photos as albums of at most MAX_MEDIA_GROUP, in order.
+
+        photos: local file paths, URLs or Telegram file_ids
+        captions: one caption per photo, shown under it in the album
+        """
+        photos = list(photos)
+        captions = list(captions) if captions is not None else [""] * len(photos)
+        if not photos:
+            return
+        # Albums of about the same size, so the last one is not a lone photo
+        albums = -(-len(photos) // MAX_MEDIA_GROUP)
+        size = -(-len(photos) // albums)
+        for start in range(0, len(photos), size):
+            media = list(zip(photos[start:start + size], captions[start:start + size]))
+            if len(media) == 1:
+                self.send_photo(chat_id, *media[0])
+            else:
+                self._put(('sendMediaGroup', chat_id, {'media': media}))
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far was delivered or given up on"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+    def close(self, timeout=60):
+        if not self.flush(timeout):
+            logger.warning(f"{self._pending} Telegram messages were not delivered")
+
+    def _put(self, item):
+        with self._idle:
+            self._pending += 1
+        self._queue.put(item)
+
+    def _done(self, count):
+        with self._idle:
+            self._pending -= count
+            self._idle.notify_all()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.coalesce_window
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            for method, chat_id, data in self._coalesce(batch):
+                try:
+                    self._deliver(method, chat_id, data)
+                except Exception:
+                    logger.exception(f"Unexpected error sending {method}")
+            self._done(len(batch))
+
+    def _coalesce(self, batch):
+        """Merge the text messages of each chat, keeping everything else in order"""
+        merged = []
+        texts = {}
+        for method, chat_id, data in batch:
+            if method != 'sendMessage':
+                merged.append((method, chat_id, data))
+                continue
+            if chat_id not in texts:
+                texts[chat_id] = []
+                merged.append(('sendMessage', chat_id, texts[chat_id]))
+            texts[chat_id].append(data['text'])
+
+        for method, chat_id, data in merged:
+            if method != 'sendMessage':
+                yield method, chat_id, data
+                continue
+            for text in _split_messages(data):
+                yield method, chat_id, {'text': text}
+
+    def _wait_for_slot(self, chat_id):
+        sent = self._sent.setdefault(chat_id, deque())
+        now = time.monotonic()
+        while sent and now - sent[0] >= 60:
+            sent.popleft()
+        wait = 0.0
+        if sent:
+            wait = max(wait, sent[-1] + self.min_interval - now)
+        if len(sent) >= self.per_minute:
+            wait = max(wait, sent[0] + 60 - now)
+        if wait > 0:
+            time.sleep(wait)
+        sent.append(time.monotonic())
+
+    def _post(self, method, chat_id, data):
+        url = f"{self.api_base}/bot{self.bot_token}/{method}"
+        if method == 'sendMediaGroup':
+            return self._post_media_group(url, chat_id, data['media'])
+        payload = dict(data, chat_id=chat_id)
+        photo = payload.get('photo')
+        if method == 'sendPhoto' and os.path.isfile(photo):
+            return self._post_photo_file(url, payload, photo)
+        return self.session.post(url, data=payload, timeout=self.timeout)
+
+    def _post_photo_file(self, url, payload, path):
+        content, digest = _read_photo(path)
+
+        file_id = self._file_ids().get(digest)
+        if file_id is not None:
+            started = time.monotonic()
+            response = self.session.post(url, data=dict(payload, photo=file_id), timeout=self.timeout)
+            if response.status_code != 400:
+                self.photos.append(PhotoDelivery(path, 0, time.monotonic() - started, True))
+                logger.info(f"sendPhoto {path}: unchanged, re-sent by file_id")
+                return response
+            # The file_id is no longer valid, upload the bytes again
+            self._remember_file_id(digest, None)
+
+        del payload['photo']
+        started = time.monotonic()
+        response = self.session.post(url, data=payload, files={'photo': (os.path.basename(path), content)},
+                                     timeout=self.timeout)
+        seconds = time.monotonic() - started
+        if response.status_code == 200:
+            self.photos.append(PhotoDelivery(path, len(content), seconds, False))
+            logger.info(f"sendPhoto {path}: uploaded {len(content)} bytes in {seconds:.2f} s")
+            try:
+                # Sizes of the same photo, the largest last
+                self._remember_file_id(digest, response.json()['result']['photo'][-1]['file_id'])
+            except (ValueError, KeyError, IndexError, TypeError):
+                logger.info("No file_id in the sendPhoto answer")
+        return response
+
+    def _post_media_group(self, url, chat_id, media):
+        """One album; local files Telegram already has go by file_id, the others are attached"""
+        file_ids = self._file_ids()
+        entries = []
+        files = {}
+        local = []  # (index, path, digest, uploaded bytes) of the local files
+        for i, (photo, caption) in enumerate(media):
+            entry = {'type': 'photo', 'media': photo}
+            if caption:
+                entry['caption'] = caption
+            if os.path.isfile(photo):
+                content, digest = _read_photo(photo)
+                if digest in file_ids:
+                    entry['media'] = file_ids[digest]
+                    local.append((i, photo, digest, 0))
+                else:
+                    files[f'photo{i}'] = (os.path.basename(photo), content)
+                    entry['media'] = f'attach://photo{i}'
+                    local.append((i, photo, digest, len(content)))
+            entries.append(entry)
+
+        started = time.monotonic()
+        response = self.session.post(url, data={'chat_id': chat_id, 'media': json.dumps(entries)},
+                                     files=files or None, timeout=self.timeout)
+        seconds = time.monotonic() - started
+        reused = [digest for _, _, digest, uploaded in local if not uploaded]
+        if response.status_code == 400 and reused:
+            # A file_id is no longer valid, upload every photo of the album again
+            for digest in reused:
+                self._remember_file_id(digest, None)
+            return self._post_media_group(url, chat_id, media)
+        if response.status_code != 200:
+            return response
+
+        uploaded = sum(nbytes for _, _, _, nbytes in local)
+        logger.info(f"sendMediaGroup of {len(media)} photos: uploaded {uploaded} bytes in {seconds:.2f} s")
+        try:
+            messages = response.json()['result']
+        except (ValueError, KeyError, TypeError):
+            messages = []
+        for i, path, digest, nbytes in local:
+            self.photos.append(PhotoDelivery(path, nbytes, seconds, not nbytes))
+            if nbytes:
+                try:
+                    self._remember_file_id(digest, messages[i]['photo'][-1]['file_id'])
+                except (KeyError, IndexError, TypeError):
+                    logger.info(f"No file_id for {path} in the sendMediaGroup answer")
+        return response
+
+    def _file_ids(self):
+        if self.file_id_path is None:
+            return {}
+        try:
+            with open(self.file_id_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _remember_file_id(self, digest, file_id):
+        if self.file_id_path is None:
+            return
+        with file_lock(self.file_id_path + '.lock'):
+            file_ids = self._file_ids()
+            file_ids.pop(digest, None)
+            if file_id is not None:
+                file_ids[digest] = file_id
+            file_ids = dict(list(file_ids.items())[-MAX_FILE_IDS:])
+            with open(self.file_id_path + '.tmp', 'w') as f:
+                json.dump(file_ids, f)
+            os.replace(self.file_id_path + '.tmp', self.file_id_path)
+
+    def _deliver(self, method, chat_id, data):
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_slot(chat_id)
+            try:
+                response = self._post(method, chat_id, data)
+            except OSError as e:
+                # requests' ConnectionError and Timeout are OSErrors
+                delay = min(2 ** attempt, 60)
+                logger.info(f"{method} failed ({e}), retrying in {delay} s")
+                time.sleep(delay)
+                continue
+
+            if response.status_code == 200:
+                logger.info(f"{method} sent successfully")
+                return response
+            if response.status_code == 429:
+                try:
+                    delay = response.json()['parameters']['retry_after']
+                except (ValueError, KeyError, TypeError):
+                    delay = min(2 ** attempt, 60)
+                logger.info(f"{method} rate limited, retrying in {delay} s")
+            elif response.status_code >= 500:
+                delay = min(2 ** attempt, 60)
+                logger.info(f"{method} failed: {response.status_code}, retrying in {delay} s")
+            else:
+                logger.info(f"Failed to send {method}: {response.status_code} - {response.text}")
+                return response
+            time.sleep(delay)
+
+        logger.warning(f"Giving up on {method} after {self.max_retries + 1} attempts")
+        return None
+
+
+def _read_photo(path):
+    """Bytes of a local photo and their sha256"""
+    with open(path, 'rb') as image_file:
+        content = image_file.read()
+    return content, hashlib.sha256(content).hexdigest()
+
+
+def _split_messages(texts):
+    """Join queued texts with blank lines, splitting at Telegram's length limit"""
+    messages = []
+    current = ''
+    for text in texts:
+        while len(text) > MAX_MESSAGE_LENGTH:
+            messages.append(text[:MAX_MESSAGE_LENGTH])
+            text = text[MAX_MESSAGE_LENGTH:]
+        if current and len(current) + 2 + len(text) > MAX_MESSAGE_LENGTH:
+            messages.append(current)
+            current = ''
+        current = f"{current}\n\n{text}" if current else text
+    if current:
+        messages.append(current)
+    return messages
+
+
+_lock = threading.Lock()
+_notifier = None
+
+
+def notifier():
+    """Notifier shared by every bot in this process, flushed when it exits"""
+    global _notifier
+    with _lock:
+        if _notifier is None:
+            _notifier = TelegramNotifier(read_token(TELEGRAM_TOKEN_FILE), file_id_path=FILE_ID_FILE)
+            atexit.register(_notifier.close)
+        return _notifier
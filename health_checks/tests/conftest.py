@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The health check modules import each other by name, as when run from health_checks/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,116 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from baseline import (BASELINE_WEEKS, WEEKDAY, WEEKEND, daily_baseline, day_type, hourly_baseline, score_hours,
+                      window_start)
+from rollups import (MINUTE_NS, ROLLUP_RETENTION_DAYS, daily_frame, hourly_rollup, reading_durations,
+                     update_rollups)
+from spots import pack_occupancy, spot_columns
+
+
+def _daily(days=60, spots=16):
+    rng = np.random.default_rng(0)
+    dates = list(pd.date_range("2025-01-01", periods=days, freq="D").date)
+    return pd.DataFrame(rng.normal(540, 60, size=(days, spots)), index=pd.Index(dates, name="date"))
+
+
+def test_window_starts_on_a_monday_weeks_back():
+    # Thursday 2025-02-13: the window is the Mondays of the last 3 weeks up to Wednesday
+    assert window_start(date(2025, 2, 13), weeks=3) == date(2025, 1, 27)
+
+
+def test_matches_pandas_per_day_type():
+    daily = _daily()
+    for target in daily.index[25:]:
+        history = daily[(daily.index >= window_start(target)) & (daily.index < target)]
+        baseline = daily_baseline(daily, target)
+        for kind in (WEEKDAY, WEEKEND):
+            same_type = history[[day_type(d) == kind for d in history.index]]
+            assert baseline[kind].count == len(same_type)
+            assert baseline[kind].dates == list(same_type.index)
+            assert np.allclose(baseline[kind].mean, same_type.mean().to_numpy())
+            assert np.allclose(baseline[kind].std, same_type.std().to_numpy(), equal_nan=True)
+
+
+def test_late_days_are_included():
+    daily = _daily()
+    target = daily.index[40]
+    missing = daily.index[38]
+    without = daily_baseline(daily.drop(index=missing), target)[day_type(missing)]
+    with_late_day = daily_baseline(daily, target)[day_type(missing)]
+    assert with_late_day.count == without.count + 1
+
+
+def test_empty_window():
+    baseline = daily_baseline(_daily(days=3), date(2025, 1, 1))
+    assert baseline[WEEKDAY].count == 0 and not baseline[WEEKDAY].mean.any()
+    assert np.isnan(baseline[WEEKEND].std).all()
+
+
+def _planted_anomaly(days=25, spots=16):
+    times = pd.date_range('2025-03-01', periods=days * 24 * 60, freq='min')
+    hours = times.hour.to_numpy()
+    # Busy from 8 to 18, mostly empty at night
+    busy = np.where((hours >= 8) & (hours < 18), 0.8, 0.05)
+    bits = np.random.default_rng(0).random((len(times), spots)) < busy[:, None]
+    target = times[-1].date()
+    day = times.date == target
+    # On the last day spot_3 is taken all night and free from 10 to 14
+    bits[day & (hours < 5), 2] = True
+    bits[day & (hours >= 10) & (hours < 14), 2] = False
+    values = (bits * (1 << np.arange(spots - 1, -1, -1))).sum(axis=1)
+    occupancy = pack_occupancy(times.values, values, spots)
+    rollups = hourly_rollup(occupancy, reading_durations(occupancy.times, occupancy.times[-1] + MINUTE_NS))
+    return times, bits, target, rollups
+
+
+def test_hourly_baseline_matches_pandas():
+    times, bits, target, rollups = _planted_anomaly()
+    baseline = hourly_baseline(rollups, target)
+
+    df = pd.DataFrame(bits.astype(np.int64))
+    df['date'], df['hour'] = times.date, times.hour
+    per_hour = df[(df['date'] >= window_start(target)) & (df['date'] < target)].groupby(['date', 'hour']).sum()
+    kind = day_type(target)
+    same_type = per_hour[[day_type(d) == kind for d in per_hour.index.get_level_values('date')]]
+    assert baseline.count[kind] == len(same_type) // 24
+    assert np.allclose(same_type.groupby('hour').mean().to_numpy(), baseline.mean[kind])
+    assert np.allclose(same_type.groupby('hour').std().to_numpy(), baseline.std[kind])
+
+
+def test_planted_anomaly_scores_highest():
+    _, _, target, rollups = _planted_anomaly()
+    z = score_hours(rollups, target, hourly_baseline(rollups, target))
+    assert z.shape == (24, 16)
+    assert np.abs(z[:, 2]).max() > np.delete(np.abs(z), 2, axis=1).max()
+
+
+def test_rollup_store_keeps_the_baseline_window():
+    for target in pd.date_range("2025-02-10", periods=7, freq="D").date:
+        today = target + timedelta(days=1)
+        assert (today - window_start(target, BASELINE_WEEKS)).days <= ROLLUP_RETENTION_DAYS
+
+
+def test_longer_baseline_uses_days_older_than_the_raw_window(tmp_path):
+    spots, weeks = 4, 8
+    times = pd.date_range("2025-01-01", periods=60 * 24 * 12, freq="5min")
+    values = np.random.default_rng(0).integers(0, 2**spots, size=len(times))
+    now = times[-1] + pd.Timedelta(minutes=5)
+    target = times[-1].date()
+    path = str(tmp_path / 'rollups.npz')
+    # Earlier runs rolled up every day; this one only has the last 30 days of raw rows
+    update_rollups(pack_occupancy(times.values, values, spots), now, path=path)
+    recent = times >= now - pd.Timedelta(days=30)
+    occupancy = pack_occupancy(times.values[recent], values[recent], spots)
+
+    def baseline(keep_history):
+        rollups = update_rollups(occupancy, now, path=path, keep_history=keep_history)
+        return daily_baseline(daily_frame(rollups, spot_columns(spots)), target, weeks)[WEEKDAY]
+
+    full, raw_window = baseline(True), baseline(False)
+    start = window_start(target, weeks)
+    assert full.dates[0] == start < times[recent][0].date()
+    assert full.count == sum(day_type(d) == WEEKDAY for d in pd.date_range(start, target, inclusive='left').date)
+    assert raw_window.count < full.count
@@ -0,0 +1,41 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from calendar_features import calendar_features, row_calendar_features
+
+
+def _per_row(times):
+    df = pd.DataFrame({'_time': times})
+    df['date'] = df['_time'].dt.date
+    df['hour'] = df['_time'].dt.hour
+    df['minute'] = df['_time'].dt.minute
+    df['day_of_week'] = df['_time'].dt.day_name()
+    df['day_of_week_num'] = df['_time'].dt.dayofweek
+    df['is_weekend'] = df['day_of_week_num'] >= 5
+    df['week_number'] = df['_time'].dt.isocalendar().week
+    df['year'] = df['_time'].dt.year
+    df['week_id'] = df['year'].astype(str) + '-W' + df['week_number'].astype(str).str.zfill(2)
+    return df.drop(columns='_time')
+
+
+def test_row_features_match_the_per_row_dt_accessors():
+    # Across a year boundary, where ISO weeks and years disagree
+    times = pd.Series(pd.date_range('2025-12-26', periods=10 * 24 * 4, freq='15min', tz='UTC'))
+    features = row_calendar_features(times)
+    expected = _per_row(times)
+    assert list(features.columns) == list(expected.columns)
+    for column in expected:
+        got = features[column]
+        got = got.astype(object) if isinstance(got.dtype, pd.CategoricalDtype) else got.astype(np.int64)
+        want = expected[column].astype(object if expected[column].dtype == object else np.int64)
+        assert (got.to_numpy() == want.to_numpy()).all(), column
+
+
+def test_features_of_dates_keep_the_index():
+    features = calendar_features([date(2026, 1, 3), date(2026, 1, 5), date(2026, 1, 3)], index=[10, 11, 12])
+    assert features.index.tolist() == [10, 11, 12]
+    assert features['day_of_week'].tolist() == ['Saturday', 'Monday', 'Saturday']
+    assert features['is_weekend'].tolist() == [True, False, True]
+    assert features['week_id'].tolist() == ['2026-W01', '2026-W02', '2026-W01']
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from matplotlib.image import imread
+
+import dashboard
+from dashboard import DashboardData, DashboardJob, render_dashboard, render_dashboards
+
+
+@pytest.fixture
+def two_workers(monkeypatch):
+    # The pool is used from 2 workers on, whatever the number of cores of the host
+    monkeypatch.setattr(dashboard, 'RENDER_WORKERS', 2)
+    yield
+    if dashboard._pool is not None:
+        dashboard._pool.shutdown()
+        dashboard._pool = None
+
+
+def _jobs(tmp_path, lots, prefix):
+    rng = np.random.default_rng(0)
+    weeks = ['2026-W01', '2026-W02', '2026-W03', '2026-W04']
+    jobs = []
+    for lot in range(lots):
+        data = DashboardData(weeks, rng.uniform(100, 200, 4), rng.uniform(0, 10, (4, 24)), rng.uniform(0, 50, (4, 16)))
+        jobs.append(DashboardJob(data, f'lot {lot}', str(tmp_path / f'{prefix}{lot}')))
+    return jobs
+
+
+def test_pool_renders_the_same_images_in_order(tmp_path, two_workers):
+    jobs = _jobs(tmp_path, 3, 'pool')
+    pooled = render_dashboards(jobs)
+    assert dashboard._pool is not None
+    assert [image.path.rsplit('.', 1)[0] for image in pooled] == [job.stem for job in jobs]
+    in_process = [render_dashboard(job.data, job.title, job.stem) for job in _jobs(tmp_path, 3, 'local')]
+    for a, b in zip(pooled, in_process):
+        # Same picture; anti-aliasing may differ by a few pixels between processes
+        assert np.abs(imread(a.path) - imread(b.path)).mean() < 0.01
+
+
+def test_single_dashboard_is_drawn_in_process(tmp_path, two_workers):
+    images = render_dashboards(_jobs(tmp_path, 1, 'one'))
+    assert len(images) == 1 and dashboard._pool is None
@@ -0,0 +1,99 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from fleet import MAX_LATENESS, MAX_POLL, MIN_POLL, REPEAT_ALERT, AlertDecision, alert_decision, next_poll_delay, update_fleet
+
+NOW = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def test_new_stale_device_alerts_then_repeats_up_to_max(tmp_path):
+    path = str(tmp_path / 'alerts.json')
+    stale = [('tvbox-btv-01', 15.0)]
+    sent = [alert_decision(stale, NOW + i * REPEAT_ALERT, 3, path=path).send for i in range(5)]
+    assert sent == [True, True, True, False, False]
+
+
+def test_recovery_resets_the_state(tmp_path):
+    path = str(tmp_path / 'alerts.json')
+    alert_decision([('tvbox-btv-01', 15.0)], NOW, 3, path=path)
+    assert alert_decision([], NOW + REPEAT_ALERT, 3, path=path) == AlertDecision(False, ['tvbox-btv-01'])
+    assert alert_decision([('tvbox-btv-01', 15.0)], NOW + 2 * REPEAT_ALERT, 3, path=path).send
+
+
+def test_no_data_is_a_flag_not_a_device(tmp_path):
+    path = str(tmp_path / 'alerts.json')
+    assert alert_decision([], NOW, 3, path=path, no_data=True).send
+    assert not alert_decision([], NOW + timedelta(minutes=1), 3, path=path, no_data=True).send
+    assert alert_decision([], NOW + REPEAT_ALERT, 3, path=path, no_data=True).send
+    with open(path) as f:
+        state = json.load(f)
+    assert state['no_data'] and state['alerted'] == []
+
+    # Every device back: no made-up device recovers
+    assert alert_decision([], NOW + 2 * REPEAT_ALERT, 3, path=path) == AlertDecision(False, [])
+
+
+def test_stale_devices_after_no_data_alert(tmp_path):
+    path = str(tmp_path / 'alerts.json')
+    alert_decision([], NOW, 3, path=path, no_data=True)
+    decision = alert_decision([('tvbox-btv-02', 30.0)], NOW + timedelta(minutes=1), 3, path=path)
+    assert decision == AlertDecision(True, [])
+
+
+def test_excluded_devices_leave_the_fleet(tmp_path):
+    path = str(tmp_path / 'fleet.json')
+    seen = {'tvbox-btv-01': NOW, 'tvbox-e10-01': NOW - timedelta(hours=1)}
+    assert set(update_fleet(seen, NOW, path=path)) == {'tvbox-btv-01', 'tvbox-e10-01'}
+    # Also when it was remembered from before it was excluded
+    assert set(update_fleet({}, NOW, path=path, exclude_ids=('tvbox-e10-01',))) == {'tvbox-btv-01'}
+
+
+def test_poll_when_the_first_healthy_device_could_be_reported_stale():
+    fleet_times = {'a': NOW - timedelta(minutes=4), 'b': NOW - timedelta(minutes=1)}
+    assert next_poll_delay(fleet_times, NOW, 10) == 6 * 60 + MAX_LATENESS.total_seconds()
+    # Stale devices do not count, the floor keeps polling tight around the deadline
+    fleet_times = {'a': NOW - timedelta(minutes=30), 'b': NOW - timedelta(minutes=11, seconds=55)}
+    assert next_poll_delay(fleet_times, NOW, 10) == MIN_POLL.total_seconds()
+    # A device clock ahead of ours
+    assert next_poll_delay({'a': NOW + timedelta(days=1)}, NOW, 10) == 10 * 60 + MAX_LATENESS.total_seconds()
+    # Only stale devices: wait for recoveries
+    assert next_poll_delay({'a': NOW - timedelta(hours=1)}, NOW, 10) == MAX_POLL.total_seconds()
+
+
+def _detection(writes, next_delay, tolerance_s=600):
+    """(polls, seconds until each outage is seen) of polling a feed of write times"""
+    gaps = np.flatnonzero(np.diff(writes) > tolerance_s)
+    late_at = writes[gaps] + tolerance_s
+    detected = np.full(len(gaps), np.nan)
+    t, polls = 0.0, 0
+    while t < writes[-1]:
+        polls += 1
+        newest = writes[np.searchsorted(writes, t, side='right') - 1]
+        if t - newest > tolerance_s:
+            outage = np.searchsorted(late_at, t, side='right') - 1
+            if np.isnan(detected[outage]):
+                detected[outage] = t - late_at[outage]
+        t += next_delay(newest, t)
+    return polls, detected
+
+
+def test_adaptive_polling_sees_outages_sooner_with_fewer_queries_than_cron():
+    rng = np.random.default_rng(0)
+    days = 2
+    writes = np.arange(0, days * 86400, 60.0) + rng.uniform(0, 5, size=days * 1440)
+    for start in rng.uniform(3600, days * 86400 - 7200, size=8):
+        writes = writes[(writes < start) | (writes > start + rng.uniform(15, 120) * 60)]
+
+    def adaptive(newest, t):
+        return next_poll_delay({'tvbox': NOW + timedelta(seconds=newest)}, NOW + timedelta(seconds=t), 10)
+
+    adaptive_polls, adaptive_detected = _detection(writes, adaptive)
+    cron_polls, cron_detected = _detection(writes, lambda newest, t: 600.0)
+    assert not np.isnan(adaptive_detected).any()
+    # Steady devices are polled a bit less than every tolerance, outages are
+    # reported at most MAX_LATENESS late instead of up to a cron period
+    assert adaptive_polls < cron_polls
+    assert adaptive_detected.max() < MAX_LATENESS.total_seconds() + 1
+    assert np.nanmean(adaptive_detected) < np.nanmean(cron_detected) / 2
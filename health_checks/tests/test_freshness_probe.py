@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+from functools import partial
+
+import pytest
+
+import fleet
+import freshness_probe
+from fleet import stale_devices
+from freshness_probe import check_fleet, parse_last_row, parse_last_rows, parse_time
+from lots import DEFAULT_LOT, DEFAULT_LOTS
+
+END = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+
+def _grouped(rows):
+    """Grouped last() response: one table per pi-id with its newest row"""
+    return ''.join(
+        '#datatype,string,long,dateTime:RFC3339,long,string\n'
+        '#group,false,false,false,false,true\n'
+        '#default,_result,,,,\n'
+        ',result,table,_time,_value,pi-id\n'
+        f',,{i},{t:%Y-%m-%dT%H:%M:%SZ},65535,{device}\n\n'
+        for i, (device, t) in enumerate(rows))
+
+
+def test_newest_row_of_every_device_and_the_stale_ones():
+    ids = [f'tvbox-btv-{i:03d}' for i in range(50)]
+    ages = [1] * 45 + [20, 30, 40, 50, 60]
+    newest = parse_last_rows(_grouped([(d, END - timedelta(minutes=a)) for d, a in zip(ids, ages)]))
+    assert len(newest) == 50 and newest['tvbox-btv-000'] == (END - timedelta(minutes=1), 65535)
+    stale = stale_devices({d: t for d, (t, _) in newest.items()}, END, 10)
+    assert [d for d, _ in stale] == ids[:44:-1]
+
+
+def test_newest_row_over_tables():
+    body = _grouped([('a', END - timedelta(minutes=5)), ('b', END - timedelta(minutes=2))])
+    assert parse_last_row(body) == (END - timedelta(minutes=2), 65535)
+    assert parse_last_row('') is None
+
+
+def test_nanosecond_timestamps():
+    assert parse_time('2025-06-01T00:00:00.123456789Z') == END + timedelta(microseconds=123456)
+
+
+def test_error_response_raises():
+    with pytest.raises(RuntimeError, match='bucket not found'):
+        parse_last_rows(',error,reference\n,bucket not found,404\n')
+
+
+def test_bucket_org_excludes_and_chat_come_from_the_lot(monkeypatch, tmp_path):
+    lot = DEFAULT_LOTS[DEFAULT_LOT]._replace(bucket='p2_parking', org='Other', exclude_ids=('tvbox-e10-04',),
+                                             chat_id='-100123')
+    now = datetime.now(timezone.utc)
+    queries, sent = [], []
+
+    def query_csv(query, org):
+        queries.append((query, org))
+        return _grouped([('tvbox-btv-01', now - timedelta(minutes=1)), ('tvbox-btv-02', now - timedelta(minutes=30))])
+
+    monkeypatch.setattr(freshness_probe, 'query_csv', query_csv)
+    monkeypatch.setattr(freshness_probe, 'send_message_to_telegram', lambda chat, message: sent.append(chat))
+    monkeypatch.setattr(freshness_probe, 'update_fleet', partial(fleet.update_fleet, path=str(tmp_path / 'fleet.json')))
+    monkeypatch.setattr(freshness_probe, 'alert_decision',
+                        partial(fleet.alert_decision, path=str(tmp_path / 'alerts.json')))
+    fleet_times, _ = check_fleet(lot)
+    query, org = queries[0]
+    assert 'from(bucket: "p2_parking")' in query and 'r["pi-id"] != "tvbox-e10-04"' in query
+    assert org == 'Other'
+    assert set(fleet_times) == {'tvbox-btv-01', 'tvbox-btv-02'}
+    assert sent == ['-100123']
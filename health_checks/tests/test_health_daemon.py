@@ -0,0 +1,77 @@
+import logging
+from datetime import datetime, timedelta
+
+import health_daemon
+from health_daemon import Lane, next_run
+
+DAY = datetime(2026, 10, 1)
+
+
+class Clock:
+    """Stands in for datetime.now and the lane's stop event; time only moves
+    while the lane waits or a job runs. Waiting past `until` stops the lane."""
+
+    def __init__(self, now, until):
+        self.time = now
+        self.until = until
+        self.stopped = False
+
+    def now(self):
+        return self.time
+
+    def wait(self, seconds):
+        if self.time + timedelta(seconds=seconds) > self.until:
+            self.stopped = True
+        else:
+            self.time += timedelta(seconds=seconds)
+        return self.stopped
+
+    def is_set(self):
+        return self.stopped
+
+
+def _run_lane(monkeypatch, clock, durations, intervals):
+    """Run a lane of jobs taking `durations` (minutes, one per run) and return [(job, start time)]"""
+    monkeypatch.setattr(health_daemon, 'datetime', clock)
+    # Not into the daemon's log file
+    monkeypatch.setattr(health_daemon, 'logger', logging.getLogger(__name__))
+    runs = []
+
+    def job(name):
+        def entry():
+            runs.append((name, clock.time))
+            clock.time += timedelta(minutes=durations[name].pop(0) if durations[name] else 1)
+            if name == 'failing':
+                raise RuntimeError('InfluxDB is down')
+        return entry
+
+    Lane('test', [(name, 'test', interval, job(name)) for name, interval in intervals], clock).run()
+    return runs
+
+
+def test_next_run_is_aligned_like_cron():
+    assert next_run(timedelta(minutes=10), DAY.replace(hour=12, minute=3, second=20)) == DAY.replace(hour=12, minute=10)
+    # A tick that is exactly now already fired
+    assert next_run(timedelta(hours=1), DAY.replace(hour=12)) == DAY.replace(hour=13)
+    assert next_run(timedelta(days=1), DAY.replace(hour=23, minute=59)) == DAY + timedelta(days=1)
+
+
+def test_ticks_missed_during_a_long_run_are_skipped(monkeypatch):
+    clock = Clock(DAY.replace(minute=3), until=DAY.replace(minute=55))
+    runs = _run_lane(monkeypatch, clock, {'failing': [25]}, [('failing', timedelta(minutes=10))])
+    # The 00:20 and 00:30 ticks fall in the first run; a failure does not stop the lane
+    assert [t.strftime('%H:%M') for _, t in runs] == ['00:10', '00:40', '00:50']
+
+
+def test_lane_mate_that_came_due_runs_right_after(monkeypatch):
+    clock = Clock(DAY - timedelta(minutes=30), until=DAY.replace(hour=2, minute=30))
+    runs = _run_lane(monkeypatch, clock, {'hourly': [20, 20], 'daily': [50]},
+                     [('hourly', timedelta(hours=1)), ('daily', timedelta(days=1))])
+    assert [(name, t.strftime('%H:%M')) for name, t in runs] == [
+        ('hourly', '00:00'),
+        # Due at midnight too, it runs once the hourly job is done
+        ('daily', '00:20'),
+        # Its 01:00 tick came during the daily job, so it is late, not skipped
+        ('hourly', '01:10'),
+        ('hourly', '02:00'),
+    ]
@@ -0,0 +1,52 @@
+import io
+
+import numpy as np
+import pytest
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from image_export import MIN_DPI, TARGET_BYTES, export_figure
+
+
+@pytest.fixture
+def fig():
+    """A dashboard-like figure: bars and lines with a grid"""
+    rng = np.random.default_rng(0)
+    fig = Figure(figsize=(18, 12))
+    FigureCanvasAgg(fig)
+    ax1, ax2 = fig.add_subplot(2, 2, 1), fig.add_subplot(2, 2, 2)
+    ax1.bar(np.arange(4), rng.uniform(500, 900, 4), color='steelblue', alpha=0.8)
+    for week in range(4):
+        ax2.plot(np.arange(24), rng.uniform(0, 60, 24), marker='o', linewidth=2, label=f'week {week}')
+    ax2.legend()
+    ax3 = fig.add_subplot(2, 1, 2)
+    for week in range(4):
+        ax3.bar(np.arange(16) + week * 0.2, rng.uniform(20, 60, 16), width=0.2, alpha=0.8)
+    for ax in (ax2, ax3):
+        ax.grid(True, alpha=0.3)
+    return fig
+
+
+@pytest.mark.parametrize('fmt', ['png', 'jpeg', 'webp'])
+def test_every_format_fits_the_target(fig, tmp_path, fmt):
+    image = export_figure(fig, str(tmp_path / 'dashboard'), fmt=fmt)
+    assert image.nbytes <= TARGET_BYTES
+    assert image.nbytes == len(open(image.path, 'rb').read())
+    assert (image.quality is None) == (fmt == 'png')
+
+
+def test_palette_png_is_smaller_than_the_default(fig, tmp_path):
+    default = io.BytesIO()
+    fig.savefig(default, format='png')
+    image = export_figure(fig, str(tmp_path / 'dashboard'), fmt='png')
+    assert image.nbytes < len(default.getvalue()) / 2
+
+
+def test_dpi_is_lowered_down_to_the_minimum(fig, tmp_path):
+    image = export_figure(fig, str(tmp_path / 'dashboard'), fmt='png', target_bytes=1024)
+    assert image.dpi == MIN_DPI
+
+
+def test_unknown_format(fig, tmp_path):
+    with pytest.raises(ValueError):
+        export_figure(fig, str(tmp_path / 'dashboard'), fmt='gif')
@@ -0,0 +1,155 @@
+import os
+import re
+from datetime import timedelta
+
+import pandas as pd
+
+from influx_cache import _segment_days, cache_covers, fetch_cached, read_cache, refresh_cache
+
+OVERLAP = timedelta(minutes=10)
+
+
+class Response:
+    def __init__(self, lines):
+        self.lines = lines
+
+    def __iter__(self):
+        return (line.encode() for line in self.lines)
+
+    def close(self):
+        pass
+
+
+class QueryApi:
+    """Stands in for InfluxDB: answers the range() of every query from `rows`"""
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)  # (time, value, pi-id)
+        self.queries = []
+
+    def query_raw(self, query, org=None):
+        self.queries.append(query)
+        value_type = 'string' if any(value >= 2**64 for _, value, _ in self.rows) else 'long'
+        start = re.search(r'range\(start: ([^,)]+)', query).group(1)
+        if start.startswith('-'):
+            start = pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=int(start[1:-1]))
+        else:
+            start = pd.Timestamp(start)
+        lines = [f'#datatype,string,long,dateTime:RFC3339,{value_type},string\n',
+                 '#group,false,false,false,false,true\n',
+                 '#default,_result,,,,\n',
+                 ',result,table,_time,_value,pi-id\n']
+        lines += [f',,0,{t.strftime("%Y-%m-%dT%H:%M:%S.%fZ")},{value},{device}\n'
+                  for t, value, device in self.rows if t >= start]
+        return Response(lines + ['\n'])
+
+    def since(self, i=-1):
+        """start of the range() of the i-th query"""
+        return re.search(r'range\(start: ([^,)]+)', self.queries[i]).group(1)
+
+
+def _minutes(start, count, device='tvbox-btv-01', value=1):
+    return [(start + pd.Timedelta(minutes=i), value, device) for i in range(count)]
+
+
+def _now():
+    return pd.Timestamp.now(tz='UTC').floor('min')
+
+
+def test_second_run_only_asks_for_rows_past_the_high_water_mark(tmp_path):
+    cache_dir = str(tmp_path)
+    now = _now()
+    query_api = QueryApi(_minutes(now - pd.Timedelta(hours=50), 48 * 60))
+    first = refresh_cache(query_api, 'bucket', 3, cache_dir=cache_dir, overlap=OVERLAP)
+    assert query_api.since() == '-3d'
+    assert first == query_api.rows[-1][0]
+
+    query_api.rows += _minutes(now - pd.Timedelta(minutes=119), 60)
+    second = refresh_cache(query_api, 'bucket', 3, cache_dir=cache_dir, overlap=OVERLAP)
+    assert pd.Timestamp(query_api.since()) == first - OVERLAP
+    assert second == query_api.rows[-1][0]
+    assert len(read_cache(now - pd.Timedelta(days=3), cache_dir=cache_dir)) == 49 * 60
+
+
+def test_overlapping_rows_are_kept_once_with_the_newest_value(tmp_path):
+    cache_dir = str(tmp_path)
+    start = _now() - pd.Timedelta(hours=2)
+    query_api = QueryApi(_minutes(start, 60, value=1))
+    refresh_cache(query_api, 'bucket', 1, cache_dir=cache_dir, overlap=OVERLAP)
+
+    # The last minute is written again with a new value; another device has the same times
+    query_api.rows[-1] = (query_api.rows[-1][0], 7, 'tvbox-btv-01')
+    query_api.rows += _minutes(start, 60, device='tvbox-btv-02', value=2)
+    refresh_cache(query_api, 'bucket', 1, cache_dir=cache_dir, overlap=OVERLAP)
+
+    cached = read_cache(start, cache_dir=cache_dir)
+    assert not cached.duplicated(subset=['_time', 'pi-id']).any()
+    # The second device's rows older than the overlap are not asked for again
+    assert (cached['pi-id'] == 'tvbox-btv-02').sum() == 11
+    rewritten = (cached['pi-id'] == 'tvbox-btv-01') & (cached['_time'] == query_api.rows[59][0])
+    assert cached.loc[rewritten, '_value'].tolist() == [7]
+
+
+def test_days_past_the_retention_are_pruned(tmp_path):
+    cache_dir = str(tmp_path)
+    now = _now()
+    query_api = QueryApi(_minutes(now - pd.Timedelta(days=5), 5 * 24 * 60, value=3))
+    refresh_cache(query_api, 'bucket', 6, cache_dir=cache_dir, retention_days=6)
+    assert len(_segment_days(cache_dir)) >= 5
+
+    refresh_cache(query_api, 'bucket', 2, cache_dir=cache_dir, retention_days=2)
+    oldest = (now - pd.Timedelta(days=2)).date()
+    assert _segment_days(cache_dir)[0] == oldest
+    assert read_cache(now - pd.Timedelta(days=6), cache_dir=cache_dir)['_time'].min().date() == oldest
+    # The cache no longer covers what was pruned
+    assert not cache_covers(now - pd.Timedelta(days=3), cache_dir=cache_dir)
+
+
+def test_changed_exclude_ids_fetch_the_whole_window_again(tmp_path):
+    cache_dir = str(tmp_path)
+    start = _now() - pd.Timedelta(hours=2)
+    query_api = QueryApi(_minutes(start, 60) + _minutes(start, 60, device='tvbox-e10-01'))
+    refresh_cache(query_api, 'bucket', 1, cache_dir=cache_dir)
+    refresh_cache(query_api, 'bucket', 1, exclude_ids=['tvbox-e10-01'], cache_dir=cache_dir)
+    assert query_api.since() == '-1d' and 'tvbox-e10-01' in query_api.queries[-1]
+    assert set(read_cache(start, cache_dir=cache_dir)['pi-id']) == {'tvbox-btv-01'}
+
+    # The same excludes in another order are the same cache
+    refresh_cache(query_api, 'bucket', 1, exclude_ids=('tvbox-e10-01',), cache_dir=cache_dir)
+    assert query_api.since() != '-1d'
+
+
+def test_cache_covers_the_refreshed_window_only(tmp_path):
+    cache_dir = str(tmp_path)
+    now = _now()
+    assert not cache_covers(now - pd.Timedelta(days=1), cache_dir=cache_dir)
+
+    query_api = QueryApi(_minutes(now - pd.Timedelta(hours=30), 60))
+    refresh_cache(query_api, 'bucket', 2, exclude_ids=['tvbox-e10-01'], cache_dir=cache_dir)
+    assert cache_covers(now - pd.Timedelta(days=1), exclude_ids=['tvbox-e10-01'], cache_dir=cache_dir)
+    assert not cache_covers(now - pd.Timedelta(days=3), exclude_ids=['tvbox-e10-01'], cache_dir=cache_dir)
+    assert not cache_covers(now - pd.Timedelta(days=1), cache_dir=cache_dir)
+
+
+def test_empty_bucket(tmp_path):
+    cache_dir = str(tmp_path)
+    assert refresh_cache(QueryApi(), 'bucket', 1, cache_dir=cache_dir) is None
+    assert not os.path.exists(os.path.join(cache_dir, 'meta.json'))
+    assert fetch_cached(QueryApi(), 'bucket', 1, cache_dir=cache_dir).empty
+
+
+def test_masks_of_more_than_64_spots_are_cached_as_words(tmp_path):
+    cache_dir = str(tmp_path)
+    start = _now() - pd.Timedelta(hours=2)
+    query_api = QueryApi(_minutes(start, 60, value=2**99 + 3))
+    refresh_cache(query_api, 'bucket', 1, cache_dir=cache_dir, value_words=2)
+    query_api.rows += _minutes(start + pd.Timedelta(hours=1), 10, value=2**64)
+    refresh_cache(query_api, 'bucket', 1, cache_dir=cache_dir, value_words=2)
+    cached = read_cache(start, cache_dir=cache_dir)
+    assert cached['_value'].tolist() == [2**99 + 3] * 60 + [2**64] * 10
+    assert cache_covers(start, cache_dir=cache_dir, value_words=2)
+
+    # A lot that changes its spot count is fetched again
+    assert not cache_covers(start, cache_dir=cache_dir)
+    refresh_cache(query_api, 'bucket', 1, cache_dir=cache_dir, value_words=3)
+    assert query_api.since() == '-1d'
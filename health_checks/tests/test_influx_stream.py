@@ -0,0 +1,159 @@
+import os
+import subprocess
+import sys
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+from influxdb_client.client.flux_csv_parser import FluxQueryException
+
+import influx_stream
+from influx_stream import (MAX_CHUNK_ROWS, MEMORY_BUDGET_MB, MIN_CHUNK_ROWS, ROW_PARSE_BYTES,
+                           chunk_rows_for_budget, stream_rows, to_frame)
+
+T0 = np.datetime64('2025-01-01T00:00:00', 's')
+
+
+def table(rows, value_type='long', columns=('_start', '_time', '_value', '_field', 'pi-id')):
+    """Annotated CSV lines of one Flux table; rows are (seconds after T0, value, pi-id)"""
+    types = {'_start': 'dateTime:RFC3339', '_time': 'dateTime:RFC3339', '_value': value_type,
+             '_field': 'string', 'pi-id': 'string'}
+    yield '#datatype,string,long,' + ','.join(types[c] for c in columns) + '\n'
+    yield '#group,false,false,' + ','.join('true' if c in ('_field', 'pi-id') else 'false' for c in columns) + '\n'
+    yield '#default,_result,,' + ','.join('' for _ in columns) + '\n'
+    yield ',result,table,' + ','.join(columns) + '\n'
+    for seconds, value, device in rows:
+        cells = {'_start': f'{T0}Z', '_time': f'{T0 + seconds}Z', '_value': str(value),
+                 '_field': 'value', 'pi-id': device}
+        yield ',,0,' + ','.join(cells[c] for c in columns) + '\n'
+    yield '\n'
+
+
+class Response:
+    def __init__(self, lines):
+        self.lines = lines
+        self.closed = False
+
+    def __iter__(self):
+        return (line.encode() for line in self.lines)
+
+    def close(self):
+        self.closed = True
+
+
+class QueryApi:
+    def __init__(self, *tables):
+        self.tables = tables
+        self.responses = []
+
+    def query_raw(self, query, org=None):
+        self.responses.append(Response(line for t in self.tables for line in t))
+        return self.responses[-1]
+
+
+def test_parses_times_values_and_devices():
+    query_api = QueryApi(table([(0, 3, 'tvbox-btv-01'), (60, 5, 'tvbox-btv-02'), (120, 7, 'tvbox-btv-01')]))
+    rows = stream_rows(query_api, '')
+    assert rows.times.tolist() == [pd.Timestamp(f'{T0 + s}', tz='UTC').value for s in (0, 60, 120)]
+    assert rows.values.tolist() == [3, 5, 7]
+    assert [rows.device_ids[c] for c in rows.device_codes] == ['tvbox-btv-01', 'tvbox-btv-02', 'tvbox-btv-01']
+    assert query_api.responses[0].closed
+
+
+def test_double_and_unsigned_values():
+    query_api = QueryApi(table([(0, '3.0', 'a'), (60, '65535.0', 'a')], value_type='double'),
+                         table([(120, 2**64 - 1, 'a')], value_type='unsignedLong'))
+    rows = stream_rows(query_api, '', bit_length=64)
+    assert rows.values.dtype == np.int64
+    assert rows.values[:2].tolist() == [3, 65535]
+    # All 64 spots of an unsignedLong mask survive the int64 buffer
+    assert rows.values[2:].view(np.uint64).tolist() == [2**64 - 1]
+    assert rows.spots[2].all() and rows.spots[1].sum() == 16
+
+
+def test_masks_of_more_than_64_spots():
+    # Written as decimal strings, kept as two uint64 words per row
+    masks = [2**99 + 1, 2**64, 5]
+    rows = stream_rows(QueryApi(table([(60 * i, m, 'a') for i, m in enumerate(masks)], value_type='string')), '',
+                       bit_length=100)
+    assert rows.values.shape == (3, 2) and rows.values.dtype == np.uint64
+    assert rows.spots.shape == (3, 100)
+    assert rows.spots[0].nonzero()[0].tolist() == [0, 99]
+    assert to_frame(rows)['_value'].tolist() == masks
+
+
+def test_only_time_value_and_device_are_kept():
+    # Extra columns are skipped, and a table without pi-id still parses
+    columns = ('_time', '_field', '_value')
+    frame = to_frame(stream_rows(QueryApi(table([(0, 1, None), (60, 2, None)], columns=columns)), ''))
+    assert list(frame.columns) == ['_time', '_value', 'pi-id']
+    assert frame['_value'].tolist() == [1, 2]
+    assert frame['_time'].dt.tz is not None
+
+
+def test_window_and_excluded_devices_are_dropped():
+    rows = [(s, s, device) for s in range(0, 600, 60) for device in ('tvbox-btv-01', 'tvbox-e10-01')]
+    start = pd.Timestamp(f'{T0 + 120}', tz='UTC')
+    stop = pd.Timestamp(f'{T0 + 300}', tz='UTC')
+    frame = to_frame(stream_rows(QueryApi(table(rows)), '', start=start, stop=stop, exclude_ids=['tvbox-e10-01']))
+    assert frame['_value'].tolist() == [120, 180, 240]
+    assert set(frame['pi-id']) == {'tvbox-btv-01'}
+
+
+def test_error_table_raises():
+    error = iter(['#datatype,string,string\n', ',error,reference\n', ',bucket not found,404\n'])
+    with pytest.raises(FluxQueryException) as raised:
+        stream_rows(QueryApi(error), '')
+    assert raised.value.message == 'bucket not found'
+
+
+def test_chunk_rows_follow_the_budget():
+    assert chunk_rows_for_budget(0) == MIN_CHUNK_ROWS
+    assert chunk_rows_for_budget(100_000) == MAX_CHUNK_ROWS
+
+
+def test_memory_stays_within_buffers_and_one_chunk(monkeypatch):
+    chunk_rows = 2_000
+    monkeypatch.setattr(influx_stream, 'chunk_rows_for_budget', lambda memory_budget_mb: chunk_rows)
+    count = 50_000
+    query_api = QueryApi(table((i, i % 65536, f'tvbox-btv-0{i % 3}') for i in range(count)))
+
+    tracemalloc.start()
+    try:
+        rows = stream_rows(query_api, '')
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert len(rows.times) == count
+    # int64 times and values and int16 codes, which may be doubling, plus the pending chunk;
+    # holding every row as strings would take about count * ROW_PARSE_BYTES
+    assert peak < 3 * count * (8 + 8 + 2) + chunk_rows * ROW_PARSE_BYTES
+
+
+def _ingest_ninety_days():
+    """Run in a fresh interpreter: 90 days of per-minute rows of 4 devices, generated
+    line by line; prints the rows kept and the peak RSS in bytes"""
+    def minutes(device):
+        return ((60 * m, m % 65536, device) for m in range(90 * 1440))
+
+    devices = ['tvbox-btv-01', 'tvbox-btv-02', 'tvbox-btv-03', 'tvbox-e10-01']
+    query_api = QueryApi(*(table(minutes(device)) for device in devices))
+    rows = stream_rows(query_api, '', exclude_ids=['tvbox-e10-01'], bit_length=16)
+    with open('/proc/self/status') as f:
+        # Peak RSS of this process image; ru_maxrss would carry over the pytest process it was forked from
+        peak_kib = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+    print(len(rows.times), peak_kib * 1024)
+
+
+def test_ninety_days_stay_under_the_memory_budget():
+    # Not in this process, whose peak RSS is that of every test run before it
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, '-W', 'ignore', '-c',
+                             'import test_influx_stream; test_influx_stream._ingest_ninety_days()'],
+                            cwd=tests_dir, env=dict(os.environ, PYTHONPATH=os.path.dirname(tests_dir)),
+                            capture_output=True, text=True, check=True)
+    rows, peak_bytes = map(int, result.stdout.split())
+    assert rows == 3 * 90 * 1440
+    assert peak_bytes < MEMORY_BUDGET_MB * 2**20
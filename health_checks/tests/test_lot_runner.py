@@ -0,0 +1,98 @@
+import threading
+import time
+
+from lot_runner import run_lots, timings_table
+from lots import DEFAULT_LOT, DEFAULT_LOTS
+
+LOT = DEFAULT_LOTS[DEFAULT_LOT]
+
+
+class Response:
+    def __init__(self, on_close):
+        self.on_close = on_close
+
+    def __iter__(self):
+        return iter([b'\n'])
+
+    def close(self):
+        self.on_close()
+
+
+class QueryApi:
+    """Queries that take `latency` seconds, counting the ones in flight"""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.in_flight = self.most_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            self.in_flight += 1
+            self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        time.sleep(self.latency)
+
+    def _done(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def query_raw(self, query, org=None):
+        self._start()
+        return Response(self._done)
+
+    def query_data_frame(self, query, org=None):
+        self._start()
+        self._done()
+        return query
+
+
+def _pipeline(query_api, lot):
+    # A streamed query that holds its slot until closed, then a frame query
+    response = query_api.query_raw('window')
+    time.sleep(0.02)
+    response.close()
+    return query_api.query_data_frame(lot.name)
+
+
+def test_queries_in_flight_stay_under_the_limit():
+    query_api = QueryApi()
+    runs = run_lots([LOT] * 12, _pipeline, workers=8, max_queries=3, query_api=query_api)
+    assert query_api.most_in_flight == 3 and query_api.in_flight == 0
+    assert [run.result for run in runs] == [LOT.name] * 12
+    assert all(run.queries == 2 and not run.error for run in runs)
+    assert max(run.wait_seconds for run in runs) > 0
+
+
+def test_failing_lot_does_not_stop_the_others():
+    other = LOT._replace(name='broken')
+
+    def pipeline(query_api, lot):
+        if lot.name == 'broken':
+            query_api.query_raw('window')
+            raise RuntimeError('no data')
+        return _pipeline(query_api, lot)
+
+    query_api = QueryApi()
+    runs = run_lots([LOT, other, LOT], pipeline, max_queries=1, query_api=query_api)
+    assert [run.result for run in runs] == [LOT.name, None, LOT.name]
+    assert 'RuntimeError: no data' in runs[1].error
+    assert runs[0].error is None and runs[2].error is None
+
+
+def test_raising_query_gives_its_slot_back():
+    class FailingQueryApi(QueryApi):
+        def query_raw(self, query, org=None):
+            raise ConnectionError('refused')
+
+    def pipeline(query_api, lot):
+        query_api.query_raw('window')
+
+    runs = run_lots([LOT] * 3, pipeline, max_queries=1, query_api=FailingQueryApi())
+    assert all('ConnectionError' in run.error for run in runs)
+
+
+def test_timings_table_has_one_line_per_lot():
+    runs = run_lots([LOT, LOT._replace(name='ic3')], _pipeline, query_api=QueryApi(latency=0))
+    lines = timings_table(runs).splitlines()
+    assert len(lines) == 3
+    assert lines[1].split()[:2] == [LOT.name, 'ok'] and lines[2].split()[:2] == ['ic3', 'ok']
@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+from lots import DEFAULT_LOT, load_lots
+
+
+def _write(tmp_path, config):
+    path = tmp_path / 'lots.json'
+    path.write_text(json.dumps(config))
+    return str(path)
+
+
+def test_defaults_without_a_file(tmp_path):
+    lots = load_lots(str(tmp_path / 'missing.json'))
+    assert list(lots) == [DEFAULT_LOT]
+    assert lots[DEFAULT_LOT].spot_count == 16
+
+
+def test_lot_with_64_spots_loads(tmp_path):
+    path = _write(tmp_path, {'p2': {'bucket': 'p2_parking', 'spot_count': 64,
+                                    'special_mask': '0x8000000000000000'}})
+    lot = load_lots(path)['p2']
+    assert lot.spot_count == 64 and lot.special_mask == 1 << 63
+
+
+def test_lot_with_more_than_64_spots_loads(tmp_path):
+    path = _write(tmp_path, {'p2': {'bucket': 'p2_parking', 'spot_count': 100, 'special_mask': 1 << 99}})
+    lot = load_lots(path)['p2']
+    assert lot.spot_count == 100 and lot.special_mask == 1 << 99
+
+
+def test_special_mask_above_the_spots_is_rejected(tmp_path):
+    path = _write(tmp_path, {'p2': {'bucket': 'p2_parking', 'spot_count': 4, 'special_mask': '0b10000'}})
+    with pytest.raises(ValueError, match='bits above'):
+        load_lots(path)
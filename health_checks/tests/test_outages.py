@@ -0,0 +1,56 @@
+import numpy as np
+
+from outages import find_outages, scan_new_outages
+
+MINUTE = 60 * 10**9
+
+
+def _feed(devices=5, minutes=1440):
+    rng = np.random.default_rng(0)
+    times, ids = [], []
+    for d in range(devices):
+        device_times = np.arange(minutes) * MINUTE + rng.integers(0, 5 * 10**9)
+        # A few outages of 6 to 60 minutes per device
+        for start in rng.integers(0, len(device_times) - 60, size=3):
+            device_times[start:start + rng.integers(6, 60)] = -1
+        device_times = device_times[device_times >= 0]
+        times.append(device_times)
+        ids += [f'tvbox-btv-{d:02d}'] * len(device_times)
+    times, ids = np.concatenate(times), np.array(ids)
+    order = rng.permutation(len(times))
+    return times[order], ids[order]
+
+
+def test_matches_a_walk_over_each_device():
+    times, ids = _feed()
+    expected = []
+    for device in sorted(set(ids)):
+        device_times = np.sort(times[ids == device])
+        for prev, cur in zip(device_times[:-1], device_times[1:]):
+            if cur - prev <= 5 * MINUTE:
+                continue
+            if expected and expected[-1][0] == device and expected[-1][2] == prev:
+                # Gap right after a gap, same outage
+                expected[-1] = (device, expected[-1][1], cur)
+            else:
+                expected.append((device, prev, cur))
+    outages = find_outages(times, ids)
+    assert outages
+    assert sorted((o.device, o.start, o.end) for o in outages) == sorted(expected)
+
+
+def test_stray_readings_do_not_split_an_outage():
+    times = np.array([0, 10, 20, 30, 31]) * MINUTE
+    (outage,) = find_outages(times, ['a'] * 5)
+    assert (outage.start, outage.end, outage.gaps) == (0, 30 * MINUTE, 3)
+
+
+def test_scan_reports_each_outage_once_across_runs(tmp_path):
+    path = str(tmp_path / 'outage_state.json')
+    first = np.array([0, 1, 2]) * MINUTE
+    assert scan_new_outages(first, ['a'] * 3, path=path) == []
+    # The gap from the last reading of the previous run is found
+    second = np.array([2, 20, 21]) * MINUTE
+    (outage,) = scan_new_outages(second, ['a'] * 3, path=path)
+    assert (outage.start, outage.end) == (2 * MINUTE, 20 * MINUTE)
+    assert scan_new_outages(second, ['a'] * 3, path=path) == []
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from preprocess import classify, preprocess_subset
+
+DEVICE_IDS = ['tvbox-btv-01', 'tvbox-btv-02_n', 'tvbox-tx2-07', 'tvbox-e10-01']
+EXCLUDE_IDS = ['tvbox-tx2-07', 'tvbox-e10-01']
+
+
+def _frame(rows=2000):
+    return pd.DataFrame({
+        '_time': pd.date_range('2025-03-01 23:00', periods=rows, freq='15s', tz='UTC'),
+        '_value': np.arange(rows),
+        'pi-id': np.resize(DEVICE_IDS, rows),
+    })
+
+
+def _per_row(df):
+    # What the bots did before the categoricals
+    df = df[~df['pi-id'].isin(EXCLUDE_IDS)].copy()
+    df['device_type'] = df['pi-id'].apply(lambda x: 'E10' if 'btv' in x else 'other')
+    df['model'] = df['pi-id'].apply(lambda x: 'YOLOv8n' if x.endswith('_n') else 'YOLOv10n')
+    df['date'] = df['_time'].dt.date
+    return df
+
+
+def test_matches_the_per_row_classification():
+    result = preprocess_subset(_frame(), exclude_ids=EXCLUDE_IDS, device='e10')
+    expected = _per_row(_frame())
+    assert len(result) == len(expected)
+    for column in ['pi-id', 'device_type', 'model', 'date']:
+        assert isinstance(result[column].dtype, pd.CategoricalDtype), column
+        assert (result[column].astype(object).to_numpy() == expected[column].to_numpy()).all(), column
+
+
+def test_integer_times_are_converted():
+    frame = _frame()
+    frame['_time'] = frame['_time'].astype('int64')
+    result = preprocess_subset(frame, device='tx2')
+    assert isinstance(result['_time'].dtype, pd.DatetimeTZDtype)
+    assert set(result.loc[result['pi-id'] == 'tvbox-tx2-07', 'device_type']) == {'TX2'}
+
+
+def test_classify_calls_label_once_per_device():
+    ids = pd.Series(pd.Categorical(np.resize(DEVICE_IDS, 1000)))
+    calls = []
+
+    def label(device):
+        calls.append(device)
+        return device[:5]
+
+    assert (classify(ids, label) == 'tvbox').all()
+    assert sorted(calls) == sorted(DEVICE_IDS)
@@ -0,0 +1,86 @@
+import threading
+import time
+from datetime import timedelta
+
+import pandas as pd
+
+from query_cache import QueryCache
+
+
+def _fetcher(calls):
+    def fetch(days):
+        calls.append(days)
+        now = pd.Timestamp.now(tz='UTC')
+        times = pd.date_range(now - pd.Timedelta(days=days), now, periods=days + 1)
+        return pd.DataFrame({'_time': times, '_value': range(days + 1), 'pi-id': 'tvbox-btv-01'})
+    return fetch
+
+
+def test_windows_are_not_shared_across_org_or_cache_dir():
+    cache = QueryCache()
+    calls = []
+    fetch = _fetcher(calls)
+    cache.window('bucket', 30, fetch, org='Unicamp', cache_dir='/cache/ic2')
+    cache.window('bucket', 30, fetch, org='Other', cache_dir='/cache/ic2')
+    cache.window('bucket', 30, fetch, org='Unicamp', cache_dir='/cache/ic3')
+    cache.window('bucket', 30, fetch, org='Unicamp', cache_dir='/cache/ic2')
+    assert calls == [30, 30, 30]
+    assert cache.hits == 1 and cache.misses == 3
+
+
+def test_invalidate_drops_every_window_of_the_bucket():
+    cache = QueryCache()
+    calls = []
+    fetch = _fetcher(calls)
+    cache.window('bucket', 30, fetch, org='Unicamp', cache_dir='/cache/ic2')
+    cache.window('bucket', 30, fetch, org='Other', cache_dir='/cache/ic3')
+    cache.invalidate('bucket')
+    cache.window('bucket', 30, fetch, org='Unicamp', cache_dir='/cache/ic2')
+    assert len(calls) == 3
+
+
+def test_widest_window_is_fetched_and_sliced():
+    cache = QueryCache()
+    calls = []
+    fetch = _fetcher(calls)
+    # First night: the hourly job asks for 30 days, the daily job for 40
+    cache.window('bucket', 30, fetch)
+    cache.window('bucket', 40, fetch)
+    assert calls == [30, 40]
+    # Next night the widest window is fetched first and the hourly job is sliced from it
+    cache.invalidate('bucket')
+    hourly = cache.window('bucket', 30, fetch)
+    daily = cache.window('bucket', 40, fetch)
+    assert calls == [30, 40, 40]
+    since = pd.Timestamp.now(tz='UTC') - pd.Timedelta(minutes=1)
+    assert daily['_time'].min() >= since - pd.Timedelta(days=40) and len(daily) >= 40
+    assert hourly['_time'].min() >= since - pd.Timedelta(days=30) and len(hourly) < len(daily)
+
+
+def test_concurrent_requesters_share_one_fetch():
+    cache = QueryCache()
+    calls = []
+    fetch = _fetcher(calls)
+    started = threading.Event()
+
+    def slow_fetch(days):
+        started.set()
+        time.sleep(0.1)
+        return fetch(days)
+
+    threads = [threading.Thread(target=cache.window, args=('bucket', 30, slow_fetch)) for _ in range(4)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [30] and cache.shared == 3
+
+
+def test_expired_windows_are_fetched_again():
+    cache = QueryCache(ttl=timedelta(0))
+    calls = []
+    cache.window('bucket', 30, _fetcher(calls))
+    cache.window('bucket', 30, _fetcher(calls))
+    assert calls == [30, 30]
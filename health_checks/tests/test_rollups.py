@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+from rollups import DAY_NS, MINUTE_NS, daily_frame, hourly_rollup, reading_durations, update_rollups
+from spots import decode_spots, pack_occupancy, spot_columns
+
+BIT_LENGTH = 16
+
+
+def _minute_feed(days):
+    values = np.random.default_rng(0).integers(0, 2**BIT_LENGTH, size=days * 24 * 60, dtype=np.int64)
+    times = pd.date_range("2025-03-01", periods=len(values), freq="min")
+    return times, values
+
+
+def _per_row_daily(times, values):
+    df = pd.DataFrame(decode_spots(values, BIT_LENGTH), columns=spot_columns(BIT_LENGTH))
+    return df.groupby(times.date).sum()
+
+
+def test_rollups_match_the_per_row_totals(tmp_path):
+    times, values = _minute_feed(5)
+    now = times[-1] + pd.Timedelta(minutes=1)
+    occupancy = pack_occupancy(times.values, values, BIT_LENGTH)
+    path = str(tmp_path / 'rollups.npz')
+    expected = _per_row_daily(times, values).to_numpy()
+
+    # First run rolls up the closed days, the second reads them from the store
+    for _ in range(2):
+        daily = daily_frame(update_rollups(occupancy, now, path=path), spot_columns(BIT_LENGTH))
+        assert np.allclose(daily.to_numpy(), expected)
+
+
+def test_refresh_days_are_rolled_up_again(tmp_path):
+    times, values = _minute_feed(3)
+    now = times[-1] + pd.Timedelta(minutes=1)
+    path = str(tmp_path / 'rollups.npz')
+    update_rollups(pack_occupancy(times.values, values, BIT_LENGTH), now, path=path)
+
+    # Every spot of the middle day turns out to be occupied
+    day = times[0].date() + pd.Timedelta(days=1)
+    values[times.date == day] = 2**BIT_LENGTH - 1
+    occupancy = pack_occupancy(times.values, values, BIT_LENGTH)
+    stale = daily_frame(update_rollups(occupancy, now, path=path), spot_columns(BIT_LENGTH))
+    fresh = daily_frame(update_rollups(occupancy, now, path=path, refresh_days=[day]), spot_columns(BIT_LENGTH))
+    assert not (stale.loc[day] == 1440).all()
+    assert (fresh.loc[day] == 1440).all()
+
+
+def test_readings_hold_at_most_max_gap():
+    minute = 60 * 10**9
+    times = np.array([0, minute, 30 * minute], dtype=np.int64)
+    durations = reading_durations(times, 31 * minute, max_gap=pd.Timedelta(minutes=10))
+    assert (durations // minute).tolist() == [1, 10, 1]
+
+
+def test_change_only_feed_gives_the_same_totals():
+    rows, keepalive_minutes = 3 * 24 * 60, 30
+    rng = np.random.default_rng(0)
+    # Cars stay for hours: each spot flips with a 0.3% chance per minute
+    states = np.cumsum(rng.random((rows, BIT_LENGTH)) < 0.003, axis=0) % 2
+    values = (states * (1 << np.arange(BIT_LENGTH - 1, -1, -1))).sum(axis=1)
+    times = np.arange(rows, dtype=np.int64) * MINUTE_NS
+    end = times[-1] + MINUTE_NS
+    # A row when the mask changes, plus a keepalive
+    kept = np.r_[True, values[1:] != values[:-1]] | (np.arange(rows) % keepalive_minutes == 0)
+
+    def totals(rows_kept):
+        occupancy = pack_occupancy(times[rows_kept], values[rows_kept], BIT_LENGTH)
+        durations = reading_durations(occupancy.times, end, max_gap=pd.Timedelta(minutes=keepalive_minutes))
+        return hourly_rollup(occupancy, durations).minutes.sum(axis=0)
+
+    every_minute = totals(np.ones(rows, dtype=bool))
+    assert kept.sum() < rows / 2
+    assert np.allclose(every_minute, decode_spots(values, BIT_LENGTH).sum(axis=0))
+    assert np.allclose(totals(kept), every_minute)
+
+
+def test_readings_are_cut_at_hour_and_midnight():
+    # One reading at 23:30 holding for two hours is cut at midnight
+    occupancy = pack_occupancy(np.array([DAY_NS - 30 * MINUTE_NS]), np.array([1]), 1)
+    rollups = hourly_rollup(occupancy, np.array([120 * MINUTE_NS]))
+    assert rollups.minutes.tolist() == [[30.0]]
+
+
+def test_lot_of_more_than_64_spots(tmp_path):
+    spots = 100
+    times = pd.date_range("2025-03-01", periods=3 * 24 * 60, freq="min")
+    rng = np.random.default_rng(0)
+    values = [int.from_bytes(rng.bytes(13), 'little') >> 4 for _ in range(len(times))]
+    occupancy = pack_occupancy(times.values, values, spots)
+    now = times[-1] + pd.Timedelta(minutes=1)
+    expected = pd.DataFrame(decode_spots(values, spots)).groupby(times.date).sum().to_numpy()
+    daily = daily_frame(update_rollups(occupancy, now, path=str(tmp_path / 'rollups.npz')), spot_columns(spots))
+    assert daily.shape == (3, spots)
+    assert np.allclose(daily.to_numpy(), expected)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from rollups import DAY_NS, MINUTE_NS, reading_durations
+from sensor_health import sensor_alerts, sensor_health
+from spots import pack_occupancy, spot_columns
+
+BIT_LENGTH = 16
+
+
+def _feed(days=5):
+    times = pd.date_range('2025-03-01', periods=days * 24 * 60, freq='min')
+    rng = np.random.default_rng(0)
+    # Cars park for about an hour: a spot changes state with 1/60 chance a minute
+    bits = np.cumsum(rng.random((len(times), BIT_LENGTH)) < 1 / 60, axis=0) % 2 == 1
+    last_day = times.date == times[-1].date()
+    # On the last day spot_5 is stuck occupied from 02:00 and spot_9 flaps
+    bits[last_day & (times.hour >= 2), 4] = True
+    bits[last_day, 8] = rng.random(last_day.sum()) < 0.5
+    values = (bits * (1 << np.arange(BIT_LENGTH - 1, -1, -1))).sum(axis=1)
+    occupancy = pack_occupancy(times.values, values, BIT_LENGTH)
+    durations = reading_durations(occupancy.times, occupancy.times[-1] + MINUTE_NS)
+    return times, bits, occupancy, durations
+
+
+def test_runs_and_flips_match_a_loop_over_the_readings():
+    days = 5
+    _, bits, occupancy, durations = _feed(days)
+    health = sensor_health(occupancy, durations)
+    day_codes = occupancy.times // DAY_NS - occupancy.times[0] // DAY_NS
+    for day in range(days):
+        rows_of_day = np.flatnonzero(day_codes == day)
+        for spot in range(BIT_LENGTH):
+            longest = run = flips = 0
+            for k, row in enumerate(rows_of_day):
+                if k and bits[row, spot] != bits[row - 1, spot]:
+                    flips += 1
+                    run = 0
+                run += durations[row] / MINUTE_NS if bits[row, spot] else 0
+                longest = max(longest, run)
+            assert flips == health.flips[day, spot]
+            assert np.isclose(longest, health.longest_occupied[day, spot])
+
+
+def test_only_the_stuck_and_flapping_spots_are_reported():
+    times, _, occupancy, durations = _feed()
+    alerts = sensor_alerts(sensor_health(occupancy, durations), times[-1].date(), spot_columns(BIT_LENGTH))
+    assert len(alerts) == 2
+    assert alerts[0].startswith('spot_5:') and 'stuck' in alerts[0]
+    assert alerts[1].startswith('spot_9:') and 'flapping' in alerts[1]
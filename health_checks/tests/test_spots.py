@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from spots import car_counts, decode_spots, expand_to_spots, mask_ints, mask_words, pack_occupancy, spot_sums
+
+
+def test_decode_spots_matches_expand_to_spots():
+    values = np.random.default_rng(0).integers(0, 2**16, size=500, dtype=np.int64)
+    expected = np.array([expand_to_spots(v, 16) for v in values])
+    decoded = decode_spots(values, 16)
+    assert decoded.dtype == np.uint8
+    assert np.array_equal(decoded, expected)
+
+
+def test_decode_spots_msb_is_spot_1():
+    assert decode_spots(np.array([0b1000, 0b0001]), 4).tolist() == [[1, 0, 0, 0], [0, 0, 0, 1]]
+
+
+def test_decode_spots_drops_bits_above_bit_length():
+    assert decode_spots(np.array([0b10101]), 4).tolist() == [[0, 1, 0, 1]]
+
+
+def _wide(values, bit_length, starts):
+    spots = decode_spots(values, bit_length).astype(np.int64)
+    return np.add.reduceat(spots, starts, axis=0), spots.sum(axis=1)
+
+
+def test_packed_sums_and_car_counts_match_the_spot_matrix():
+    values = np.random.default_rng(0).integers(0, 2**16, size=600, dtype=np.int64)
+    occupancy = pack_occupancy(np.arange(600) * 60 * 10**9, values, 16)
+    starts = np.arange(0, 600, 60)
+    hourly, cars = _wide(values, 16, starts)
+    assert occupancy.masks.dtype == np.uint16
+    assert np.array_equal(spot_sums(occupancy, starts), hourly)
+    assert np.array_equal(car_counts(occupancy), cars)
+
+
+def test_special_spots_are_not_counted():
+    occupancy = pack_occupancy(np.arange(2), np.array([0b1111, 0b1001]), 4)
+    assert car_counts(occupancy, special_mask=0b1000).tolist() == [3, 1]
+
+
+def test_weighted_sums():
+    occupancy = pack_occupancy(np.arange(3), np.array([0b10, 0b11, 0b01]), 2)
+    sums = spot_sums(occupancy, weights=np.array([1.0, 2.0, 4.0]))
+    assert sums.tolist() == [[3.0, 6.0]]
+
+
+@pytest.mark.parametrize('bit_length', [16, 32, 64])
+def test_every_spot_count_up_to_64(bit_length):
+    # The full int64 range: the top bit is spot_1 of a 64-spot lot
+    values = np.random.default_rng(bit_length).integers(-2**63, 2**63, size=300, dtype=np.int64)
+    occupancy = pack_occupancy(np.arange(300), values, bit_length)
+    starts = np.arange(0, 300, 60)
+    hourly, cars = _wide(values, bit_length, starts)
+    assert np.array_equal(spot_sums(occupancy, starts), hourly)
+    assert np.array_equal(car_counts(occupancy), cars)
+    assert np.array_equal(spot_sums(occupancy, starts).sum(axis=1), np.add.reduceat(cars, starts))
+
+
+def _wide_values(bit_length, count=300):
+    rng = np.random.default_rng(bit_length)
+    return [int(rng.integers(0, 2**63)) << (bit_length - 63) | int(rng.integers(0, 2**63)) for _ in range(count)]
+
+
+@pytest.mark.parametrize('bit_length', [65, 100, 128])
+def test_more_than_64_spots(bit_length):
+    values = _wide_values(bit_length)
+    expected = np.array([expand_to_spots(v, bit_length) for v in values])
+    occupancy = pack_occupancy(np.arange(300), values, bit_length)
+    assert occupancy.masks.shape == (300, 2)
+    assert np.array_equal(decode_spots(values, bit_length), expected)
+    starts = np.arange(0, 300, 60)
+    assert np.array_equal(spot_sums(occupancy, starts), np.add.reduceat(expected, starts, axis=0))
+    assert np.array_equal(car_counts(occupancy), expected.sum(axis=1))
+    # spot_1 is the most significant bit, in the second word
+    assert np.array_equal(car_counts(occupancy, special_mask=1 << (bit_length - 1)), expected[:, 1:].sum(axis=1))
+    # Decimal strings, as lots of more than 64 spots write `_value`
+    assert np.array_equal(pack_occupancy(np.arange(300), [str(v) for v in values], bit_length).masks,
+                          occupancy.masks)
+
+
+def test_mask_words_round_trip():
+    values = [0, 1, 2**64, 2**100 + 5, 2**128 - 1]
+    words = mask_words(values, 2)
+    assert words.dtype == np.uint64 and words[2].tolist() == [0, 1]
+    assert mask_ints(words).tolist() == values
+    assert mask_ints(mask_words([], 2)).tolist() == []
@@ -0,0 +1,123 @@
+import json
+
+from telegram_notifier import TelegramNotifier
+
+
+class Response:
+    def __init__(self, status_code=200, payload=None):
+        self.status_code = status_code
+        self.payload = payload if payload is not None else {'ok': status_code == 200}
+        self.text = json.dumps(self.payload)
+
+    def json(self):
+        return self.payload
+
+
+class Session:
+    """Stands in for the requests session, answering like api.telegram.org"""
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.posts = []
+
+    def post(self, url, data=None, files=None, timeout=None):
+        method = url.rsplit('/', 1)[1]
+        self.posts.append((method, data, files))
+        status = self.statuses.pop(0) if self.statuses else 200
+        payload = {'ok': status == 200}
+        if status == 200 and method == 'sendPhoto':
+            payload['result'] = {'photo': [{'file_id': f'FILE{len(self.posts)}'}]}
+        if status == 200 and method == 'sendMediaGroup':
+            album = json.loads(data['media'])
+            payload['result'] = [{'photo': [{'file_id': f'FILE{len(self.posts)}_{i}'}]} for i in range(len(album))]
+        if status == 429:
+            payload['parameters'] = {'retry_after': 0}
+        return Response(status, payload)
+
+
+def notifier(session, tmp_path, coalesce_window=0):
+    return TelegramNotifier('TOKEN', session=session, min_interval=0, coalesce_window=coalesce_window,
+                            file_id_path=str(tmp_path / 'file_ids.json'))
+
+
+def photos(tmp_path, count):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f'lot{i}.png'
+        path.write_bytes(f'image {i}'.encode())
+        paths.append(str(path))
+    return paths
+
+
+def test_albums_of_at_most_ten_balanced(tmp_path):
+    session = Session()
+    sender = notifier(session, tmp_path)
+    sender.send_media_group('chat', photos(tmp_path, 11), captions=[f'lot {i}' for i in range(11)])
+    assert sender.flush(timeout=10)
+    assert [method for method, _, _ in session.posts] == ['sendMediaGroup', 'sendMediaGroup']
+    assert [len(json.loads(data['media'])) for _, data, _ in session.posts] == [6, 5]
+    assert len(sender.photos) == 11 and not any(photo.reused for photo in sender.photos)
+
+
+def test_album_resent_by_file_id(tmp_path):
+    session = Session()
+    sender = notifier(session, tmp_path)
+    paths = photos(tmp_path, 3)
+    sender.send_media_group('chat', paths)
+    sender.send_media_group('other chat', paths)
+    assert sender.flush(timeout=10)
+    (_, _, uploaded), (_, data, files) = session.posts
+    assert len(uploaded) == 3 and files is None
+    assert [entry['media'] for entry in json.loads(data['media'])] == ['FILE1_0', 'FILE1_1', 'FILE1_2']
+
+
+def test_single_photo_goes_as_send_photo(tmp_path):
+    session = Session()
+    sender = notifier(session, tmp_path)
+    sender.send_media_group('chat', photos(tmp_path, 1))
+    assert sender.flush(timeout=10)
+    assert [method for method, _, _ in session.posts] == ['sendPhoto']
+
+
+def test_burst_is_merged_and_retried(tmp_path):
+    # 502 waits a second before the retry, 429 waits retry_after (0 here)
+    session = Session(statuses=[502, 429])
+    sender = notifier(session, tmp_path, coalesce_window=0.2)
+    for i in range(10):
+        sender.send_message('chat', f'alert {i}')
+    assert sender.flush(timeout=10)
+    assert [method for method, _, _ in session.posts] == ['sendMessage'] * 3
+    assert session.posts[-1][1]['text'] == '\n\n'.join(f'alert {i}' for i in range(10))
+
+
+def test_client_error_is_not_retried(tmp_path):
+    session = Session(statuses=[400])
+    sender = notifier(session, tmp_path)
+    sender.send_message('chat', 'alert')
+    assert sender.flush(timeout=10)
+    assert len(session.posts) == 1
+
+
+def test_unchanged_photo_resent_by_file_id(tmp_path):
+    session = Session()
+    sender = notifier(session, tmp_path)
+    path, = photos(tmp_path, 1)
+    sender.send_photo('chat', path)
+    sender.send_photo('chat', path)
+    assert sender.flush(timeout=10)
+    (_, _, uploaded), (_, data, files) = session.posts
+    assert 'photo' in uploaded and files is None and data['photo'] == 'FILE1'
+    first, second = sender.photos
+    assert not first.reused and first.uploaded_bytes == len('image 0')
+    assert second.reused and second.uploaded_bytes == 0
+
+
+def test_expired_file_id_is_uploaded_again(tmp_path):
+    session = Session(statuses=[200, 400])
+    sender = notifier(session, tmp_path)
+    path, = photos(tmp_path, 1)
+    sender.send_photo('chat', path)
+    sender.send_photo('chat', path)
+    assert sender.flush(timeout=10)
+    assert [files is not None for _, _, files in session.posts] == [True, False, True]
+    assert [photo.reused for photo in sender.photos] == [False, False]
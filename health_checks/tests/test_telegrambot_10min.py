@@ -0,0 +1,106 @@
+import re
+from functools import partial
+
+import pandas as pd
+
+import fleet
+import outages
+import telegrambot_10min
+from lots import DEFAULT_LOT, DEFAULT_LOTS
+
+LOT = DEFAULT_LOTS[DEFAULT_LOT]
+
+
+class Response:
+    def __init__(self, lines):
+        self.lines = lines
+
+    def __iter__(self):
+        return (line.encode() for line in self.lines)
+
+    def close(self):
+        pass
+
+
+class QueryApi:
+    """Stands in for InfluxDB: the range() of a query over `rows`, or the newest row of each pi-id"""
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)  # (time, value, pi-id)
+        self.queries = []
+
+    def query_raw(self, query, org=None):
+        self.queries.append(query)
+        start = re.search(r'range\(start: ([^,)]+)', query).group(1)
+        if start.startswith('-'):
+            start = pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=int(start[1:-1]))
+        rows = [row for row in self.rows if row[0] >= pd.Timestamp(start)]
+        if 'max(column: "_time")' in query:
+            rows = list({device: (t, value, device) for t, value, device in sorted(rows)}.values())
+        lines = ['#datatype,string,long,dateTime:RFC3339,long,string\n',
+                 '#group,false,false,false,false,true\n',
+                 '#default,_result,,,,\n',
+                 ',result,table,_time,_value,pi-id\n']
+        lines += [f',,0,{t.strftime("%Y-%m-%dT%H:%M:%S.%fZ")},{value},{device}\n' for t, value, device in rows]
+        return Response(lines + ['\n'])
+
+
+class Client:
+    def __init__(self, query_api):
+        self._query_api = query_api
+
+    def query_api(self):
+        return self._query_api
+
+
+class Notifier:
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, chat, message):
+        self.messages.append(message)
+
+
+def _run(monkeypatch, tmp_path, rows):
+    """Run the bot once over `rows` with its state in tmp_path; returns (queries, messages)"""
+    query_api, sent = QueryApi(rows), Notifier()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(telegrambot_10min, 'influx_client', lambda: Client(query_api))
+    monkeypatch.setattr(telegrambot_10min, 'notifier', lambda: sent)
+    monkeypatch.setattr(telegrambot_10min, 'update_fleet',
+                        partial(fleet.update_fleet, path=str(tmp_path / 'fleet.json')))
+    monkeypatch.setattr(telegrambot_10min, 'alert_decision',
+                        partial(fleet.alert_decision, path=str(tmp_path / 'alerts.json')))
+    outage_state = str(tmp_path / 'outages.json')
+    monkeypatch.setattr(telegrambot_10min, 'outage_watermark', partial(outages.outage_watermark, path=outage_state))
+    monkeypatch.setattr(telegrambot_10min, 'scan_new_outages', partial(outages.scan_new_outages, path=outage_state))
+    telegrambot_10min.main(LOT)
+    return query_api.queries, sent.messages
+
+
+def _minutes(end, count, device):
+    return [(end - pd.Timedelta(minutes=i), 1, device) for i in range(count)][::-1]
+
+
+def test_no_rows_sends_the_no_data_alert(monkeypatch, tmp_path):
+    _, messages = _run(monkeypatch, tmp_path, [])
+    assert messages == ["No device is sending data. No data was received in the last day."]
+
+
+def test_one_row(monkeypatch, tmp_path):
+    now = pd.Timestamp.now(tz='UTC')
+    _, messages = _run(monkeypatch, tmp_path, [(now - pd.Timedelta(minutes=2), 5, 'tvbox-btv-01')])
+    assert messages == []
+    assert (tmp_path / 'last_timestamp.txt').exists()
+
+
+def test_silent_device_is_found_from_one_row_per_device(monkeypatch, tmp_path):
+    now = pd.Timestamp.now(tz='UTC').floor('s')
+    rows = _minutes(now, 60, 'tvbox-btv-01') + _minutes(now - pd.Timedelta(minutes=30), 30, 'tvbox-btv-02')
+    queries, messages = _run(monkeypatch, tmp_path, rows)
+    assert 'group(columns: ["pi-id"])' in queries[1]
+    assert len(messages) == 1 and 'tvbox-btv-02' in messages[0] and 'tvbox-btv-01' not in messages[0]
+
+    # The next run only asks for the rows past the previous outage scan
+    queries, _ = _run(monkeypatch, tmp_path, rows)
+    assert pd.Timestamp(re.search(r'range\(start: ([^,)]+)', queries[0]).group(1)) == now
@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+import rollups
+import run_state
+import telegrambot_1hour
+from lots import DEFAULT_LOT, DEFAULT_LOTS
+from run_state import RunState, load_run_state, save_run_state
+
+LOT = DEFAULT_LOTS[DEFAULT_LOT]
+JOB = telegrambot_1hour.run_state_job(LOT)
+
+
+class Calls:
+    """Stands in for the cache, InfluxDB and Telegram, recording what analyze_lot asks of them"""
+
+    def __init__(self, high_water_mark, rows):
+        self.high_water_mark = high_water_mark
+        self.rows = rows
+        self.refreshes, self.windows, self.rollups, self.messages = [], [], [], []
+
+    def refresh_cache(self, query_api, bucket, days, **kwargs):
+        self.refreshes.append(kwargs)
+        return self.high_water_mark
+
+    def cached_window(self, query_api, bucket, days, **kwargs):
+        self.windows.append(kwargs)
+        return self.rows.copy()
+
+    def invalidate(self, bucket):
+        pass
+
+    def send_message(self, chat, message):
+        self.messages.append(message)
+
+
+def _analyze(monkeypatch, tmp_path, last_run, fingerprint='day'):
+    """analyze_lot with its run state in tmp_path and `last_run` saved before; returns the calls made"""
+    high_water_mark = pd.Timestamp.now(tz='UTC').floor('min')
+    target = (high_water_mark - pd.Timedelta(hours=3)).date() - timedelta(days=1)
+    # Minute rows of days before the target only, so it has no rollup
+    first = pd.Timestamp(target, tz='UTC') - pd.Timedelta(days=4)
+    times = pd.date_range(first, first + pd.Timedelta(days=2), freq='min', inclusive='left')
+    rows = pd.DataFrame({'_time': times, '_value': 0b1011, 'pi-id': pd.Categorical(['tvbox-btv-01'] * len(times))})
+    calls = Calls(high_water_mark, rows)
+
+    monkeypatch.setattr(run_state, 'RUN_STATE_DIR', str(tmp_path))
+    monkeypatch.setattr(telegrambot_1hour, 'refresh_cache', calls.refresh_cache)
+    monkeypatch.setattr(telegrambot_1hour, 'cached_window', calls.cached_window)
+    monkeypatch.setattr(telegrambot_1hour, 'query_cache', lambda: calls)
+    monkeypatch.setattr(telegrambot_1hour, 'notifier', lambda: calls)
+    monkeypatch.setattr(telegrambot_1hour, 'day_fingerprint', lambda *args, **kwargs: fingerprint)
+
+    def update_rollups(*args, **kwargs):
+        calls.rollups.append(kwargs)
+        return rollups.update_rollups(*args, **dict(kwargs, path=str(tmp_path / 'rollups.npz')))
+
+    monkeypatch.setattr(telegrambot_1hour, 'update_rollups', update_rollups)
+    if last_run is not None:
+        save_run_state(JOB, last_run(target, high_water_mark))
+    telegrambot_1hour.analyze_lot(None, LOT)
+    return calls, target
+
+
+def test_unchanged_day_is_not_analysed_again(monkeypatch, tmp_path):
+    calls, _ = _analyze(monkeypatch, tmp_path, lambda target, hwm: RunState(target.isoformat(), 'day', hwm.value))
+    assert len(calls.refreshes) == 1
+    assert calls.windows == [] and calls.rollups == [] and calls.messages == []
+
+
+def test_changed_day_is_fetched_and_rolled_up_again(monkeypatch, tmp_path):
+    calls, target = _analyze(monkeypatch, tmp_path,
+                             lambda target, hwm: RunState(target.isoformat(), 'before late rows', hwm.value))
+    target_start = pd.Timestamp(target, tz='UTC') + pd.Timedelta(hours=3)
+    assert [r.get('overlap') for r in calls.refreshes] == [None, calls.high_water_mark - target_start]
+    assert calls.windows[0]['refresh'] is False
+    assert calls.rollups[0]['refresh_days'] == (target,)
+    assert load_run_state(JOB).fingerprint == 'day'
+
+
+@pytest.mark.parametrize('last_run', [None, lambda target, hwm: RunState('2025-01-01', 'day', 0)])
+def test_run_is_remembered_when_the_target_has_no_rollup(monkeypatch, tmp_path, last_run):
+    calls, target = _analyze(monkeypatch, tmp_path, last_run)
+    assert calls.rollups[0]['refresh_days'] == ()
+    assert calls.messages == []
+    assert load_run_state(JOB) == RunState(target.isoformat(), 'day', calls.high_water_mark.value)
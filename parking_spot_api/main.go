@@ -5,6 +5,7 @@ import (
 	"fmt"
 	"io"
 	"log"
+	"math/big"
 	"math/bits"
 	"net/http"
 	"os"
@@ -17,12 +18,20 @@ import (
 	"github.com/joho/godotenv"
 )
 
+// Spots counted by /last_value: the lot's spots without the special ones
+var countedSpots *big.Int
+
 func main() {
 	err := godotenv.Load()
 	if err != nil {
 		log.Fatalf("Error loading .env file: %s", err)
 	}
 
+	countedSpots, err = loadCountedSpots()
+	if err != nil {
+		log.Fatalf("Error reading the lot configuration: %s", err)
+	}
+
 	r := chi.NewRouter()
 
 	r.Use(middleware.Recoverer)
@@ -43,6 +52,43 @@ func main() {
 	http.ListenAndServe(":8001", r)
 }
 
+func getenvDefault(key, fallback string) string {
+	if value := os.Getenv(key); value != "" {
+		return value
+	}
+	return fallback
+}
+
+// loadCountedSpots builds the mask of non-special spots from SPOT_COUNT and
+// SPECIAL_SPOTS_MASK (bit set = special spot, same bit order as _value).
+// big.Int keeps lots with more than 64 spots working.
+func loadCountedSpots() (*big.Int, error) {
+	spotCount, err := strconv.Atoi(getenvDefault("SPOT_COUNT", "15"))
+	if err != nil || spotCount < 1 {
+		return nil, fmt.Errorf("invalid SPOT_COUNT: %q", os.Getenv("SPOT_COUNT"))
+	}
+
+	// ignora as vagas 8, 9, e 10 (vagas especiais) por padrão
+	special, ok := new(big.Int).SetString(getenvDefault("SPECIAL_SPOTS_MASK", "0b000000001110000"), 0)
+	if !ok || special.Sign() < 0 {
+		return nil, fmt.Errorf("invalid SPECIAL_SPOTS_MASK: %q", os.Getenv("SPECIAL_SPOTS_MASK"))
+	}
+
+	all := new(big.Int).Sub(new(big.Int).Lsh(big.NewInt(1), uint(spotCount)), big.NewInt(1))
+	if new(big.Int).AndNot(special, all).Sign() != 0 {
+		return nil, fmt.Errorf("SPECIAL_SPOTS_MASK has bits above the %d spots", spotCount)
+	}
+	return new(big.Int).AndNot(all, special), nil
+}
+
+func onesCount(x *big.Int) int {
+	count := 0
+	for _, word := range x.Bits() {
+		count += bits.OnesCount(uint(word))
+	}
+	return count
+}
+
 func checkHeartbeat(h *http.Header) error {
 	device := h.Get("Device-Name")
 	freeHeapRaw := h.Get("Device-FreeHeap")
@@ -151,19 +197,22 @@ func lastValue(w http.ResponseWriter, r *http.Request) {
 	csv := strings.Split(res, ",")
 	val := strings.TrimSpace(csv[len(csv)-1])
 
-	encoded, err := strconv.Atoi(val)
+	encoded, ok := new(big.Int).SetString(val, 10)
 
-	if err != nil {
-		fmt.Println(err)
+	if !ok {
+		fmt.Println("invalid value:", val)
 		http.Error(w, "Error parsing database response", http.StatusInternalServerError)
 		return
 	}
+	if encoded.Sign() < 0 {
+		// interpreta como inteiro sem sinal de 64 bits
+		encoded.Add(encoded, new(big.Int).Lsh(big.NewInt(1), 64))
+	}
 
-	decimal := uint(encoded)        // interpreta como inteiro sem sinal
-	mask := uint(0b111111110001111) // ignora as vagas 8, 9, e 10 (vagas especiais)
-	vagasTotais := 15 - 3           // 15 disponíveis, 3 especiais
+	ocupadas := onesCount(new(big.Int).And(encoded, countedSpots)) // ignora as vagas especiais
+	vagasTotais := onesCount(countedSpots)                         // vagas disponíveis, sem as especiais
 
-	w.Write([]byte(strconv.Itoa(vagasTotais - bits.OnesCount(decimal&mask))))
+	w.Write([]byte(strconv.Itoa(vagasTotais - ocupadas)))
 }
 
 func lastTimestamp(w http.ResponseWriter, r *http.Request) {